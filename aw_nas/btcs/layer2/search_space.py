@@ -229,12 +229,36 @@ class Layer2SearchSpace(SearchSpace):
         )
 
 
-def DFS(v, adj, visited):
-    visited[v] = 1
-    for new_v in np.argwhere(adj[:, v].reshape(-1)):
-        if not visited[new_v]:
-            DFS(new_v, adj, visited)
-    return visited
+def reachable_from_source(adjs):
+    """
+    Check which nodes are reachable from node 0, by computing the transitive closure
+    with repeated boolean matrix squaring.
+
+    Args:
+      adjs: array of shape (..., num_nodes, num_nodes), `adjs[..., to, from]` non-zero
+            means there is an edge `from` -> `to`
+
+    Returns:
+      bool array of shape (..., num_nodes)
+    """
+    if isinstance(adjs, torch.Tensor):
+        adjs = adjs.detach().cpu().numpy()
+    adjs = np.asarray(adjs) != 0
+    num_nodes = adjs.shape[-1]
+    closure = (adjs | np.eye(num_nodes, dtype=bool)).astype(np.float32)
+    # (I + A)^(2^k) covers all paths with length <= 2^k
+    for _ in range(int(np.ceil(np.log2(max(num_nodes, 2))))):
+        closure = (np.matmul(closure, closure) > 0).astype(np.float32)
+    return closure[..., :, 0] > 0
+
+
+def _ck_connect_stages(stage_conns, verbose=False):
+    reachables = [reachable_from_source(stage_conn) for stage_conn in stage_conns]
+    connected = np.array([reachable[-1] for reachable in reachables])
+    if not verbose:
+        return connected.all()
+    all_connected = np.array([reachable.all() for reachable in reachables])
+    return connected, all_connected
 
 
 class StagewiseMacroRollout(BaseRollout):
@@ -276,16 +300,7 @@ class StagewiseMacroRollout(BaseRollout):
         return all((self.arch[i] == other.arch[i]).all() for i in range(len(self.arch)))
 
     def ck_connect(self, verbose=False):
-        all_connected = np.array(
-            [(DFS(0, arch, np.zeros(arch.shape[0]))).all() for arch in self.arch]
-        )
-        connected = np.array(
-            [(DFS(0, arch, np.zeros(arch.shape[0])))[-1] for arch in self.arch]
-        )
-        if not verbose:
-            return connected.all()
-        else:
-            return connected, all_connected
+        return _ck_connect_stages(self.arch, verbose=verbose)
 
 
 class StagewiseMacroDiffRollout(BaseRollout):
@@ -368,16 +383,7 @@ class StagewiseMacroDiffRollout(BaseRollout):
         return all((self.arch[i] == other.arch[i]).all() for i in range(len(self.arch)))
 
     def ck_connect(self, verbose=False):
-        all_connected = np.array(
-            [(DFS(0, arch, np.zeros(arch.shape[0]))).all() for arch in self.arch]
-        )
-        connected = np.array(
-            [(DFS(0, arch, np.zeros(arch.shape[0])))[-1] for arch in self.arch]
-        )
-        if not verbose:
-            return connected.all()
-        else:
-            return connected, all_connected
+        return _ck_connect_stages(self.arch, verbose=verbose)
 
 
 # Same as stagewise-macro-diff-rollout instead of NAME
@@ -462,6 +468,22 @@ class StagewiseMacroSearchSpace(SearchSpace):
         ]
         self.num_possible_edges = [len(idx[0]) for idx in self.idxes]
 
+        # precompute the node offsets of the stages and the sequential connections
+        # between stages in the overall adjacency matrix (see `parse_overall_adj`)
+        # NOTE: all stages_end/stages_begin indexes should add 1 because we add a stem layer
+        self._stage_offsets = [begin + 1 for begin in self.stages_begin]
+        seq_edges = []
+        last_node_idx = 0
+        for i_stage in range(self.stage_num):
+            while last_node_idx < self.stages_begin[i_stage] + 1:
+                seq_edges.append((last_node_idx + 1, last_node_idx))
+                last_node_idx += 1
+            last_node_idx = self.stages_end[i_stage] + 1
+        while last_node_idx < self.num_layers:
+            seq_edges.append((last_node_idx + 1, last_node_idx))
+            last_node_idx += 1
+        self._seq_edge_idxes = tuple(np.array(seq_edges, dtype=np.int64).reshape(-1, 2).T)
+
         # genotype
         self.stage_names = ["stage_{}".format(i) for i in range(self.stage_num)]
         self.genotype_type_name = "StagewiseMacroGenotype"
@@ -542,37 +564,60 @@ class StagewiseMacroSearchSpace(SearchSpace):
         #     self.cell_group_names + [n + "_concat" for n in self.cell_group_names],
         #     self._default_concats)
 
+    def _stage_conns(self, geno_or_rollout):
+        if isinstance(geno_or_rollout, tuple):
+            return self.rollout_from_genotype(geno_or_rollout).arch
+        if isinstance(geno_or_rollout, StagewiseMacroRollout):
+            return geno_or_rollout.arch
+        raise TypeError("We don't do that here")
+
     def parse_overall_adj(self, geno_or_rollout):
         """
         node 0: stem output
         node k: cell k - 1. k = 1, ..., num_layer
         node num_layers + 1: avgpooling input
         """
-        if isinstance(geno_or_rollout, tuple):
-            stage_conns = self.rollout_from_genotype(geno_or_rollout).arch
-        elif isinstance(geno_or_rollout, StagewiseMacroRollout):
-            stage_conns = geno_or_rollout.arch
-        else:
-            raise TypeError("We don't do that here")
+        return self.parse_overall_adjs([geno_or_rollout])[0]
 
-        last_node_idx = 0
-        overall_adj = np.zeros((self.num_layers + 2, self.num_layers + 2))
-        for i_stage, stage_conn in enumerate(stage_conns):
-            # NOTE: all stages_end/stages_begin indexes should add 1 because we add a stem layer
-            while last_node_idx < self.stages_begin[i_stage] + 1:
-                # sequential connection
-                overall_adj[last_node_idx + 1, last_node_idx] = 1
-                last_node_idx += 1
-            for to_, from_ in zip(*np.where(stage_conn)):
-                overall_adj[
-                    self.stages_begin[i_stage] + 1 + to_,
-                    self.stages_begin[i_stage] + 1 + from_,
-                ] = 1
-            last_node_idx = self.stages_end[i_stage] + 1
-        while last_node_idx < self.num_layers:
-            overall_adj[last_node_idx + 1, last_node_idx] = 1
-            last_node_idx += 1
-        return overall_adj
+    def parse_overall_adjs(self, genos_or_rollouts):
+        """
+        Batched version of `parse_overall_adj`.
+
+        Returns:
+          np.ndarray of shape (N, num_layers + 2, num_layers + 2)
+        """
+        all_stage_conns = [self._stage_conns(g_or_r) for g_or_r in genos_or_rollouts]
+        overall_adjs = np.zeros((len(all_stage_conns), self.num_layers + 2, self.num_layers + 2))
+        overall_adjs[:, self._seq_edge_idxes[0], self._seq_edge_idxes[1]] = 1
+        for i_stage in range(self.stage_num):
+            offset = self._stage_offsets[i_stage]
+            node_num = self.stage_node_nums[i_stage]
+            stage_conns = np.stack([np.asarray(stage_conns[i_stage])
+                                    for stage_conns in all_stage_conns]) != 0
+            overall_adjs[:, offset:offset + node_num, offset:offset + node_num][stage_conns] = 1
+        return overall_adjs
+
+    def ck_connect(self, genos_or_rollouts, verbose=False):
+        """
+        Batched connectivity check of multiple macro genotypes or rollouts.
+
+        Returns:
+          bool array of shape (N,), whether the last node of every stage is reachable.
+          If `verbose`, return two bool arrays of shape (N, stage_num): whether the last node
+          is reachable, and whether all nodes are reachable in each stage.
+        """
+        all_stage_conns = [self._stage_conns(g_or_r) for g_or_r in genos_or_rollouts]
+        connected = []
+        all_connected = []
+        for i_stage in range(self.stage_num):
+            reachables = reachable_from_source(np.stack([
+                np.asarray(stage_conns[i_stage]) for stage_conns in all_stage_conns]))
+            connected.append(reachables[:, -1])
+            all_connected.append(reachables.all(axis=-1))
+        connected = np.stack(connected, axis=-1)
+        if not verbose:
+            return connected.all(axis=-1)
+        return connected, np.stack(all_connected, axis=-1)
 
     def plot_arch(
         self, genotypes, filename, label, edge_labels=None, plot_format="pdf"
@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+"""
+Pre-parsed detection annotations, stored as flat arrays with per-image offsets.
+"""
+
+import os
+import json
+
+import numpy as np
+
+from aw_nas.utils import getLogger
+
+_LOGGER = getLogger("dataset.annotation")
+
+
+class AnnotationIndex(object):
+    """
+    The per-object annotation fields (e.g., boxes, labels) of all images,
+    concatenated along the first axis. The objects of the `i`-th image are
+    `field[offsets[i]:offsets[i + 1]]`.
+    """
+    def __init__(self, fields, offsets):
+        self.fields = fields
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+
+    @classmethod
+    def from_list(cls, annotations, names):
+        """
+        Args:
+            annotations (List[tuple]): The per-image tuples of per-object arrays.
+            names (List[str]): The field names of the tuple elements.
+        """
+        lengths = [len(anno[0]) for anno in annotations]
+        offsets = np.concatenate([[0], np.cumsum(lengths, dtype=np.int64)])
+        fields = {}
+        for i, name in enumerate(names):
+            arrays = [np.asarray(anno[i]) for anno in annotations]
+            # empty arrays might not have the right shape, e.g., `np.array([])` for boxes
+            non_empty = [arr for arr, num in zip(arrays, lengths) if num]
+            fields[name] = np.concatenate(non_empty) if non_empty else \
+                           (arrays[0] if arrays else np.zeros((0,)))
+        return cls(fields, offsets)
+
+    @classmethod
+    def concatenate(cls, indexes):
+        offsets = [np.zeros(1, dtype=np.int64)]
+        for index in indexes:
+            offsets.append(index.offsets[1:] + offsets[-1][-1])
+        fields = {name: np.concatenate([index.fields[name] for index in indexes])
+                  for name in indexes[0].fields}
+        return cls(fields, np.concatenate(offsets))
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def get(self, index, name):
+        return self.fields[name][self.offsets[index]:self.offsets[index + 1]]
+
+    def __getitem__(self, index):
+        start, end = self.offsets[index], self.offsets[index + 1]
+        return {name: field[start:end] for name, field in self.fields.items()}
+
+    def save(self, path, key, **extras):
+        """
+        Save the index and `extras` arrays into one `.npz` file, together with
+        the `key` (a JSON-serializable object) that `load` checks against.
+        Failures (e.g., on a read-only dataset mount) are logged and ignored.
+        """
+        arrays = {"field_" + name: field for name, field in self.fields.items()}
+        arrays.update({"extra_" + name: np.asarray(value) for name, value in extras.items()})
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            with open(path, "wb") as w_f:
+                np.savez(w_f, key=np.array(json.dumps(key)), offsets=self.offsets, **arrays)
+        except OSError as err:
+            _LOGGER.warning("Fail to save the annotation index to %s: %s", path, err)
+
+    @classmethod
+    def load(cls, path, key):
+        """
+        Returns:
+            (AnnotationIndex, dict) or (None, None) if `path` does not exist
+            or was saved with another `key`.
+        """
+        if not os.path.exists(path):
+            return None, None
+        with np.load(path, allow_pickle=False) as npz:
+            if json.loads(str(npz["key"])) != json.loads(json.dumps(key)):
+                return None, None
+            fields, extras = {}, {}
+            for name in npz.files:
+                if name.startswith("field_"):
+                    fields[name[len("field_"):]] = npz[name]
+                elif name.startswith("extra_"):
+                    extras[name[len("extra_"):]] = npz[name]
+            return cls(fields, npz["offsets"]), extras
+
+
+def files_stamp(fnames):
+    """
+    The (number, total size, latest mtime) of the files, used to invalidate the caches.
+    """
+    stats = [os.stat(fname) for fname in fnames]
+    return [len(stats), sum(stat.st_size for stat in stats),
+            max([stat.st_mtime for stat in stats] or [0.])]
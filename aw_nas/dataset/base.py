@@ -1,11 +1,20 @@
 # -*- coding: utf-8 -*-
 """Base class definition of Dataset"""
 
+import io
 import os
 import abc
+import pickle
+from multiprocessing.reduction import ForkingPickler
+
+import numpy as np
+import torch
 
 from aw_nas import Component, utils
 
+# smaller arrays are not worth a shared memory block
+_MIN_SHARED_BYTES = 1 << 20
+
 class BaseDataset(Component):
     REGISTRY = "dataset"
 
@@ -36,6 +45,86 @@ class BaseDataset(Component):
         """
         return {"train_testTransform": "train"}
 
+    def deterministic_splits(self):
+        """
+        The names of the splits whose transforms are deterministic (e.g., only `ToTensor`
+        and `Normalize`). The transformed data of these splits can be materialized once
+        and reused, see `cache_eval_tensors` of `prepare_data_queues`.
+        """
+        return []
+
+    def batch_augmentations(self):
+        """
+        Splits that can be augmented batch by batch on tensors, instead of per sample
+        in the DataLoader workers.
+
+        Returns:
+           Dict(str: tuple): A dict from split name to a tuple of
+           (uint8 image tensor of shape (N, C, H, W), target tensor, batch transform).
+        """
+        return {}
+
+    def share_memory(self):
+        """
+        Move the decoded data arrays of the splits (numpy arrays attributes of the split
+        datasets, e.g., `data` of torchvision datasets, and the splits that are lists of
+        tensors, e.g., the sentences of PTB) into shared memory.
+
+        Afterwards, when this dataset is sent to another process through
+        `multiprocessing` (e.g., as an argument of a spawned `Process`), only the
+        shared memory handles are sent, and the process attaches to the shared
+        memory instead of reloading or copying the data.
+        Plain pickling (e.g., saving to disk) is not affected.
+        """
+        if getattr(self, "_shared_objects", None) is not None:
+            return self
+        shared_objects = {}
+        mapping = self.same_data_split_mapping()
+        splits = self.splits()
+        # handle the splits that share data with other splits after the original ones
+        for name in sorted(splits, key=lambda split_name: split_name in mapping):
+            split = splits[name]
+            if isinstance(split, list):
+                if not split or not all(isinstance(item, torch.Tensor) for item in split):
+                    continue
+                lengths = [len(item) for item in split]
+                flat = torch.cat(split).share_memory_()
+                # replace inplace, as the list might be referenced elsewhere
+                split[:] = list(flat.split(lengths))
+                shared_objects[name] = ("tensor_list", flat, lengths, split)
+                continue
+            if not hasattr(split, "__dict__"):
+                continue
+            same_split = splits.get(mapping.get(name, name))
+            for attr, value in list(vars(split).items()):
+                if not isinstance(value, np.ndarray) or value.dtype == object \
+                   or value.nbytes < _MIN_SHARED_BYTES:
+                    continue
+                same_value = getattr(same_split, attr, None) \
+                             if same_split is not split else None
+                if isinstance(same_value, np.ndarray) and same_value.shape == value.shape \
+                   and same_value.dtype == value.dtype and np.array_equal(same_value, value):
+                    # reuse the shared array of the split with the same data
+                    setattr(split, attr, same_value)
+                    continue
+                try:
+                    tensor = torch.from_numpy(np.ascontiguousarray(value))
+                except TypeError:
+                    # dtype not supported by torch
+                    continue
+                tensor = torch.empty_like(tensor).share_memory_().copy_(tensor)
+                view = tensor.numpy()
+                setattr(split, attr, view)
+                shared_objects["{}.{}".format(name, attr)] = ("array", tensor, None, view)
+        self._shared_objects = shared_objects
+        ForkingPickler.register(type(self), _reduce_shared_dataset)
+        return self
+
+    def __getstate__(self):
+        state = super(BaseDataset, self).__getstate__()
+        state.pop("_shared_objects", None)
+        return state
+
     @abc.abstractmethod
     def splits(self):
         """
@@ -49,3 +138,50 @@ class BaseDataset(Component):
         """
         The data type of this dataset.
         """
+
+
+class _SharedObjectsPickler(pickle.Pickler):
+    def __init__(self, file, shared_ids):
+        super(_SharedObjectsPickler, self).__init__(file, pickle.HIGHEST_PROTOCOL)
+        self.shared_ids = shared_ids
+
+    def persistent_id(self, obj):
+        return self.shared_ids.get(id(obj))
+
+
+class _SharedObjectsUnpickler(pickle.Unpickler):
+    def __init__(self, file, objects):
+        super(_SharedObjectsUnpickler, self).__init__(file)
+        self.objects = objects
+
+    def persistent_load(self, pid):
+        return self.objects[pid]
+
+
+def _reduce_shared_dataset(dataset):
+    """
+    Reducer of the datasets that called `share_memory`, used by `ForkingPickler`.
+    The shared tensors are reduced to handles by the reducers registered by `torch`.
+    """
+    shared_objects = getattr(dataset, "_shared_objects", None)
+    if shared_objects is None:
+        return dataset.__reduce_ex__(pickle.HIGHEST_PROTOCOL)
+    buf = io.BytesIO()
+    _SharedObjectsPickler(
+        buf, {id(obj): key for key, (_, _, _, obj) in shared_objects.items()}
+    ).dump(dataset.__getstate__())
+    tensors = {key: (kind, tensor, meta)
+               for key, (kind, tensor, meta, _) in shared_objects.items()}
+    return _rebuild_shared_dataset, (type(dataset), buf.getvalue(), tensors)
+
+
+def _rebuild_shared_dataset(dataset_cls, state_bytes, tensors):
+    objects = {key: tensor.numpy() if kind == "array" else list(tensor.split(meta))
+               for key, (kind, tensor, meta) in tensors.items()}
+    state = _SharedObjectsUnpickler(io.BytesIO(state_bytes), objects).load()
+    dataset = dataset_cls.__new__(dataset_cls)
+    dataset.__setstate__(state)
+    ForkingPickler.register(dataset_cls, _reduce_shared_dataset)
+    dataset._shared_objects = {key: (kind, tensor, meta, objects[key])
+                               for key, (kind, tensor, meta) in tensors.items()}
+    return dataset
@@ -1,15 +1,17 @@
 # -*- coding: utf-8 -*-
+import torch
 from torchvision import (datasets, transforms)
 
-from aw_nas.utils.torch_utils import Cutout
+from aw_nas.utils.torch_utils import Cutout, BatchAugmentation
 from aw_nas.dataset.base import BaseDataset
 
 class Cifar10(BaseDataset):
     NAME = "cifar10"
 
-    def __init__(self, cutout=None):
+    def __init__(self, cutout=None, batch_augment=False):
         super(Cifar10, self).__init__()
         self.cutout = cutout
+        self.batch_augment = batch_augment
 
         cifar_mean = [0.49139968, 0.48215827, 0.44653124]
         cifar_std = [0.24703233, 0.24348505, 0.26158768]
@@ -38,12 +40,30 @@ class Cifar10(BaseDataset):
         self.datasets["test"] = datasets.CIFAR10(root=self.data_dir, train=False,
                                                  download=True, transform=test_transform)
 
+        self._batch_transforms = {}
+        if self.batch_augment:
+            self._batch_transforms = {
+                "train": BatchAugmentation(cifar_mean, cifar_std, padding=4, flip=True,
+                                           cutout=self.cutout),
+                "train_testTransform": BatchAugmentation(cifar_mean, cifar_std),
+                "test": BatchAugmentation(cifar_mean, cifar_std)
+            }
+
     def same_data_split_mapping(self):
         return {"train_testTransform": "train"}
 
     def splits(self):
         return self.datasets
 
+    def batch_augmentations(self):
+        # (N, H, W, C) uint8 arrays, viewed as (N, C, H, W) without copying
+        return {split: (torch.from_numpy(self.datasets[split].data).permute(0, 3, 1, 2),
+                        torch.as_tensor(self.datasets[split].targets), transform)
+                for split, transform in self._batch_transforms.items()}
+
+    def deterministic_splits(self):
+        return ["train_testTransform", "test"]
+
     @classmethod
     def data_type(cls):
         return "image"
@@ -53,11 +73,11 @@ class Cifar10(BaseDataset):
         Python 3
         reduce for pickling (mainly for use with async search see trainer/async_trainer.py)
         """
-        return Cifar10, (self.cutout,)
+        return Cifar10, (self.cutout, self.batch_augment)
 
     def __getinitargs__(self):
         """
         Python 2
         getinitargs for pickling (mainly for use with async search see trainer/async_trainer.py)
         """
-        return (self.cutout,)
+        return (self.cutout, self.batch_augment)
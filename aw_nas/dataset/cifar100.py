@@ -1,16 +1,18 @@
 # -*- coding: utf-8 -*-
+import torch
 from torchvision import (datasets, transforms)
 
-from aw_nas.utils.torch_utils import Cutout
+from aw_nas.utils.torch_utils import Cutout, BatchAugmentation
 from aw_nas.dataset.base import BaseDataset
 
 
 class Cifar100(BaseDataset):
     NAME = "cifar100"
 
-    def __init__(self, cutout=None):
+    def __init__(self, cutout=None, batch_augment=False):
         super(Cifar100, self).__init__()
         self.cutout = cutout
+        self.batch_augment = batch_augment
 
         cifar_mean = [0.5070751592371322, 0.4865488733149497, 0.44091784336703466]
         cifar_std = [0.26733428587924063, 0.25643846291708833, 0.27615047132568393]
@@ -37,9 +39,26 @@ class Cifar100(BaseDataset):
         self.datasets["test"] = datasets.CIFAR100(root=self.data_dir, train=False,
                                                   download=True, transform=test_transform)
 
+        self._batch_transforms = {}
+        if self.batch_augment:
+            self._batch_transforms = {
+                "train": BatchAugmentation(cifar_mean, cifar_std, padding=4, flip=True,
+                                           cutout=self.cutout),
+                "test": BatchAugmentation(cifar_mean, cifar_std)
+            }
+
     def splits(self):
         return self.datasets
 
+    def batch_augmentations(self):
+        # (N, H, W, C) uint8 arrays, viewed as (N, C, H, W) without copying
+        return {split: (torch.from_numpy(self.datasets[split].data).permute(0, 3, 1, 2),
+                        torch.as_tensor(self.datasets[split].targets), transform)
+                for split, transform in self._batch_transforms.items()}
+
+    def deterministic_splits(self):
+        return ["test"]
+
     @classmethod
     def data_type(cls):
         return "image"
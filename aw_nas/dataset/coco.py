@@ -11,6 +11,7 @@ from pycocotools.coco import COCO
 from pycocotools.cocoeval import COCOeval
 
 from aw_nas.dataset.base import BaseDataset
+from aw_nas.dataset.annotation import AnnotationIndex, files_stamp
 from aw_nas.dataset.transform import *
 
 min_keypoints_per_image = 10
@@ -92,34 +93,32 @@ class COCODetection(data.Dataset):
 
         # self.data_name = list()
         # self.data_len = list()
+        annotations = []
         for (year, image_set) in image_sets:
             coco_name = image_set + year
-            data_name = (self._view_map[coco_name]
-                         if coco_name in self._view_map else coco_name)
-            annofile = self._get_ann_file(coco_name)
-            _COCO = COCO(annofile)
-            self._COCO = _COCO
             self.coco_name = coco_name
-            cats = _COCO.loadCats(_COCO.getCatIds())
-            self._classes = tuple(["__background__"] +
-                                  [c["name"] for c in cats])
+            self._coco = None
+            is_test_set = image_set.find("test") != -1
+            if is_test_set:
+                print("test set will not load annotations!")
+            anno_index, indexes, cats = self._load_coco_index(
+                coco_name, remove_no_anno=remove_no_anno and not is_test_set)
+            self._classes = tuple(["__background__"] + [c["name"] for c in cats])
             self.num_classes = len(self._classes)
             self._class_to_ind = dict(
                 zip(self._classes, range(self.num_classes)))
             self._class_to_coco_cat_id = dict(
-                zip([c["name"] for c in cats], _COCO.getCatIds()))
-            indexes = _COCO.getImgIds()
+                zip([c["name"] for c in cats], [c["id"] for c in cats]))
 
-            if image_set.find("test") != -1:
-                print("test set will not load annotations!")
-            else:
-                annos, indexes = self._load_coco_annotations(
-                    coco_name, indexes, _COCO, remove_no_anno=remove_no_anno)
-                self.annotations.extend(annos)
+            if not is_test_set:
+                annotations.append(anno_index)
 
             self.image_indexes.extend(indexes)
             self.img_paths.extend(self._load_coco_img_path(coco_name, indexes))
 
+        if annotations:
+            self.annotations = AnnotationIndex.concatenate(annotations)
+
         self.image_indexes = self.image_indexes[:max_images]
         self.img_paths = self.img_paths[:max_images]
 
@@ -146,29 +145,53 @@ class COCODetection(data.Dataset):
         return os.path.join(self.root, "annotations",
                             prefix + "_" + name + ".json")
 
-    def _load_coco_annotations(self,
-                               coco_name,
-                               indexes,
-                               _COCO,
-                               remove_no_anno=False):
-        cache_file = os.path.join(self.cache_path, coco_name + "_gt_roidb.pkl")
-        if os.path.exists(cache_file):
-            with open(cache_file, "rb") as fid:
-                roidb, valid_indexes = pickle.load(fid)
-            print("{} gt roidb loaded from {}".format(coco_name, cache_file))
-            return roidb, valid_indexes
+    @property
+    def _COCO(self):
+        # only parse the annotation JSON when it is really needed
+        if self._coco is None:
+            self._coco = COCO(self._get_ann_file(self.coco_name))
+        return self._coco
 
-        print("parsing gt roidb for {}".format(coco_name))
+    def _load_coco_index(self, coco_name, remove_no_anno=False):
+        """
+        Load the annotations, the image indexes and the categories of one image set
+        from the `.npz` cache. If the cache does not exist or the annotation file has
+        changed, parse the annotation file and write the cache.
+
+        Returns:
+            anno_index (AnnotationIndex): The `target` field contains the
+                [x1, y1, x2, y2, category id, annotation id] of each object.
+            indexes (List[int]): The image indexes.
+            cats (List[dict]): The categories.
+        """
+        annofile = self._get_ann_file(coco_name)
+        cache_file = os.path.join(self.cache_path, coco_name + "_annotations.npz")
+        key = {"stamp": files_stamp([annofile]), "remove_no_anno": remove_no_anno}
+        anno_index, extras = AnnotationIndex.load(cache_file, key)
+        if anno_index is not None:
+            print("{} annotations loaded from {}".format(coco_name, cache_file))
+            cats = [{"id": int(cat_id), "name": str(name)} for cat_id, name in
+                    zip(extras["cat_ids"], extras["cat_names"])]
+            return anno_index, extras["image_indexes"].tolist(), cats
+
+        print("parsing annotations for {}".format(coco_name))
+        _COCO = COCO(annofile)
+        self._coco = _COCO
+        cats = _COCO.loadCats(_COCO.getCatIds())
+        indexes = _COCO.getImgIds()
         gt_roidb = [(index,
                      self._annotation_from_index(index, _COCO, remove_no_anno))
                     for index in indexes]
-        valid_indexes = [index for index, anno in gt_roidb if anno is not None]
-        gt_roidb = [anno for index, anno in gt_roidb if anno is not None]
-        with open(cache_file, "wb") as fid:
-            pickle.dump([gt_roidb, valid_indexes], fid,
-                        pickle.HIGHEST_PROTOCOL)
-        print("wrote gt roidb to {}".format(cache_file))
-        return gt_roidb, valid_indexes
+        indexes = [index for index, anno in gt_roidb if anno is not None]
+        anno_index = AnnotationIndex.from_list(
+            [(anno,) for _, anno in gt_roidb if anno is not None], ["target"])
+        anno_index.fields["target"] = anno_index.fields["target"].reshape(-1, 6)
+        anno_index.save(cache_file, key,
+                        image_indexes=np.array(indexes, dtype=np.int64),
+                        cat_ids=np.array([c["id"] for c in cats], dtype=np.int64),
+                        cat_names=np.array([c["name"] for c in cats]))
+        print("wrote annotations to {}".format(cache_file))
+        return anno_index, indexes, cats
 
     def _load_coco_img_path(self, coco_name, indexes):
         cache_file = os.path.join(self.cache_path, coco_name + "_img_path.pkl")
@@ -251,7 +274,8 @@ class COCODetection(data.Dataset):
 
     def _getitem(self, index):
         img_path = self.img_paths[index]
-        target = self.annotations[index]
+        # copy, as `ori_boxes` is modified inplace in `__getitem__`
+        target = self.annotations.get(index, "target").copy()
         ori_boxes, labels, annIds = target[:, :4], target[:, 4], target[:, 5]
 
         img = cv2.imread(img_path, cv2.IMREAD_COLOR)
@@ -295,7 +319,7 @@ class COCODetection(data.Dataset):
             list:  [img_id, [(label, bbox coords),...]]
                 eg: ('001718', [('dog', (96, 13, 438, 332))])
         '''
-        anno = self.annotations[index]
+        anno = self.annotations.get(index, "target")
         if self.target_transform is not None:
             anno = self.target_transform(anno)
         return anno
@@ -7,7 +7,6 @@ http://arxiv.org/abs/1512.02325
 Ellis Brown, Max deGroot
 """
 
-import math
 import random
 
 import numpy as np
@@ -16,12 +15,24 @@ import cv2
 from aw_nas.utils.box_utils import matrix_iou
 
 
+# the number of random trials of cropping/expanding
+_NUM_TRIALS = 50
+
+
+def _np_random():
+    # derive the numpy random state from the `random` module, which is seeded
+    # differently in each DataLoader worker
+    return np.random.RandomState(random.getrandbits(32))
+
+
 def _crop(image, boxes, labels):
     height, width, _ = image.shape
 
     if len(boxes) == 0:
         return image, boxes, labels
 
+    rng = _np_random()
+    centers = (boxes[:, :2] + boxes[:, 2:]) / 2
     while True:
         mode = random.choice((
             None,
@@ -42,49 +53,50 @@ def _crop(image, boxes, labels):
         if max_iou is None:
             max_iou = float('inf')
 
-        for _ in range(50):
-            scale = random.uniform(0.3, 1.)
-            min_ratio = max(0.5, scale * scale)
-            max_ratio = min(2, 1. / scale / scale)
-            ratio = math.sqrt(random.uniform(min_ratio, max_ratio))
-            w = int(scale * ratio * width)
-            h = int((scale / ratio) * height)
-
-            l = random.randrange(width - w)
-            t = random.randrange(height - h)
-            roi = np.array((l, t, l + w, t + h))
-
-            iou = matrix_iou(boxes, roi[np.newaxis])
-
-            if not (min_iou <= iou.min() and iou.max() <= max_iou):
-                continue
-
-            image_t = image[roi[1]:roi[3], roi[0]:roi[2]]
+        # sample all the trials at once, and use the first valid one
+        scale = rng.uniform(0.3, 1., size=_NUM_TRIALS)
+        min_ratio = np.maximum(0.5, scale * scale)
+        max_ratio = np.minimum(2, 1. / scale / scale)
+        ratio = np.sqrt(rng.uniform(min_ratio, max_ratio))
+        w = (scale * ratio * width).astype(np.int64)
+        h = ((scale / ratio) * height).astype(np.int64)
+        l = (rng.random_sample(_NUM_TRIALS) * (width - w)).astype(np.int64)
+        t = (rng.random_sample(_NUM_TRIALS) * (height - h)).astype(np.int64)
+        rois = np.stack((l, t, l + w, t + h), axis=1)
+
+        # (num_boxes, num_trials)
+        iou = matrix_iou(boxes, rois)
+        in_roi = np.logical_and(rois[np.newaxis, :, :2] < centers[:, np.newaxis],
+                                centers[:, np.newaxis] < rois[np.newaxis, :, 2:]).all(axis=2)
+        valid = (min_iou <= iou.min(axis=0)) & (iou.max(axis=0) <= max_iou) & in_roi.any(axis=0)
+        if not valid.any():
+            continue
 
-            centers = (boxes[:, :2] + boxes[:, 2:]) / 2
-            mask = np.logical_and(roi[:2] < centers, centers < roi[2:]) \
-                     .all(axis=1)
-            boxes_t = boxes[mask].copy()
-            labels_t = labels[mask].copy()
-            if len(boxes_t) == 0:
-                continue
+        trial = np.argmax(valid)
+        roi = rois[trial]
+        mask = in_roi[:, trial]
+        image_t = image[roi[1]:roi[3], roi[0]:roi[2]]
+        boxes_t = boxes[mask].copy()
+        labels_t = labels[mask].copy()
 
-            boxes_t[:, :2] = np.maximum(boxes_t[:, :2], roi[:2])
-            boxes_t[:, :2] -= roi[:2]
-            boxes_t[:, 2:] = np.minimum(boxes_t[:, 2:], roi[2:])
-            boxes_t[:, 2:] -= roi[:2]
+        boxes_t[:, :2] = np.maximum(boxes_t[:, :2], roi[:2])
+        boxes_t[:, :2] -= roi[:2]
+        boxes_t[:, 2:] = np.minimum(boxes_t[:, 2:], roi[2:])
+        boxes_t[:, 2:] -= roi[:2]
 
-            return image_t, boxes_t, labels_t
+        return image_t, boxes_t, labels_t
 
 
 def _distort(image):
     def _convert(image, alpha=1, beta=0):
-        tmp = image.astype(float) * alpha + beta
-        tmp[tmp < 0] = 0
-        tmp[tmp > 255] = 255
-        image[:] = tmp
+        # inplace, without intermediate copies
+        if alpha != 1:
+            image *= alpha
+        if beta != 0:
+            image += beta
+        np.clip(image, 0, 255, out=image)
 
-    image = image.copy().astype(np.float32)
+    image = image.astype(np.float32) # a copy
 
     if random.randrange(2):
         _convert(image, beta=random.uniform(-32, 32))
@@ -95,9 +107,8 @@ def _distort(image):
     image = cv2.cvtColor(image, cv2.COLOR_RGB2HSV)
 
     if random.randrange(2):
-        tmp = image[:, :, 0].astype(int) + random.randint(-18, 18)
-        tmp %= 180
-        image[:, :, 0] = tmp
+        hue = image[:, :, 0]
+        hue[:] = np.mod(np.floor(hue) + random.randint(-18, 18), 180)
 
     if random.randrange(2):
         _convert(image[:, :, 1], alpha=random.uniform(0.5, 1.5))
@@ -112,34 +123,30 @@ def _expand(image, boxes, fill, p):
         return image, boxes
 
     height, width, depth = image.shape
-    for _ in range(50):
-        scale = random.uniform(1, 4)
-
-        min_ratio = max(0.5, 1./scale/scale)
-        max_ratio = min(2, scale*scale)
-        ratio = math.sqrt(random.uniform(min_ratio, max_ratio))
-        ws = scale*ratio
-        hs = scale/ratio
-        if ws < 1 or hs < 1:
-            continue
-        w = int(ws * width)
-        h = int(hs * height)
-
-        left = random.randint(0, w - width)
-        top = random.randint(0, h - height)
+    rng = _np_random()
+    scale = rng.uniform(1, 4, size=_NUM_TRIALS)
+    min_ratio = np.maximum(0.5, 1. / scale / scale)
+    max_ratio = np.minimum(2, scale * scale)
+    ratio = np.sqrt(rng.uniform(min_ratio, max_ratio))
+    ws = scale * ratio
+    hs = scale / ratio
+    valid = (ws >= 1) & (hs >= 1)
+    if not valid.any():
+        return image, boxes
+    trial = np.argmax(valid)
+    w = int(ws[trial] * width)
+    h = int(hs[trial] * height)
 
-        boxes_t = boxes.copy()
-        boxes_t[:, :2] += (left, top)
-        boxes_t[:, 2:] += (left, top)
+    left = random.randint(0, w - width)
+    top = random.randint(0, h - height)
 
-        expand_image = np.empty(
-            (h, w, depth),
-            dtype=image.dtype)
-        expand_image[:, :] = fill
-        expand_image[top:top + height, left:left + width] = image
-        image = expand_image
+    boxes_t = boxes.copy()
+    boxes_t[:, :2] += (left, top)
+    boxes_t[:, 2:] += (left, top)
 
-        return image, boxes_t
+    expand_image = np.full((h, w, depth), fill, dtype=image.dtype)
+    expand_image[top:top + height, left:left + width] = image
+    return expand_image, boxes_t
 
 
 def _mirror(image, boxes):
@@ -227,7 +234,8 @@ class Preproc(object):
             return image, boxes, labels
 
         targets = np.concatenate([boxes, labels.reshape(-1, 1)], 1)
-        image_o = image.copy()
+        # `image` is not modified inplace by the following transforms, no need to copy
+        image_o = image
         targets_o = targets.copy()
         height_o, width_o, _ = image_o.shape
         boxes_o = targets_o[:, :-1]
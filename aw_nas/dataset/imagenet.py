@@ -1,5 +1,7 @@
 # -*- coding: utf-8 -*-
 import os
+import json
+import hashlib
 from datetime import datetime
 import six
 
@@ -8,10 +10,116 @@ from torchvision import (datasets, transforms)
 
 from aw_nas.utils.torch_utils import Cutout
 from aw_nas.dataset.base import BaseDataset
+from aw_nas.utils import getLogger
+
+_LOGGER = getLogger("dataset.imagenet")
 
 class ImageNetDataset(datasets.ImageFolder):
-    def __init__(self, *args, **kwargs):
-        super(ImageNetDataset, self).__init__(*args, **kwargs)
+    """
+    An `ImageFolder` whose (relative path, class index) samples are stored as two arrays.
+
+    Walking the whole directory tree is slow for ImageNet. The sample arrays are cached
+    as `.npy` files under `index_cache_dir` (by default, `awnas_cache` next to `root`),
+    keyed by the listing signature of `root` (class directories and their mtimes),
+    and are loaded by memory mapping.
+    """
+    def __init__(self, root, transform=None, target_transform=None, index_cache_dir=None):
+        # `DatasetFolder.__init__` is not called, as it walks the directory tree
+        datasets.VisionDataset.__init__(self, root, transform=transform,
+                                        target_transform=target_transform)
+        self.loader = datasets.folder.default_loader
+        self.extensions = datasets.folder.IMG_EXTENSIONS
+        if hasattr(self, "find_classes"):
+            self.classes, self.class_to_idx = self.find_classes(self.root)
+        else:
+            self.classes, self.class_to_idx = self._find_classes(self.root)
+        if index_cache_dir is None:
+            index_cache_dir = os.path.join(os.path.dirname(os.path.abspath(self.root)),
+                                           "awnas_cache")
+        self._index_files = None
+        self._paths, self._targets = self._load_index(index_cache_dir)
+
+    def _load_index(self, cache_dir):
+        signature = [os.path.abspath(self.root), list(self.extensions)] + [
+            [name, os.stat(os.path.join(self.root, name)).st_mtime_ns] for name in self.classes]
+        digest = hashlib.sha1(json.dumps(signature).encode("utf-8")).hexdigest()[:16]
+        prefix = os.path.join(cache_dir, "{}_index_{}".format(
+            os.path.basename(os.path.abspath(self.root)), digest))
+        index_files = (prefix + "_paths.npy", prefix + "_targets.npy")
+        if all(os.path.exists(fname) for fname in index_files):
+            self._index_files = index_files
+            return tuple(np.load(fname, mmap_mode="r") for fname in index_files)
+
+        samples = datasets.folder.make_dataset(self.root, self.class_to_idx, self.extensions)
+        paths = np.array([os.path.relpath(path, self.root).encode("utf-8")
+                          for path, _ in samples], dtype=np.bytes_)
+        targets = np.array([target for _, target in samples], dtype=np.int64)
+        try:
+            if not os.path.exists(cache_dir):
+                os.makedirs(cache_dir, exist_ok=True)
+            for fname, array in zip(index_files, (paths, targets)):
+                # write then rename, other processes might be loading the same index
+                tmp_fname = "{}.{}.tmp".format(fname, os.getpid())
+                with open(tmp_fname, "wb") as w_f:
+                    np.save(w_f, array)
+                os.replace(tmp_fname, fname)
+        except OSError as err:
+            _LOGGER.warning("Fail to save the index of %s: %s", self.root, err)
+        return paths, targets
+
+    @property
+    def samples(self):
+        return [(os.path.join(self.root, path.decode("utf-8")), int(target))
+                for path, target in zip(self._paths, self._targets)]
+
+    @samples.setter
+    def samples(self, samples):
+        self._index_files = None
+        self._paths = np.array([os.path.relpath(path, self.root).encode("utf-8")
+                                for path, _ in samples], dtype=np.bytes_)
+        self._targets = np.array([target for _, target in samples], dtype=np.int64)
+
+    imgs = samples
+
+    @property
+    def targets(self):
+        return self._targets.tolist()
+
+    def __getitem__(self, index):
+        path = os.path.join(self.root, self._paths[index].decode("utf-8"))
+        target = int(self._targets[index])
+        sample = self.loader(path)
+        if self.transform is not None:
+            sample = self.transform(sample)
+        if self.target_transform is not None:
+            target = self.target_transform(target)
+        return sample, target
+
+    def __len__(self):
+        return len(self._targets)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        if self._index_files is not None:
+            # re-open the memory-mapped index instead of copying it
+            del state["_paths"], state["_targets"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        if self._index_files is not None:
+            self._paths, self._targets = (np.load(fname, mmap_mode="r")
+                                          for fname in self._index_files)
+
+    def _filter_classes(self, choosen_cls_idx):
+        # map the class indexes, -1 for the dropped classes
+        cls_map = np.full(len(self.classes), -1, dtype=np.int64)
+        cls_map[np.asarray(choosen_cls_idx, dtype=np.int64)] = np.arange(len(choosen_cls_idx))
+        targets = cls_map[self._targets]
+        mask = targets >= 0
+        self._paths = self._paths[mask]
+        self._targets = targets[mask]
+        self._index_files = None
 
     def filter(self, num_classes=100, random_choose=False, random_seed=None, class_names=None):
         _total_classes = len(self.classes)
@@ -19,12 +127,7 @@ class ImageNetDataset(datasets.ImageFolder):
             return self.classes
 
         if class_names is not None:
-            _samples = []
-            _cls_map = {self.class_to_idx[name]:idx for idx, name in enumerate(class_names)}
-            for item in self.samples:
-                if item[1] in _cls_map:
-                    _samples.append((item[0], _cls_map[item[1]]))
-            self.samples = _samples
+            self._filter_classes([self.class_to_idx[name] for name in class_names])
             self.classes = class_names
             self.class_to_idx = {n: i for i, n in enumerate(class_names)}
             return self.classes
@@ -38,12 +141,7 @@ class ImageNetDataset(datasets.ImageFolder):
         else:
             choosen_cls_idx = list(range(num_classes))
 
-        _cls_map = {idx: i for i, idx in enumerate(choosen_cls_idx)}
-        _samples = []
-        for item in self.samples:
-            if item[1] in _cls_map:
-                _samples.append((item[0], _cls_map[item[1]]))
-        self.samples = _samples
+        self._filter_classes(choosen_cls_idx)
         idx_to_class = {idx: name for name, idx in six.iteritems(self.class_to_idx)}
         self.classes = [idx_to_class[idx] for idx in choosen_cls_idx]
         self.class_to_idx = {name: i for i, name in enumerate(self.classes)}
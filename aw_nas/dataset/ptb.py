@@ -7,8 +7,11 @@ from collections import Counter
 import torch
 
 from aw_nas.dataset.base import BaseDataset
+from aw_nas.utils import getLogger
 from aw_nas.utils.exception import expect
 
+_LOGGER = getLogger("dataset.ptb")
+
 class Dictionary(object):
     def __init__(self):
         self.word2idx = {}
@@ -30,68 +33,104 @@ class Dictionary(object):
 
 
 class Corpus(object):
-    def __init__(self, path):
-        self.vocabulary = Dictionary()
-        self.train = self.tokenize(os.path.join(path, "train.txt"))
-        self.valid = self.tokenize(os.path.join(path, "valid.txt"))
-        self.test = self.tokenize(os.path.join(path, "test.txt"))
+    """
+    The tokenized train/valid/test splits of a text corpus.
 
-    def tokenize(self, path):
-        """Tokenizes a text file."""
-        expect(os.path.exists(path))
-        # Add words to the dictionary
-        with open(path, "r", encoding="utf-8") as f:
-            tokens = 0
-            for line in f:
-                words = line.split() + ["<eos>"]
-                tokens += len(words)
-                for word in words:
-                    self.vocabulary.add_word(word)
+    The tokenized ids and the vocabulary are cached in `CACHE_NAME` under `path`,
+    and are reused as long as the sizes and modification times of the text files
+    are unchanged.
+    """
+    SPLITS = ("train", "valid", "test")
+    CACHE_NAME = "tokenized_cache.pt"
 
-        # Tokenize file content
-        with open(path, "r", encoding="utf-8") as f:
-            ids = torch.LongTensor(tokens)
-            token = 0
-            for line in f:
-                words = line.split() + ["<eos>"]
-                for word in words:
-                    ids[token] = self.vocabulary.word2idx[word]
-                    token += 1
-
-        return ids
-
-class SentenceCorpus(object):
-    def __init__(self, path):
+    def __init__(self, path, use_cache=True):
         self.vocabulary = Dictionary()
-        self.train = self.tokenize(os.path.join(path, "train.txt"))
-        self.valid = self.tokenize(os.path.join(path, "valid.txt"))
-        self.test = self.tokenize(os.path.join(path, "test.txt"))
+        fnames = [os.path.join(path, "{}.txt".format(split)) for split in self.SPLITS]
+        for fname in fnames:
+            expect(os.path.exists(fname), "{} does not exist".format(fname))
+        cache_file = os.path.join(path, self.CACHE_NAME)
+        cache_key = [[os.path.basename(fname), os.path.getsize(fname), os.path.getmtime(fname)]
+                     for fname in fnames]
+
+        tokenized = self._load_cache(cache_file, cache_key) if use_cache else None
+        if tokenized is None:
+            tokenized = [self._tokenize_ids(fname) for fname in fnames]
+            if use_cache:
+                self._save_cache(cache_file, cache_key, tokenized)
+        for split, (ids, lengths) in zip(self.SPLITS, tokenized):
+            setattr(self, split, self._to_split(ids, lengths))
 
     def tokenize(self, path):
         """Tokenizes a text file."""
         expect(os.path.exists(path))
-        # Add words to the dictionary
+        return self._to_split(*self._tokenize_ids(path))
+
+    def _tokenize_ids(self, path):
+        """
+        Tokenizes a text file in a single pass, and adds the words to the vocabulary.
+
+        Returns:
+            ids (torch.LongTensor): The token ids of the whole file.
+            lengths (List[int]): The number of tokens of each line.
+        """
+        word2idx = self.vocabulary.word2idx
+        idx2word = self.vocabulary.idx2word
+        ids = []
+        lengths = []
         with open(path, "r", encoding="utf-8") as f:
-            tokens = 0
             for line in f:
                 words = line.split() + ["<eos>"]
-                tokens += len(words)
                 for word in words:
-                    self.vocabulary.add_word(word)
-
-        # Tokenize file content
-        sents = []
-        with open(path, "r", encoding="utf-8") as f:
-            for line in f:
-                if not line:
-                    continue
-                words = line.split() + ["<eos>"]
-                sent = torch.LongTensor(len(words))
-                for i, word in enumerate(words):
-                    sent[i] = self.vocabulary.word2idx[word]
-                sents.append(sent)
+                    if word not in word2idx:
+                        idx2word.append(word)
+                        word2idx[word] = len(idx2word) - 1
+                ids.extend([word2idx[word] for word in words])
+                lengths.append(len(words))
+        self.vocabulary.counter.update(ids)
+        self.vocabulary.total += len(ids)
+        return torch.tensor(ids, dtype=torch.long), lengths
+
+    def _to_split(self, ids, lengths):
+        return ids
 
-        return sents
+    def _load_cache(self, cache_file, cache_key):
+        if not os.path.exists(cache_file):
+            return None
+        try:
+            cache = torch.load(cache_file)
+        except Exception as err: #pylint: disable=broad-except
+            _LOGGER.warning("Fail to load the tokenized cache %s: %s", cache_file, err)
+            return None
+        if cache["key"] != cache_key:
+            return None
+        self.vocabulary.idx2word = list(cache["idx2word"])
+        self.vocabulary.word2idx = {word: idx for idx, word in
+                                    enumerate(self.vocabulary.idx2word)}
+        counts = cache["counts"].tolist()
+        self.vocabulary.counter = Counter(dict(enumerate(counts)))
+        self.vocabulary.total = sum(counts)
+        return [(ids, lengths.tolist()) for ids, lengths in zip(cache["ids"], cache["lengths"])]
+
+    def _save_cache(self, cache_file, cache_key, tokenized):
+        counts = [self.vocabulary.counter[idx] for idx in range(len(self.vocabulary))]
+        try:
+            torch.save({
+                "key": cache_key,
+                "idx2word": self.vocabulary.idx2word,
+                "counts": torch.tensor(counts, dtype=torch.long),
+                "ids": [ids for ids, _ in tokenized],
+                "lengths": [torch.tensor(lengths, dtype=torch.long) for _, lengths in tokenized]
+            }, cache_file)
+        except OSError as err:
+            _LOGGER.warning("Fail to save the tokenized cache %s: %s", cache_file, err)
+
+class SentenceCorpus(Corpus):
+    """
+    The same as `Corpus`, but each split is a list of sentence tensors.
+    The sentences are views of the same tensor of token ids.
+    """
+    def _to_split(self, ids, lengths):
+        return list(ids.split(lengths))
 
 class PTB(BaseDataset):
     NAME = "ptb"
@@ -1,16 +1,18 @@
 # -*- coding: utf-8 -*-
+import torch
 from torchvision import (datasets, transforms)
 
-from aw_nas.utils.torch_utils import Cutout
+from aw_nas.utils.torch_utils import Cutout, BatchAugmentation
 from aw_nas.dataset.base import BaseDataset
 
 
 class SVHN(BaseDataset):
     NAME = "SVHN"
 
-    def __init__(self, cutout=None):
+    def __init__(self, cutout=None, batch_augment=False):
         super(SVHN, self).__init__()
         self.cutout = cutout
+        self.batch_augment = batch_augment
 
         svhn_mean = [0.4377, 0.4438, 0.4728]
         svhn_std = [0.1980, 0.2010, 0.1970]
@@ -40,9 +42,26 @@ class SVHN(BaseDataset):
         self.datasets["extra"] = datasets.SVHN(root=self.data_dir, split='extra',
                                               download=True, transform=extra_transform)
 
+        self._batch_transforms = {}
+        if self.batch_augment:
+            self._batch_transforms = {
+                split: BatchAugmentation(svhn_mean, svhn_std,
+                                         cutout=self.cutout if split == "train" else None)
+                for split in ["train", "test", "extra"]
+            }
+
     def splits(self):
         return self.datasets
 
+    def batch_augmentations(self):
+        # the SVHN arrays are already in (N, C, H, W) uint8
+        return {split: (torch.from_numpy(self.datasets[split].data),
+                        torch.as_tensor(self.datasets[split].labels), transform)
+                for split, transform in self._batch_transforms.items()}
+
+    def deterministic_splits(self):
+        return ["test", "extra"] + (["train"] if not self.cutout else [])
+
     @classmethod
     def data_type(cls):
         return "image"
\ No newline at end of file
@@ -1,5 +1,6 @@
 import logging
 import os
+import hashlib
 import pathlib
 import xml.etree.ElementTree as ET
 
@@ -9,6 +10,7 @@ import torch
 from torchvision import datasets, transforms
 
 from aw_nas.dataset.base import BaseDataset
+from aw_nas.dataset.annotation import AnnotationIndex, files_stamp
 from aw_nas.dataset.transform import *
 from aw_nas.utils.box_utils import *
 
@@ -80,6 +82,28 @@ class VOCDataset(object):
         }
 
         self.kwargs = {"collate_fn": collate_fn}
+        self.annotations = self._load_annotation_index()
+
+    def _load_annotation_index(self):
+        """
+        Parse the annotation XMLs of all images once, and cache the results into
+        `awnas_cache/` under `data_dir`. The cache is invalidated when the image ids,
+        the class names or the annotation files change.
+        """
+        digest = hashlib.sha1("\n".join(
+            ["/".join(img_id) for img_id in self.ids] + list(self.class_names)
+        ).encode("utf-8")).hexdigest()
+        cache_file = os.path.join(self.data_dir, "awnas_cache",
+                                  "voc_annotations_{}.npz".format(digest))
+        key = {"stamp": files_stamp([self.anno_path % img_id for img_id in self.ids])}
+        index, _ = AnnotationIndex.load(cache_file, key)
+        if index is None:
+            logging.info("Parsing the annotations of %d images", len(self.ids))
+            index = AnnotationIndex.from_list(
+                [self._get_annotation(img_id) for img_id in self.ids],
+                ["boxes", "labels", "is_difficult"])
+            index.save(cache_file, key)
+        return index
 
     def __getitem__(self, index):
         img_id, image, boxes, labels, height, width, is_difficult, ori_boxes = self._getitem(
@@ -115,7 +139,9 @@ class VOCDataset(object):
 
     def get_annotation(self, index):
         image_id = self.ids[index]
-        return image_id, self._get_annotation(image_id)
+        anno = self.annotations[index]
+        return image_id, (anno["boxes"].reshape(-1, 4).copy(), anno["labels"].copy(),
+                          anno["is_difficult"].copy())
 
     def __len__(self):
         return len(self.ids)
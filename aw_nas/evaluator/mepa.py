@@ -308,6 +308,9 @@ class MepaEvaluator(BaseEvaluator):  #pylint: disable=too-many-instance-attribut
             # only for rnn data
             bptt_steps=35,
             multiprocess=False,
+            # materialize the queues on deterministic splits into tensors,
+            # True or "shared" (put the cached tensors into shared memory)
+            cache_eval_tensors=False,
             schedule_cfg=None):
         super(MepaEvaluator,
               self).__init__(dataset, weights_manager, objective, rollout_type,
@@ -408,6 +411,7 @@ class MepaEvaluator(BaseEvaluator):  #pylint: disable=too-many-instance-attribut
         self.workers_per_queue = workers_per_queue
         self.shuffle_data_before_split = shuffle_data_before_split
         self.shuffle_indice_file = shuffle_indice_file
+        self.cache_eval_tensors = cache_eval_tensors
         self.shuffle_data_before_split_seed = shuffle_data_before_split_seed
         self.use_maml_plus = use_maml_plus
         self.high_order = high_order
@@ -1375,7 +1379,8 @@ class MepaEvaluator(BaseEvaluator):  #pylint: disable=too-many-instance-attribut
                                         shuffle_seed=self.shuffle_data_before_split_seed,
                                         num_workers=self.workers_per_queue,
                                         multiprocess=self.multiprocess,
-                                        shuffle_indice_file=self.shuffle_indice_file)
+                                        shuffle_indice_file=self.shuffle_indice_file,
+                                        cache_eval_tensors=self.cache_eval_tensors)
 
         if mepa_as_surrogate:
             # use mepa data queue as surrogate data queue
@@ -1452,8 +1457,9 @@ class MepaEvaluator(BaseEvaluator):  #pylint: disable=too-many-instance-attribut
             del state["dataset"]
             # dataset can be too large, by default we do not serialize it
 
-            # TODO: load large dataset from disk for multiple times is time- and memory-consuming,
-            # can we use multiprocessing shared memory for datasets?
+        # NOTE: to avoid loading large datasets from disk in every worker process,
+        # `dataset.share_memory()` is called before the evaluator is sent to the workers
+        # (see `MultiprocessDispatcher`), then the workers attach to the shared memory.
 
         for attr_name in self._dataset_related_attrs + self._criterions_related_attrs:
             if attr_name in state:
@@ -54,6 +54,7 @@ class CNNFinalTrainer(FinalTrainer): #pylint: disable=too-many-instance-attribut
                  eval_no_grad=True,
                  eval_every=1,
                  calib_bn_setup=False, # for OFA final model
+                 cache_eval_tensors=False,
                  schedule_cfg=None):
         super(CNNFinalTrainer, self).__init__(schedule_cfg)
 
@@ -104,12 +105,31 @@ class CNNFinalTrainer(FinalTrainer): #pylint: disable=too-many-instance-attribut
                 _splits["test"], batch_size=batch_size, pin_memory=True,
                 num_workers=workers_per_queue, shuffle=False, **test_kwargs)
         else:
-            self.train_queue = torch.utils.data.DataLoader(
-                _splits["train"], batch_size=batch_size, pin_memory=True,
-                num_workers=workers_per_queue, shuffle=True, **train_kwargs)
-            self.valid_queue = torch.utils.data.DataLoader(
-                _splits["test"], batch_size=batch_size, pin_memory=True,
-                num_workers=workers_per_queue, shuffle=False, **test_kwargs)
+            batch_augmentations = self.dataset.batch_augmentations()
+            if "train" in batch_augmentations and "collate_fn" not in train_kwargs:
+                # augment the resident raw images batch by batch
+                train_data, train_targets, train_transform = batch_augmentations["train"]
+                self.train_queue = utils.TensorBatchQueue(
+                    train_data, train_targets, batch_size=batch_size, shuffle=True,
+                    transform=train_transform)
+            else:
+                self.train_queue = torch.utils.data.DataLoader(
+                    _splits["train"], batch_size=batch_size, pin_memory=True,
+                    num_workers=workers_per_queue, shuffle=True, **train_kwargs)
+            if cache_eval_tensors and "test" in self.dataset.deterministic_splits() \
+               and "collate_fn" not in test_kwargs:
+                self.valid_queue = utils.TensorBatchQueue(
+                    *utils.cache_dataset_tensors(_splits["test"], batch_size=batch_size,
+                                                 num_workers=workers_per_queue),
+                    batch_size=batch_size)
+            elif "test" in batch_augmentations and "collate_fn" not in test_kwargs:
+                test_data, test_targets, test_transform = batch_augmentations["test"]
+                self.valid_queue = utils.TensorBatchQueue(
+                    test_data, test_targets, batch_size=batch_size, transform=test_transform)
+            else:
+                self.valid_queue = torch.utils.data.DataLoader(
+                    _splits["test"], batch_size=batch_size, pin_memory=True,
+                    num_workers=workers_per_queue, shuffle=False, **test_kwargs)
 
         if self.calib_bn_setup:
             self.model = calib_bn(self.model, self.train_queue)
@@ -46,9 +46,13 @@ class RNNFinalTrainer(FinalTrainer):
 
         _splits = self.dataset.splits()
 
-        self.train_data = utils.batchify_sentences(_splits["ori_train"], batch_size)
-        self.valid_data = utils.batchify_sentences(_splits["ori_valid"], eval_batch_size)
-        self.test_data = utils.batchify_sentences(_splits["test"], eval_batch_size)
+        # `(input, target)` BPTT windows are strided views over the token tensors
+        self.train_data = utils.BPTTBatchQueue(_splits["ori_train"], batch_size, bptt_steps,
+                                               random_bptt=random_bptt, device=self.device)
+        self.valid_data = utils.BPTTBatchQueue(_splits["ori_valid"], eval_batch_size,
+                                               bptt_steps, device=self.device)
+        self.test_data = utils.BPTTBatchQueue(_splits["test"], eval_batch_size,
+                                              bptt_steps, device=self.device)
 
         self._criterion = nn.CrossEntropyLoss().to(self.device)
         if self.model is not None:
@@ -150,7 +154,7 @@ class RNNFinalTrainer(FinalTrainer):
             self._scheduler_step()
             self.logger.info("epoch %d lr %e", epoch, self.optimizer.param_groups[0]["lr"])
 
-            train_obj, train_loss = self.train_epoch(*self.train_data, bptt_steps=self.bptt_steps)
+            train_obj, train_loss = self.train_epoch(self.train_data, bptt_steps=self.bptt_steps)
             self.logger.info("train: perp %.3f; bpc %.3f ; loss %.3f ; loss with reg %.3f",
                              np.exp(train_obj), train_obj / np.log(2), train_obj, train_loss)
 
@@ -171,7 +175,7 @@ class RNNFinalTrainer(FinalTrainer):
                 backup[prm] = prm.data.clone()
                 prm.data = self.optimizer.state[prm]["ax"].clone()
 
-            valid_obj = self.evaluate_epoch(*self.valid_data, bptt_steps=self.bptt_steps)
+            valid_obj = self.evaluate_epoch(self.valid_data, bptt_steps=self.bptt_steps)
             self.logger.info("valid(averaged): perp %.3f ; bpc %.3f ; loss %.3f",
                              np.exp(valid_obj), valid_obj/np.log(2), valid_obj)
 
@@ -185,7 +189,7 @@ class RNNFinalTrainer(FinalTrainer):
                 prm.data = backup[prm].clone()
         else:
             # SGD
-            valid_obj = self.evaluate_epoch(*self.valid_data, bptt_steps=self.bptt_steps)
+            valid_obj = self.evaluate_epoch(self.valid_data, bptt_steps=self.bptt_steps)
             self.logger.info("valid: perp %.3f ; bpc %.3f ; loss %.3f",
                              np.exp(valid_obj), valid_obj/np.log(2), valid_obj)
 
@@ -212,58 +216,44 @@ class RNNFinalTrainer(FinalTrainer):
     def evaluate_split(self, split):
         assert split in {"train", "valid", "test"}
         data = getattr(self, split+"_data")
-        obj = self.evaluate_epoch(data[0], data[1], self.bptt_steps)
+        obj = self.evaluate_epoch(data, self.bptt_steps)
         self.logger.info("eval on split %s: perp %.3f ; bpc %.3f ; loss %.3f",
                          split, np.exp(obj), obj/np.log(2), obj)
         return obj
 
-    def evaluate_epoch(self, data, targets, bptt_steps):
+    def evaluate_epoch(self, queue, bptt_steps):
         expect(self._is_setup, "trainer.setup should be called first")
-        batch_size = data.shape[1]
+        batch_size = queue.batch_size
         self.model.eval()
         objs = utils.AverageMeter()
         hiddens = self.model.init_hidden(batch_size)
-        for i in range(0, data.size(0), bptt_steps):
-            seq_len = min(bptt_steps, len(data)-i)
-            inp, targ = data[i:i+seq_len], targets[i:i+seq_len]
+        for i in range(0, queue.num_steps, bptt_steps):
+            seq_len = min(bptt_steps, queue.num_steps - i)
+            inp, targ = queue.window(i, seq_len)
             logits, _, _, hiddens = self.parallel_model(inp, hiddens)
             objs.update(self._criterion(logits.view(-1, logits.size(-1)),
-                                        targ.view(-1)).item(),
+                                        targ.reshape(-1)).item(),
                         seq_len)
         return objs.avg
 
-    def train_epoch(self, data, targets, bptt_steps):
+    def train_epoch(self, queue, bptt_steps):
         expect(self._is_setup, "trainer.setup should be called first")
-        batch_size = data.shape[1]
-        num_total_steps = data.shape[0]
+        batch_size = queue.batch_size
         self.model.train()
         objs = utils.AverageMeter()
         losses = utils.AverageMeter()
 
         hiddens = self.model.init_hidden(batch_size)
 
-        if self.random_bptt:
-            # random sequece lengths
-            seq_lens = []
-            i = 0
-            while i < data.size(0):
-                mean_ = bptt_steps if np.random.random() < 0.95 else bptt_steps / 2
-                seq_len = min(max(5, int(np.random.normal(mean_, 5))), bptt_steps + 20)
-                seq_lens.append(seq_len)
-                i += seq_len
-            seq_lens[-1] -= i - data.size(0)
-            num_total_batches = len(seq_lens)
-        else:
-            # fixed sequence length == bptt_steps
-            num_total_batches = int(np.ceil(data.size(0) / bptt_steps))
-            seq_lens = [bptt_steps] * num_total_batches
-            seq_lens[-1] = num_total_steps - bptt_steps * (num_total_batches-1)
+        # random sequence lengths if `random_bptt`, else fixed sequence length == bptt_steps
+        seq_lens = queue.sample_seq_lens()
+        num_total_batches = len(seq_lens)
 
         lr_bak = self.optimizer.param_groups[0]["lr"]
         i = 0
         for batch in range(1, num_total_batches+1):
             seq_len = seq_lens[batch-1]
-            inp, targ = data[i:i+seq_len], targets[i:i+seq_len]
+            inp, targ = queue.window(i, seq_len)
 
             # linear adjusting learning rate
             self.optimizer.param_groups[0]["lr"] = lr_bak * seq_len / bptt_steps
@@ -271,7 +261,7 @@ class RNNFinalTrainer(FinalTrainer):
 
             logits, raw_outs, outs, hiddens = self.parallel_model(inp, hiddens)
 
-            raw_loss = self._criterion(logits.view(-1, logits.size(-1)), targ.view(-1))
+            raw_loss = self._criterion(logits.view(-1, logits.size(-1)), targ.reshape(-1))
 
             loss = raw_loss
             # Activiation Regularization
@@ -42,6 +42,9 @@ class BaseHardwarePerformanceModel(Component):
         self.mixin_search_space = mixin_search_space
         self.perf_name = perf_name
         self.preprocessor = Preprocessor(preprocessors)
+        # bumped whenever the model is trained or loaded, so that the cached predictions
+        # of this model can be invalidated
+        self.version = 0
 
     def train(self, prof_nets):
         """
@@ -51,7 +54,9 @@ class BaseHardwarePerformanceModel(Component):
         """
         processed_args = self.preprocessor(
             prof_nets, is_training=True, performance=self.perf_name)
-        return self._train(processed_args)
+        res = self._train(processed_args)
+        self.version += 1
+        return res
 
     @abc.abstractmethod
     def _train(self, args):
@@ -61,6 +66,17 @@ class BaseHardwarePerformanceModel(Component):
     def predict(self, rollout):
         pass
 
+    def predict_many(self, rollouts):
+        """
+        Predict the performances of multiple rollouts.
+        Subclasses should override this method to featurize all rollouts at once and
+        call the underlying model only once.
+
+        Returns:
+            a list of the predicted performance of each rollout
+        """
+        return [self.predict(rollout) for rollout in rollouts]
+
     @abc.abstractmethod
     def save(self, path):
         pass
@@ -96,13 +112,30 @@ class MixinProfilingSearchSpace(SearchSpace):
 
 class Preprocessor(Component):
     REGISTRY = "preprocessor_for_profiling"
+    # preprocessors that are only applied to the training data (e.g., anomaly removal),
+    # and skipped by `transform_one`/`transform_many`
+    TRAINING_ONLY = False
 
     def __init__(self, preprocessors, schedule_cfg=None):
         super(Preprocessor, self).__init__(schedule_cfg)
         self.preprocessors = preprocessors
+        # the pipeline is built only once
+        self._pipeline = [Preprocessor.get_class_(prep)() for prep in preprocessors or []]
+        self._inference_pipeline = [prep for prep in self._pipeline if not prep.TRAINING_ONLY]
 
     def __call__(self, unpreprocessed, **kwargs):
-        preps = [Preprocessor.get_class_(prep)() for prep in self.preprocessors]
-        for prep in preps:
+        for prep in self._pipeline:
             unpreprocessed = prep(unpreprocessed, **kwargs)
         return unpreprocessed
+
+    def transform_many(self, prof_nets, **kwargs):
+        """
+        Preprocess the profiling nets for inference, the training-only preprocessors are skipped.
+        """
+        kwargs["is_training"] = False
+        for prep in self._inference_pipeline:
+            prof_nets = prep(prof_nets, **kwargs)
+        return prof_nets
+
+    def transform_one(self, prof_net, **kwargs):
+        return self.transform_many([prof_net], **kwargs)
@@ -1,6 +1,7 @@
 # -*- coding: utf-8 -*-
 
 import logging
+import copy
 import os
 import pickle
 import re
@@ -19,7 +20,7 @@ from aw_nas.utils.exception import expect, ConfigException
 from aw_nas.hardware.base import BaseHardwareCompiler
 from aw_nas.utils.log import LEVEL as _LEVEL
 from aw_nas.rollout.general import GeneralSearchSpace
-from aw_nas.hardware.utils import Prim
+from aw_nas.hardware.utils import Prim, load_yaml
 
 try:
     from aw_nas.utils.pytorch2caffe import pytorch_to_caffe
@@ -306,6 +307,9 @@ class DPUCompiler(BaseHardwareCompiler):
                     prim_to_ops.update(_dict)
                     self.logger.info("Unpickled file: {pkl}".format(pkl=pkl))
 
+        # the profiling primitives are shared by all the result files, only load them once
+        prof_prims = load_yaml(prof_prim_file)
+
         # meta info: prim_to_ops is saved when generate profiling final-yaml folder for each net
         for _dir in os.listdir(prof_result_dir):
             cur_dir = os.path.join(prof_result_dir, _dir)
@@ -314,9 +318,9 @@ class DPUCompiler(BaseHardwareCompiler):
                 os.makedirs(parsed_dir, exist_ok=True)
                 for i, _file in enumerate(os.listdir(cur_dir)):
                     perf_yaml = self.parse_one_network(
-                        os.path.join(cur_dir, _file), prof_prim_file, prim_to_ops)
+                        os.path.join(cur_dir, _file), prof_prims, prim_to_ops)
                     if perf_yaml:
-                        with open(os.path.join(parsed_dir, i + ".yaml"),
+                        with open(os.path.join(parsed_dir, "{}.yaml".format(i)),
                                 "w") as fw:
                             yaml.safe_dump(perf_yaml, fw)
     
@@ -362,8 +366,11 @@ class DPUCompiler(BaseHardwareCompiler):
         # mapping name of op to performances
         # {conv2: Perf(latency=12., memory: 2048), ...}
 
-        with open(prof_prim_file, "r") as fr:
-            prof_prim = yaml.load(fr)
+        if isinstance(prof_prim_file, str):
+            prof_prim = load_yaml(prof_prim_file)
+        else:
+            # already loaded primitives, copy them since the perfs are written into them
+            prof_prim = copy.deepcopy(prof_prim_file)
 
         nets_prim_to_perf = []
         for prim in prof_prim:
@@ -1,7 +1,10 @@
 # -*- coding: utf-8 -*-
 import copy
 import inspect
+import itertools
 from inspect import signature
+import json
+import multiprocessing
 import os
 import pickle
 from collections import namedtuple
@@ -38,37 +41,74 @@ Prim_ = namedtuple(
 )
 
 
-class Prim(Prim_):
-    def __new__(cls, prim_type, spatial_size, C, C_out, stride, affine, **kwargs):
-        position_params = ["C", "C_out", "stride", "affine"]
-        prim_constructor = get_op(prim_type)
-        prim_sig = signature(prim_constructor)
-        params = prim_sig.parameters
+# prim_type -> (primitive factory, default kwargs, required kwargs names, all parameter names,
+#              canonical prim -> interned prim, raw construction arguments -> interned prim)
+_PRIM_SIGNATURES = {}
+_POSITION_PARAMS = ("C", "C_out", "stride", "affine")
+
+
+def _get_prim_signature(prim_type):
+    """
+    Return the cached signature information of the primitive factory.
+    The cache is invalidated when the factory is re-registered by `register_primitive`.
+    """
+    prim_constructor = get_op(prim_type)
+    cached = _PRIM_SIGNATURES.get(prim_type)
+    if cached is None or cached[0] is not prim_constructor:
+        params = signature(prim_constructor).parameters
+        defaults = {}
+        required = []
         for name, param in params.items():
-            if param.default != inspect._empty:
-                if name in position_params:
-                    continue
-                if kwargs.get(name) is None:
-                    kwargs[name] = param.default
+            if name in _POSITION_PARAMS:
+                continue
+            if param.default is not inspect._empty:
+                defaults[name] = param.default
             else:
-                assert name in position_params or name in kwargs, \
-                    "{} is a non-default parameter which should be provided explicitly.".format(
-                    name)
+                required.append(name)
+        cached = (prim_constructor, defaults, required, set(params.keys()), {}, {})
+        _PRIM_SIGNATURES[prim_type] = cached
+    return cached
+
+
+class Prim(Prim_):
+    """
+    Equal primitives are interned into one canonical instance with a precomputed hash,
+    so looking up a primitive in a table is mostly an identity check.
+    """
+
+    def __new__(cls, prim_type, spatial_size, C, C_out, stride, affine, **kwargs):
+        _, defaults, required, param_names, canonicals, interned = _get_prim_signature(prim_type)
+        try:
+            raw_key = (cls, spatial_size, C, C_out, stride, affine, tuple(sorted(kwargs.items())))
+            prim = interned.get(raw_key)
+        except TypeError:
+            # unhashable kwargs, do not intern
+            raw_key = prim = None
+        if prim is not None:
+            return prim
+
+        for name in required:
+            assert name in kwargs, \
+                "{} is a non-default parameter which should be provided explicitly.".format(
+                name)
+        for name, default in defaults.items():
+            if kwargs.get(name) is None:
+                kwargs[name] = default
 
         kwargs = {k: v for k, v in kwargs.items() if v is not None}
 
-        assert set(params.keys()) == set(
-            position_params + list(kwargs.keys())),\
+        assert param_names == set(
+            _POSITION_PARAMS + tuple(kwargs.keys())),\
             ("The passed parameters are different from the formal parameter list of primitive "
              "type `{}`, expected {}, got {}").format(
                  prim_type,
-                 str(params.keys()),
-                 str(position_params + list(kwargs.keys()))
+                 str(param_names),
+                 str(list(_POSITION_PARAMS) + list(kwargs.keys()))
              )
 
         kwargs = tuple(
             sorted([(k, v) for k, v in kwargs.items()]))
-        return super(Prim, cls).__new__(
+        prim = super(Prim, cls).__new__(
             cls,
             prim_type,
             int(spatial_size),
@@ -78,6 +118,21 @@ class Prim(Prim_):
             affine,
             kwargs,
         )
+        if raw_key is not None:
+            prim._hash = tuple.__hash__(prim)
+            prim = canonicals.setdefault(prim, prim)
+            interned[raw_key] = prim
+        return prim
+
+    def __hash__(self):
+        try:
+            return self._hash
+        except AttributeError:
+            return tuple.__hash__(self)
+
+    def __getstate__(self):
+        # the hash of strings differs between processes, do not pickle `_hash`
+        return None
 
     def _asdict(self):
         origin_dict = dict(super(Prim, self)._asdict())
@@ -271,6 +326,7 @@ class FlattenPreprocessor(Preprocessor):
 
 class RemoveAnomalyPreprocessor(Preprocessor):
     NAME = "remove_anomaly"
+    TRAINING_ONLY = True
 
     def __init__(self, preprocessors=None, schedule_cfg=None):
         super().__init__(preprocessors, schedule_cfg)
@@ -280,26 +336,20 @@ class RemoveAnomalyPreprocessor(Preprocessor):
         if not is_training:
             for net in unpreprocessed:
                 yield net
+            return
         tolerance_std = kwargs.get("tolerance_std", 0.1)
         for prof_net in unpreprocessed:
             # FIXME: assert every primitive has the performance keys.
             perf_keys = prof_net[0]["primitives"][0]["performances"].keys()
-            block_sum_avg = {
-                k: np.mean([
-                    ith_prof["block_sum_{}".format(k)] for ith_prof in prof_net
-                ])
-                for k in perf_keys
-            }
-            filtered_net = []
-            for ith_prof in prof_net:
-                for k in perf_keys:
-                    if abs(ith_prof["block_sum_{}".format(k)] -
-                           block_sum_avg[k]
-                           ) > block_sum_avg[k] * tolerance_std:
-                        break
-                else:
-                    filtered_net += [ith_prof]
-            yield filtered_net
+            # (num_profs, num_perf_keys)
+            block_sums = np.array([
+                [ith_prof["block_sum_{}".format(k)] for k in perf_keys]
+                for ith_prof in prof_net
+            ]).reshape(len(prof_net), len(perf_keys))
+            block_sum_avg = block_sums.mean(axis=0)
+            keep = ~(np.abs(block_sums - block_sum_avg) >
+                     block_sum_avg * tolerance_std).any(axis=1)
+            yield [ith_prof for ith_prof, k in zip(prof_net, keep) if k]
 
 
 class ExtractSumFeaturesPreprocessor(Preprocessor):
@@ -358,6 +408,127 @@ class ExtractLSTMFeaturesPreProcessor(Preprocessor):
         
 
 
+def _to_hashable(value):
+    if isinstance(value, list):
+        return tuple(_to_hashable(v) for v in value)
+    return value
+
+
+class PrimTable(object):
+    """
+    A compiled, array-backed table of primitive performances.
+
+    Each field of the primitives is dictionary-encoded into small integers, and the codes of
+    a primitive are packed into one int64 key. The keys are kept sorted, so a list of
+    primitives is looked up by a single `np.searchsorted` and a vectorized gather.
+    The table can be saved as a compact `.npz` file, and loading it does not construct any
+    `Prim` object.
+    """
+
+    def __init__(self, vocabs, keys, values):
+        # vocabs: a list (one per Prim field) of lists of field values
+        self.vocabs = [[_to_hashable(v) for v in vocab] for vocab in vocabs]
+        self.keys = np.asarray(keys, dtype=np.int64)
+        self.values = np.asarray(values, dtype=np.float64)
+        self._codes = [{v: i for i, v in enumerate(vocab)} for vocab in self.vocabs]
+        bits = [max((len(vocab) - 1).bit_length(), 1) for vocab in self.vocabs]
+        assert sum(bits) < 64, "Too many distinct field values to pack the keys into int64"
+        self._shifts = np.cumsum([0] + bits[:-1]).astype(np.int64)
+        self._masks = [(1 << b) - 1 for b in bits]
+
+    @classmethod
+    def from_dict(cls, table):
+        prims = list(table.keys())
+        vocabs = [sorted(set(field), key=repr) for field in zip(*prims)] \
+                 if prims else [[] for _ in Prim._fields]
+        compiled = cls(vocabs, [], [])
+        keys = compiled.encode(prims)
+        order = np.argsort(keys)
+        compiled.keys = keys[order]
+        compiled.values = np.array([table[p] for p in prims], dtype=np.float64)[order]
+        return compiled
+
+    def encode(self, primitives):
+        """
+        Encode the primitives into packed int64 keys, -1 for primitives with unknown fields.
+        """
+        codes = np.array(
+            [[code.get(v, -1) for code, v in zip(self._codes, prim)] for prim in primitives],
+            dtype=np.int64).reshape(-1, len(self._codes))
+        keys = (codes << self._shifts).sum(axis=1)
+        keys[(codes < 0).any(axis=1)] = -1
+        return keys
+
+    def lookup(self, primitives):
+        """
+        Returns:
+            values (np.ndarray): the performances, NaN for primitives not in the table
+            found (np.ndarray): the boolean mask of primitives found in the table
+        """
+        keys = self.encode(primitives)
+        if not len(self.keys):
+            return np.full(len(keys), np.nan), np.zeros(len(keys), dtype=bool)
+        idxes = np.minimum(np.searchsorted(self.keys, keys), len(self.keys) - 1)
+        found = self.keys[idxes] == keys
+        return np.where(found, self.values[idxes], np.nan), found
+
+    def to_dict(self):
+        table = {}
+        for key, value in zip(self.keys.tolist(), self.values.tolist()):
+            prim = {field: vocab[(key >> int(shift)) & mask] for field, vocab, shift, mask
+                    in zip(Prim._fields, self.vocabs, self._shifts, self._masks)}
+            prim.update(prim.pop("kwargs"))
+            table[Prim(**prim)] = value
+        return table
+
+    def __len__(self):
+        return len(self.keys)
+
+    def __getitem__(self, prim):
+        values, found = self.lookup([prim])
+        if not found[0]:
+            raise KeyError(prim)
+        return float(values[0])
+
+    def state_dict(self):
+        return {
+            "vocabs": np.array(json.dumps(self.vocabs)),
+            "keys": self.keys,
+            "values": self.values
+        }
+
+    @classmethod
+    def from_state_dict(cls, state_dict):
+        return cls(json.loads(str(state_dict["vocabs"])), state_dict["keys"], state_dict["values"])
+
+    def save(self, path):
+        np.savez(path, **self.state_dict())
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as state_dict:
+            return cls.from_state_dict(state_dict)
+
+
+def load_table(path):
+    """
+    Load the primitive performance table saved by the table-based hardware models,
+    either a `.npz` table, or a pickled model file (the legacy list of (prim dict, perf)
+    pairs is also supported).
+    """
+    if path.endswith(".npz"):
+        return PrimTable.load(path)
+    with open(path, "rb") as fr:
+        return _unpickle_table(pickle.load(fr))
+
+
+def _unpickle_table(state):
+    if "compiled_table" in state:
+        return PrimTable.from_state_dict(state["compiled_table"])
+    # legacy format
+    return PrimTable.from_dict({Prim(**k): v for k, v in state["table"]})
+
+
 class TableBasedModel(BaseHardwarePerformanceModel):
     NAME = "table"
 
@@ -380,43 +551,98 @@ class TableBasedModel(BaseHardwarePerformanceModel):
 
         self._table = {}
 
+    @property
+    def _table(self):
+        if self._table_dict is None:
+            self._table_dict = self._compiled_table.to_dict()
+        return self._table_dict
+
+    @_table.setter
+    def _table(self, table):
+        self._table_dict = table
+        self._compiled_table = None
+
+    @property
+    def compiled_table(self):
+        if self._compiled_table is None:
+            self._compiled_table = PrimTable.from_dict(self._table_dict)
+        return self._compiled_table
+
+    @compiled_table.setter
+    def compiled_table(self, compiled_table):
+        self._compiled_table = compiled_table
+        # the dict table is only materialized when needed
+        self._table_dict = None
+
     def _train(self, args):
         prof_nets = args
+        table = {}
         for net in prof_nets:
             for prim in net.get("primitives", []):
                 perf = prim.pop("performances")[self.perf_name]
                 prim = Prim(**prim)
-                self._table.setdefault(prim, []).append(perf)
+                table.setdefault(prim, []).append(perf)
 
-        self._table = {k: np.mean(v) for k, v in self._table.items()}
+        self._table = {k: np.mean(v) for k, v in table.items()}
+
+    def _lookup_perfs(self, primitives):
+        perfs, found = self.compiled_table.lookup(primitives)
+        for prim, prim_found in zip(primitives, found):
+            if not prim_found:
+                self.logger.warn(
+                    "primitive %s is not found in the table, return default value 0.",
+                    prim)
+        return np.where(found, perfs, 0.).tolist()
 
     def predict(self, rollout, assemble_fn=sum):
         # return random.random()
         primitives = self.mixin_search_space.rollout_to_primitives(
             rollout, **self.prof_prims_cfg)
-        perfs = []
-        for prim in primitives:
-            perf = self._table.get(prim)
-            if perf is None:
-                self.logger.warn(
-                    "primitive %s is not found in the table, return default value 0.",
-                    prim)
-                perf = 0.
-            perfs += [perf]
-        return assemble_fn(perfs)
+        return assemble_fn(self._lookup_perfs(primitives))
+
+    def predict_many(self, rollouts, assemble_fn=sum):
+        primitives = [
+            self.mixin_search_space.rollout_to_primitives(rollout, **self.prof_prims_cfg)
+            for rollout in rollouts
+        ]
+        # look up the primitives of all the rollouts at once
+        perfs = self._lookup_perfs(list(itertools.chain(*primitives)))
+        offsets = np.cumsum([0] + [len(prims) for prims in primitives])
+        return [assemble_fn(perfs[start:end]) for start, end in zip(offsets[:-1], offsets[1:])]
+
+    def _extract_features(self, rollouts):
+        """
+        Look up the primitive performances of all the rollouts in the table, and
+        run the preprocessors once to get the feature of every rollout.
+        """
+        primitives = [
+            self.mixin_search_space.rollout_to_primitives(rollout, **self.prof_prims_cfg)
+            for rollout in rollouts
+        ]
+        perfs = iter(self._lookup_perfs(list(itertools.chain(*primitives))))
+        prof_nets = []
+        for prims in primitives:
+            prims = [p._asdict() for p in prims]
+            for prim in prims:
+                prim["performances"] = {self.perf_name: next(perfs)}
+            prof_nets.append([{"primitives": prims}])
+        prof_nets, test_x = self.preprocessor.transform_many(
+            prof_nets, performance=self.perf_name)
+        return test_x
 
     def save(self, path):
-        pickled_table = [(k._asdict(), v) for k, v in self._table.items()]
+        if path.endswith(".npz"):
+            self.compiled_table.save(path)
+            return
         with open(path, "wb") as wf:
             pickle.dump(
                 {
-                    "table": pickled_table,
+                    "compiled_table": self.compiled_table.state_dict(),
                 }, wf)
 
     def load(self, path):
-        with open(path, "rb") as fr:
-            m = pickle.load(fr)
-        self._table = {Prim(**k): v for k, v in m["table"]}
+        self.compiled_table = load_table(path)
+        self.version += 1
 
 
 class RegressionModel(TableBasedModel):
@@ -447,30 +673,28 @@ class RegressionModel(TableBasedModel):
         return self.regression_model.fit(train_x, train_y)
 
     def predict(self, rollout):
-        primitives = self.mixin_search_space.rollout_to_primitives(
-            rollout, **self.prof_prims_cfg)
-        perfs = super().predict(rollout, assemble_fn=lambda x: x)
-        primitives = [p._asdict() for p in primitives]
-        for prim, perf in zip(primitives, perfs):
-            prim["performances"] = {self.perf_name: perf}
-        prof_nets = [[{"primitives": primitives}]]
-        prof_nets, test_x = self.preprocessor(
-            prof_nets, is_training=False, performance=self.perf_name)
-        return float(self.regression_model.predict(test_x)[0])
+        return self.predict_many([rollout])[0]
+
+    def predict_many(self, rollouts):
+        rollouts = list(rollouts)
+        if not rollouts:
+            return []
+        test_x = self._extract_features(rollouts)
+        return [float(y) for y in self.regression_model.predict(test_x)]
 
     def save(self, path):
-        pickled_table = [(k._asdict(), v) for k, v in self._table.items()]
         with open(path, "wb") as fw:
             pickle.dump(
                 {
-                    "table": pickled_table,
+                    "compiled_table": self.compiled_table.state_dict(),
                     "model": self.regression_model
                 }, fw)
 
     def load(self, path):
         with open(path, "rb") as fr:
             m = pickle.load(fr)
-        self._table = {Prim(**k): v for k, v in m["table"]}
+        self.compiled_table = _unpickle_table(m)
+        self.version += 1
         self.regression_model = m["model"]
 
 
@@ -509,30 +733,28 @@ class MLPModel(TableBasedModel):
         return self.mlp_model.fit(train_x, train_y)
 
     def predict(self, rollout):
-        primitives = self.mixin_search_space.rollout_to_primitives(
-            rollout, **self.prof_prims_cfg)
-        perfs = super().predict(rollout, assemble_fn=lambda x: x)
-        primitives = [p._asdict() for p in primitives]
-        for prim, perf in zip(primitives, perfs):
-            prim["performances"] = {self.perf_name: perf}
-        prof_nets = [[{"primitives": primitives}]]
-        prof_nets, test_x = self.preprocessor(
-            prof_nets, is_training=False, performance=self.perf_name)
-        return float(self.mlp_model.predict(test_x)[0])
+        return self.predict_many([rollout])[0]
+
+    def predict_many(self, rollouts):
+        rollouts = list(rollouts)
+        if not rollouts:
+            return []
+        test_x = self._extract_features(rollouts)
+        return [float(y) for y in self.mlp_model.predict(test_x)]
 
     def save(self, path):
-        pickled_table = [(k._asdict(), v) for k, v in self._table.items()]
         with open(path, "wb") as fw:
             pickle.dump(
                 {
-                    "table": pickled_table,
+                    "compiled_table": self.compiled_table.state_dict(),
                     "model": self.mlp_model
                 }, fw)
 
     def load(self, path):
         with open(path, "rb") as fr:
             m = pickle.load(fr)
-        self._table = {Prim(**k): v for k, v in m["table"]}
+        self.compiled_table = _unpickle_table(m)
+        self.version += 1
         self.mlp_model = m["model"]
 
 
@@ -614,43 +836,67 @@ class LSTMModel(TableBasedModel):
 
 
     def predict(self, rollout):
-        primitives = self.mixin_search_space.rollout_to_primitives(
-            rollout, **self.prof_prims_cfg)
-        perfs = super().predict(rollout, assemble_fn=lambda x: x)
-        primitives = [p._asdict() for p in primitives]
-        for prim, perf in zip(primitives, perfs):
-            prim["performances"] = {self.perf_name: perf}
-        prof_nets = [[{"primitives": primitives}]]
-        prof_nets, test_x = self.preprocessor(
-            prof_nets, is_training=False, performance=self.perf_name)
-        return float(self.lstm_model.predict(test_x)[0])
+        return self.predict_many([rollout])[0]
+
+    def predict_many(self, rollouts):
+        rollouts = list(rollouts)
+        if not rollouts:
+            return []
+        test_x = self._extract_features(rollouts)
+        return [float(y) for y in self.lstm_model.predict(test_x)]
 
     def save(self, path):
-        pickled_table = [(k._asdict(), v) for k, v in self._table.items()]
         with open(path, "wb") as fw:
             pickle.dump(
                 {
-                    "table": pickled_table,
+                    "compiled_table": self.compiled_table.state_dict(),
                     "model": self.lstm_model
                 }, fw)
 
     def load(self, path):
         with open(path, "rb") as fr:
             m = pickle.load(fr)
-        self._table = {Prim(**k): v for k, v in m["table"]}
+        self.compiled_table = _unpickle_table(m)
+        self.version += 1
         self.lstm_model = m["model"].to(self.device)
 
 
 
-def iterate(prof_prim_dir):
+# the C loader is much faster when libyaml is available
+_YAML_LOADER = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
+
+def load_yaml(fname):
+    with open(fname, "r") as fr:
+        try:
+            return yaml.load(fr, Loader=_YAML_LOADER)
+        except yaml.constructor.ConstructorError:
+            # python-specific tags (e.g., tuples dumped by `yaml.dump`)
+            fr.seek(0)
+            return yaml.load(fr, Loader=getattr(yaml, "FullLoader", yaml.Loader))
+
+
+def _load_prof_net(fnames):
+    return [load_yaml(fname) for fname in fnames]
+
+
+def iterate(prof_prim_dir, num_workers=0):
+    """
+    Iterate over the profiling results of every network under `prof_prim_dir`.
+    When `num_workers` > 0, the yaml files are loaded by a pool of processes.
+    """
+    prof_net_fnames = []
     for _dir in os.listdir(prof_prim_dir):
         cur_dir = os.path.join(prof_prim_dir, _dir)
         if not os.path.isdir(cur_dir):
             continue
-        prof_net = []
-        for f in os.listdir(cur_dir):
-            if not f.endswith("yaml"):
-                continue
-            with open(os.path.join(cur_dir, f), "r") as fr:
-                prof_net += [yaml.load(fr)]
-        yield prof_net
+        prof_net_fnames.append([
+            os.path.join(cur_dir, f) for f in os.listdir(cur_dir) if f.endswith("yaml")])
+
+    if num_workers > 0:
+        with multiprocessing.Pool(num_workers) as pool:
+            for prof_net in pool.imap(_load_prof_net, prof_net_fnames):
+                yield prof_net
+    else:
+        for fnames in prof_net_fnames:
+            yield _load_prof_net(fnames)
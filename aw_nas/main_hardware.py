@@ -200,7 +200,11 @@ def parse(hwobj_cfg_file, prof_result_dir, prof_prim_file, prim_to_ops_file,
 @click.option("--result-file",
               required=True,
               help="Save the hwobj model to RESULT_DIR")
-def genmodel(cfg_file, hwobj_cfg_file, prof_prim_dir, result_file):
+@click.option("--num-workers",
+              default=0,
+              type=int,
+              help="The number of processes to load the profiling results")
+def genmodel(cfg_file, hwobj_cfg_file, prof_prim_dir, result_file, num_workers):
     with open(cfg_file, "r") as ss_cfg_f:
         ss_cfg = yaml.load(ss_cfg_f)
     with open(hwobj_cfg_file, "r") as hw_cfg_f:
@@ -216,7 +220,7 @@ def genmodel(cfg_file, hwobj_cfg_file, prof_prim_dir, result_file):
        hw_cfg['hwperfmodel_type'], hw_cfg['hwperfmodel_cfg']
     )
 
-    prof_nets = iterate(prof_prim_dir)
+    prof_nets = iterate(prof_prim_dir, num_workers=num_workers)
     hwobj_model.train(prof_nets)
     hwobj_model.save(result_file)
     LOGGER.info("Saved the hardware obj model to %s", result_file)
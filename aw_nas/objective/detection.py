@@ -1,5 +1,9 @@
 # -*- coding: utf-8 -*-
+import hashlib
 import os
+from collections import OrderedDict
+
+import numpy as np
 import torch
 
 from aw_nas.final.base import FinalModel
@@ -26,6 +30,7 @@ class DetectionObjective(BaseObjective):
                  soft_losses_cfg={},
                  post_processing_cfg={},
                  metrics_cfg={},
+                 target_cache_size=16,
                  schedule_cfg=None):
         super(DetectionObjective, self).__init__(search_space,
                                                  schedule_cfg=schedule_cfg)
@@ -77,7 +82,9 @@ class DetectionObjective(BaseObjective):
             self.soft_losses = [Losses.get_class_(cfg["type"])(**cfg["cfg"]) for cfg in losses_cfg]
 
         self.all_boxes = [{} for _ in range(self.num_classes)]
-        self.cache = []
+        # (annotations digest, feature map sizes) -> matched targets
+        self.target_cache_size = target_cache_size
+        self.cache = OrderedDict()
 
     @classmethod
     def supported_data_types(cls):
@@ -87,40 +94,41 @@ class DetectionObjective(BaseObjective):
         super(DetectionObjective, self).on_epoch_start(epoch)
         self.search_space.on_epoch_start(epoch)
 
+    @staticmethod
+    def _annotations_digest(annotations):
+        digest = hashlib.sha1()
+        for anno in annotations:
+            for name in ("boxes", "labels"):
+                value = anno[name]
+                if isinstance(value, torch.Tensor):
+                    value = value.detach().cpu().numpy()
+                digest.update(np.ascontiguousarray(value).tobytes())
+            digest.update(str((anno["image_id"], tuple(anno["shape"]))).encode())
+        return digest.hexdigest()
+
     def batch_transform(self, inputs, outputs, annotations):
         """
         annotations: [-1, 4 + 1 + 1 + 2] boxes + labels + ids + shapes
         """
         features, _, _ = outputs
-        feature_maps = [ft.shape[-2:] for ft in features]
-        for _id, cache in self.cache:
-            if _id == hash(str(annotations) + str(feature_maps)):
-                return cache
+        feature_maps = [tuple(ft.shape[-2:]) for ft in features]
+        key = (self._annotations_digest(annotations), tuple(feature_maps))
+        if key in self.cache:
+            self.cache.move_to_end(key)
+            return self.cache[key]
         device = inputs.device
-        img_shape = inputs.shape[-1]
-        batch_size = inputs.shape[0]
-        anchors = self.anchors(feature_maps).to(device)
-        num_anchors = anchors.shape[0]
-        location_t = torch.zeros([batch_size, num_anchors, 4])
-        confidence_t = torch.zeros([batch_size, num_anchors])
-
-        shapes = []
-        for i, anno in enumerate(annotations):
-            boxes = anno["boxes"]
-            labels = anno["labels"]
-            height, width = anno["shape"]
-            _id = anno["image_id"]
-            boxes = boxes.to(device)
-            labels = labels.to(device)
-            conf_t, loc_t = self.target_transform(boxes, labels, anchors)
-            location_t[i] = loc_t
-            confidence_t[i] = conf_t
-            shapes.append([_id, height, width])
-
-        cache = confidence_t.long().to(device), location_t.to(device), shapes
-        if len(self.cache) >= 2:
-            del self.cache[0]
-        self.cache.append((hash(str(annotations) + str(feature_maps)), cache))
+        anchors = self.anchors(feature_maps, device)
+
+        confidence_t, location_t = self.target_transform.match_batch(
+            [anno["boxes"].to(device) for anno in annotations],
+            [anno["labels"].to(device) for anno in annotations],
+            anchors)
+        shapes = [[anno["image_id"], *anno["shape"]] for anno in annotations]
+
+        cache = confidence_t.long().to(device), location_t.float().to(device), shapes
+        self.cache[key] = cache
+        if len(self.cache) > self.target_cache_size:
+            self.cache.popitem(last=False)
         return cache
 
     def perf_names(self):
@@ -148,20 +156,25 @@ class DetectionObjective(BaseObjective):
         # to method `evaluate_detections`
         detections = self.predictor(*outputs)
         self.metrics.target_to_gt_recs(annotations)
+        keys, dets, scales = [], [], []
         for batch_id, anno in enumerate(annotations):
             _id = anno["image_id"]
             h, w = anno["shape"]
             for j in range(self.num_classes):
-                dets = detections[batch_id][j]
-                if len(dets) == 0:
+                if len(detections[batch_id][j]) == 0:
                     continue
-                boxes = dets[:, :4]
-                boxes[:, 0::2] *= w
-                boxes[:, 1::2] *= h
-                scores = dets[:, 4].reshape(-1, 1)
-                cls_dets = torch.cat((boxes, scores),
-                                     dim=1).cpu().detach().numpy()
-                self.all_boxes[j][_id] = cls_dets
+                keys.append((j, _id))
+                dets.append(detections[batch_id][j])
+                scales.append([float(w), float(h), float(w), float(h), 1.])
+        if not dets:
+            return [0.]
+        # scale the boxes of all the images, and move them to numpy at once
+        counts = [len(cls_dets) for cls_dets in dets]
+        scales = torch.tensor(scales, dtype=dets[0].dtype, device=dets[0].device)
+        dets = (torch.cat(dets) * torch.repeat_interleave(
+            scales, torch.tensor(counts, device=scales.device), dim=0)).detach().cpu().numpy()
+        for (j, _id), cls_dets in zip(keys, np.split(dets, np.cumsum(counts)[:-1])):
+            self.all_boxes[j][_id] = cls_dets
         return [0.]
 
     def get_perfs(self, inputs, outputs, annotations, cand_net):
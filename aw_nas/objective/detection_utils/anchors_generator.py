@@ -1,5 +1,6 @@
+from collections import OrderedDict
 from math import sqrt
-from itertools import product
+
 import numpy as np
 import torch
 
@@ -15,6 +16,7 @@ class SSDAnchorsGenerator(AnchorsGenerator):
                  aspect_ratios=[[2], [2, 3], [2, 3], [2, 3], [2], [2]],
                  scales=[0.15, 0.3, 0.45, 0.6, 0.75, 0.9, 1.05],
                  clip=True,
+                 cache_size=32,
                  schedule_cfg=None):
 
         super(SSDAnchorsGenerator, self).__init__(schedule_cfg)
@@ -23,33 +25,56 @@ class SSDAnchorsGenerator(AnchorsGenerator):
         self.clip = clip
         self.scales = scales
 
-        self.anchors_boxes = {}
+        # (feature_maps, device) -> anchors, LRU
+        self.cache_size = cache_size
+        self.anchors_boxes = OrderedDict()
 
-    def __call__(self, feature_maps):
-        feature_maps = tuple(feature_maps)
-        if feature_maps in self.anchors_boxes:
-            return self.anchors_boxes[feature_maps]
+    def _anchor_sizes(self, k):
+        """
+        The (width, height) of the anchors at every location of the k-th feature map.
+        """
+        s_k = self.scales[k]
+        s_k_prime = sqrt(s_k * self.scales[k + 1])
+        sizes = [(s_k, s_k), (s_k_prime, s_k_prime)]
+        for ar in self.aspect_ratios[k]:
+            if isinstance(ar, int):
+                ar_sqrt = sqrt(ar)
+                sizes += [(s_k * ar_sqrt, s_k / ar_sqrt), (s_k / ar_sqrt, s_k * ar_sqrt)]
+            elif isinstance(ar, list):
+                sizes += [(s_k * ar[0], s_k * ar[1])]
+        return np.array(sizes, dtype=np.float64)
 
+    def _generate(self, feature_maps):
         mean = []
-        steps = [(float(1 / f[0]), float(1 / f[1])) for f in feature_maps]
-        offset = [(step[0] * 0.5, step[1] * 0.5) for step in steps]
-        for k, f in enumerate(feature_maps): 
-            for i, j in product(range(int(f[0])), range(int(f[1]))):
-                cx = j * steps[k][1] + offset[k][1]
-                cy = i * steps[k][0] + offset[k][0]
-                s_k = self.scales[k]
-                mean += [cx, cy, s_k, s_k]
-                s_k_prime = sqrt(s_k * self.scales[k + 1])
-                mean += [cx, cy, s_k_prime, s_k_prime]
-                for ar in self.aspect_ratios[k]:
-                    if isinstance(ar, int):
-                        ar_sqrt = sqrt(ar)
-                        mean += [cx, cy, s_k * ar_sqrt, s_k / ar_sqrt]
-                        mean += [cx, cy, s_k / ar_sqrt, s_k * ar_sqrt]
-                    elif isinstance(ar, list):
-                        mean += [cx, cy, s_k * ar[0], s_k * ar[1]]
-        output = torch.Tensor(mean).view(-1, 4)
+        for k, f in enumerate(feature_maps):
+            step_y, step_x = float(1 / f[0]), float(1 / f[1])
+            cy = np.arange(int(f[0])) * step_y + step_y * 0.5
+            cx = np.arange(int(f[1])) * step_x + step_x * 0.5
+            cy, cx = np.meshgrid(cy, cx, indexing="ij")
+            sizes = self._anchor_sizes(k)
+            # (H, W, num_anchors, 4), in the (cx, cy, w, h) format
+            level = np.empty(cx.shape + (len(sizes), 4))
+            level[..., 0] = cx[..., None]
+            level[..., 1] = cy[..., None]
+            level[..., 2:] = sizes
+            mean.append(level.reshape(-1, 4))
+        output = torch.from_numpy(np.concatenate(mean, 0)).float()
         if self.clip:
             output.clamp_(max=1, min=0)
-        self.anchors_boxes[feature_maps] = output
+        return output
+
+    def __call__(self, feature_maps, device=None):
+        feature_maps = tuple(tuple(int(s) for s in f) for f in feature_maps)
+        key = (feature_maps, str(device) if device is not None else None)
+        if key in self.anchors_boxes:
+            self.anchors_boxes.move_to_end(key)
+            return self.anchors_boxes[key]
+
+        if device is not None:
+            output = self(feature_maps).to(device)
+        else:
+            output = self._generate(feature_maps)
+        self.anchors_boxes[key] = output
+        if len(self.anchors_boxes) > self.cache_size:
+            self.anchors_boxes.popitem(last=False)
         return output
@@ -1,5 +1,6 @@
 import abc
 
+import torch
 from torch import nn
 
 from aw_nas import Component
@@ -23,7 +24,7 @@ class AnchorsGenerator(Component):
         super(AnchorsGenerator, self).__init__(schedule_cfg)
 
     @abc.abstractmethod
-    def __call__(self, image_shape):
+    def __call__(self, feature_maps, device=None):
         pass
 
 
@@ -37,6 +38,19 @@ class Matcher(Component):
     def __call__(self, boxes, labels, anchors):
         pass
 
+    def match_batch(self, boxes_list, labels_list, anchors):
+        """
+        Match the ground truths of a batch of images.
+        Subclasses can override this method to match all the images at once.
+
+        Returns:
+            conf_t: (tensor) Shape: [batch_size, num_anchors]
+            loc_t: (tensor) Shape: [batch_size, num_anchors, 4]
+        """
+        targets = [self(boxes, labels, anchors) for boxes, labels in zip(boxes_list, labels_list)]
+        conf_t, loc_t = zip(*targets)
+        return torch.stack(conf_t), torch.stack(loc_t)
+
 class PostProcessing(Component):
     REGISTRY = "post_processing"
 
@@ -19,17 +19,25 @@ class IOUMatcher(Matcher):
         self.unmatched_threshold = unmatched_threshold
         self.variance = variance
 
-    def __call__(self, boxes, labels, anchors):
-        num_anchors = anchors.size(0)
-        loc_t = torch.Tensor(1, num_anchors, 4)
-        conf_t = torch.LongTensor(1, num_anchors)
-        boxes = boxes.to(torch.float)
+    @staticmethod
+    def _filter_empty_boxes(boxes, labels):
+        """
+        Drop the non-positive sized boxes, only if there are boxes with zero width/height.
+        """
         widths = boxes[:, 2] - boxes[:, 0]
         heights = boxes[:, 3] - boxes[:, 1]
-        if widths.min() == 0 or heights.min() == 0:
+        if len(boxes) > 0 and (widths.min() == 0 or heights.min() == 0):
             idx = (widths > 0).__and__(heights > 0)
             boxes = boxes[idx]
             labels = labels[idx]
+        return boxes, labels
+
+    def __call__(self, boxes, labels, anchors):
+        num_anchors = anchors.size(0)
+        loc_t = torch.Tensor(1, num_anchors, 4)
+        conf_t = torch.LongTensor(1, num_anchors)
+        boxes = boxes.to(torch.float)
+        boxes, labels = self._filter_empty_boxes(boxes, labels)
         if len(boxes) == 0:
             conf_t[0, :] = 0
             return conf_t.squeeze(0), loc_t.squeeze(0)
@@ -42,3 +50,24 @@ class IOUMatcher(Matcher):
         loc_t = loc_t.squeeze(0)
         conf_t = conf_t.squeeze(0)
         return conf_t, loc_t
+
+    def match_batch(self, boxes_list, labels_list, anchors):
+        device = anchors.device
+        batch_size = len(boxes_list)
+        valid_boxes, valid_labels = [], []
+        for boxes, labels in zip(boxes_list, labels_list):
+            boxes = torch.as_tensor(boxes, device=device).to(torch.float)
+            labels = torch.as_tensor(labels, device=device)
+            boxes, labels = self._filter_empty_boxes(boxes, labels)
+            valid_boxes.append(boxes)
+            valid_labels.append(labels)
+
+        num_truths = torch.tensor([len(boxes) for boxes in valid_boxes], device=device)
+        max_num_obj = max(int(num_truths.max()), 1) if batch_size else 1
+        truths = torch.zeros(batch_size, max_num_obj, 4, device=device)
+        labels = torch.zeros(batch_size, max_num_obj, dtype=torch.long, device=device)
+        for i, (boxes, label) in enumerate(zip(valid_boxes, valid_labels)):
+            truths[i, :len(boxes)] = boxes
+            labels[i, :len(boxes)] = label
+        return box_utils.batch_match(self.matched_threshold, self.unmatched_threshold,
+                                     truths, anchors, self.variance, labels, num_truths)
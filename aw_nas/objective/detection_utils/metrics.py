@@ -389,7 +389,7 @@ class VOCMetrics(Metrics):
         class_recs = gt_recs[self.class_names[class_id + 1]]
         for image_id, objects in class_recs.items():
             difficult = objects["difficult"]
-            npos = npos + sum(~np.asarray(difficult).astype(np.bool))
+            npos = npos + sum(~np.asarray(difficult).astype(bool))
 
         det_rec = det_recs[class_id]
         image_ids, det_scores, det_bboxes = [], [], []
@@ -404,8 +404,8 @@ class VOCMetrics(Metrics):
             det_scores = np.concatenate(det_scores, 0)
             det_bboxes = np.concatenate(det_bboxes, 0)
 
-            confidence = np.asarray(det_scores).astype(np.float).reshape(-1)
-            BB = np.asarray(det_bboxes)
+            confidence = np.asarray(det_scores).astype(float).reshape(-1)
+            BB = np.asarray(det_bboxes).astype(float)
 
             # sort by confidence
             sorted_ind = np.argsort(-confidence)
@@ -413,44 +413,42 @@ class VOCMetrics(Metrics):
             BB = BB[sorted_ind, :]
             image_ids = [image_ids[x] for x in sorted_ind]
 
-            # go down dets and mark TPs and FPs
+            # the overlap with the best matched ground truth of each detection,
+            # computed image by image
             nd = len(image_ids)
-            tp = np.zeros(nd)
-            fp = np.zeros(nd)
-            for d in range(nd):
-                R = class_recs.get(image_ids[d], {"bbox": []})
-                bb = BB[d, :].astype(float)
-                ovmax = -np.inf
-                if len(R["bbox"]) > 0:
-                    BBGT = np.concatenate(
-                        R["bbox"], 0).reshape(-1, 4).astype(float)
-                    # compute overlaps
-                    # intersection
-                    ixmin = np.maximum(BBGT[:, 0], bb[0])
-                    iymin = np.maximum(BBGT[:, 1], bb[1])
-                    ixmax = np.minimum(BBGT[:, 2], bb[2])
-                    iymax = np.minimum(BBGT[:, 3], bb[3])
-                    iw = np.maximum(ixmax - ixmin, 0.0)
-                    ih = np.maximum(iymax - iymin, 0.0)
-                    inters = iw * ih
-                    uni = (
-                        (bb[2] - bb[0]) * (bb[3] - bb[1])
-                        + (BBGT[:, 2] - BBGT[:, 0]) * (BBGT[:, 3] - BBGT[:, 1])
-                        - inters
-                    )
-                    overlaps = inters / uni
-                    ovmax = np.max(overlaps)
-                    jmax = np.argmax(overlaps)
-
-                if ovmax > ovthresh:
-                    if not R["difficult"][jmax]:
-                        if not R["det"][jmax]:
-                            tp[d] = 1.0
-                            R["det"][jmax] = 1
-                        else:
-                            fp[d] = 1.0
-                else:
-                    fp[d] = 1.0
+            ovmax = np.full(nd, -np.inf)
+            jmax = np.zeros(nd, dtype=np.int64)
+            gt_difficult = np.zeros(nd, dtype=bool)
+            gt_det = np.zeros(nd, dtype=bool)
+            img_keys = {}
+            det_imgs = np.array([img_keys.setdefault(image_id, len(img_keys))
+                                 for image_id in image_ids], dtype=np.int64)
+            order = np.argsort(det_imgs, kind="stable")
+            splits = np.flatnonzero(np.diff(det_imgs[order])) + 1
+            for idxes in np.split(order, splits):
+                R = class_recs.get(image_ids[idxes[0]], {"bbox": []})
+                if len(R["bbox"]) == 0:
+                    continue
+                BBGT = np.concatenate(R["bbox"], 0).reshape(-1, 4).astype(float)
+                overlaps = self._overlaps(BB[idxes], BBGT)
+                ovmax[idxes] = np.max(overlaps, axis=1)
+                jmax[idxes] = np.argmax(overlaps, axis=1)
+                gt_difficult[idxes] = np.asarray(R["difficult"], dtype=bool)[jmax[idxes]]
+                gt_det[idxes] = np.asarray(R["det"], dtype=bool)[jmax[idxes]]
+
+            # go down dets and mark TPs and FPs: among the detections matching a
+            # non-difficult ground truth, only the first (highest scoring) one is a TP
+            matched = ovmax > ovthresh
+            candidates = np.flatnonzero(matched & ~gt_difficult)
+            _, first_idxes = np.unique(
+                det_imgs[candidates] * (jmax.max() + 1) + jmax[candidates], return_index=True)
+            is_first = np.zeros(nd, dtype=bool)
+            is_first[candidates[first_idxes]] = True
+            is_tp = is_first & ~gt_det
+            tp = is_tp.astype(float)
+            fp = (~matched | (matched & ~gt_difficult & ~is_tp)).astype(float)
+            for d in np.flatnonzero(is_tp):
+                class_recs[image_ids[d]]["det"][jmax[d]] = 1
 
             # compute precision recall
             fp = np.cumsum(fp)
@@ -467,6 +465,26 @@ class VOCMetrics(Metrics):
 
         return rec, prec, ap
 
+    @staticmethod
+    def _overlaps(bboxes, gt_bboxes):
+        """
+        The IoU matrix of detections (N, 4) and ground truths (M, 4), shape (N, M).
+        """
+        bb = bboxes[:, None, :]
+        ixmin = np.maximum(gt_bboxes[:, 0], bb[..., 0])
+        iymin = np.maximum(gt_bboxes[:, 1], bb[..., 1])
+        ixmax = np.minimum(gt_bboxes[:, 2], bb[..., 2])
+        iymax = np.minimum(gt_bboxes[:, 3], bb[..., 3])
+        iw = np.maximum(ixmax - ixmin, 0.0)
+        ih = np.maximum(iymax - iymin, 0.0)
+        inters = iw * ih
+        uni = (
+            (bb[..., 2] - bb[..., 0]) * (bb[..., 3] - bb[..., 1])
+            + (gt_bboxes[:, 2] - gt_bboxes[:, 0]) * (gt_bboxes[:, 3] - gt_bboxes[:, 1])
+            - inters
+        )
+        return inters / uni
+
     def do_python_eval(self, det_recs, gt_recs, use_07=True):
         aps = []
         # The PASCAL VOC metric changed in 2010
@@ -14,6 +14,8 @@ from aw_nas.utils import box_utils
 
 __all__ = ["SSDPostProcessing"]
 
+_CPU_NMS_CHUNK_SIZE = 4000
+
 class SSDPostProcessing(PostProcessing):
     NAME = "ssd_post_processing"
     def __init__(self,
@@ -24,10 +26,15 @@ class SSDPostProcessing(PostProcessing):
                  variance=(0.1, 0.2),
                  apply_prob_type="softmax",
                  anchors=None,
+                 pre_nms_top_k=None,
+                 max_detections_per_image=None,
                  schedule_cfg=None):
         super(SSDPostProcessing, self).__init__(schedule_cfg)
         self.num_classes = num_classes
         self.top_k = top_k
+        # the maximum number of boxes of each class in one image that are passed to NMS
+        self.pre_nms_top_k = pre_nms_top_k
+        self.max_detections_per_image = max_detections_per_image
         self.confidence_thresh = confidence_threshold
         self.nms_thresh = nms_threshold
         self.variance = variance
@@ -42,29 +49,90 @@ class SSDPostProcessing(PostProcessing):
 
     def __call__(self, features, confidences, locations):
         feature_maps = [ft.shape[-2:] for ft in features]
-        anchors = self.anchors(feature_maps).to(confidences.device)
+        anchors = self.anchors(feature_maps, confidences.device)
         num = confidences.size(0)  # batch size
         num_anchors = anchors.size(0)
         output = [[torch.tensor([]) for _ in range(self.num_classes)]
                   for _ in range(num)]
         confidences = self.prob_fn(confidences)
+        # (num, num_classes, num_anchors), the background class is excluded
         conf_preds = confidences.view(num, num_anchors,
-                                      self.num_classes + 1).transpose(2, 1)
+                                      self.num_classes + 1).transpose(2, 1)[:, 1:]
+        decoded_boxes = box_utils.decode(locations.view(num, num_anchors, 4), anchors,
+                                         self.variance)
+
+        img_idxes, cls_idxes, anchor_idxes = torch.nonzero(
+            conf_preds > self.confidence_thresh, as_tuple=True)
+        if img_idxes.numel() == 0:
+            return output
+        scores = conf_preds[img_idxes, cls_idxes, anchor_idxes]
+        boxes = decoded_boxes[img_idxes, anchor_idxes]
+        groups = img_idxes * self.num_classes + cls_idxes
+
+        # a single sort, by group first, and then by descending scores within each group
+        # the probabilities are in [0, 1], so `1 - score` never reaches the next group
+        order = torch.argsort(groups.double() + (1. - scores.double()))
+        groups, scores, boxes = groups[order], scores[order], boxes[order]
+        if self.pre_nms_top_k is not None:
+            keep = self._rank_in_group(groups) < self.pre_nms_top_k
+            groups, scores, boxes = groups[keep], scores[keep], boxes[keep]
+
+        keep = self._batched_nms(boxes, scores, groups)
+        groups, scores, boxes = groups[keep], scores[keep], boxes[keep]
 
-        for i in range(num):
-            decoded_boxes = box_utils.decode(locations[i], anchors,
-                                             self.variance)
-            conf_scores = conf_preds[i].clone()
+        if self.max_detections_per_image is not None:
+            img_idxes = groups // self.num_classes
+            order = torch.argsort(img_idxes.double() + (1. - scores.double()))
+            keep = order[self._rank_in_group(img_idxes[order]) < self.max_detections_per_image]
+            keep = torch.sort(keep)[0]
+            groups, scores, boxes = groups[keep], scores[keep], boxes[keep]
 
-            for cls_idx in range(self.num_classes):
-                c_mask = conf_scores[cls_idx + 1].gt(self.confidence_thresh)
-                scores = conf_scores[cls_idx + 1][c_mask]
-                if scores.size(0) == 0:
-                    continue
-                l_mask = c_mask.unsqueeze(1).expand_as(decoded_boxes)
-                boxes = decoded_boxes[l_mask].view(-1, 4)
-                # idx of highest scoring and non-overlapping boxes per class
-                ids = nms(boxes, scores, self.nms_thresh)
-                output[i][cls_idx] = torch.cat(
-                    (boxes[ids], scores[ids].unsqueeze(1)), 1)
+        counts = torch.bincount(groups, minlength=num * self.num_classes).tolist()
+        dets = torch.cat((boxes, scores.unsqueeze(1)), 1)
+        for group, det in zip(range(num * self.num_classes), torch.split(dets, counts)):
+            if det.size(0) > 0:
+                output[group // self.num_classes][group % self.num_classes] = det
         return output
+
+    def _batched_nms(self, boxes, scores, groups):
+        """
+        NMS of the boxes in different groups (images and classes) at once.
+        Boxes of different groups are offset so that they never overlap.
+        `groups` should be sorted, and the returned indexes are sorted too.
+
+        The cost of NMS on CPU is quadratic in the number of boxes, so on CPU the groups
+        are packed into chunks of about `_CPU_NMS_CHUNK_SIZE` boxes.
+        """
+        nms_boxes = boxes.double()
+        offsets = groups.double() * (nms_boxes.max() - nms_boxes.min() + 1)
+        nms_boxes = nms_boxes + offsets[:, None]
+        nms_scores = scores.double()
+        if boxes.is_cuda:
+            chunks = [(0, groups.numel())]
+        else:
+            _, counts = torch.unique_consecutive(groups, return_counts=True)
+            chunks = []
+            start = end = 0
+            for count in counts.tolist():
+                if end > start and end + count - start > _CPU_NMS_CHUNK_SIZE:
+                    chunks.append((start, end))
+                    start = end
+                end += count
+            chunks.append((start, end))
+        keep = torch.cat([
+            nms(nms_boxes[start:end], nms_scores[start:end], self.nms_thresh) + start
+            for start, end in chunks
+        ])
+        return torch.sort(keep)[0]
+
+    @staticmethod
+    def _rank_in_group(groups):
+        """
+        The rank of every element in its group, `groups` should be sorted.
+        """
+        positions = torch.arange(groups.numel(), device=groups.device)
+        is_start = torch.ones_like(groups, dtype=torch.bool)
+        is_start[1:] = groups[1:] != groups[:-1]
+        group_starts = torch.cummax(torch.where(is_start, positions, torch.zeros_like(positions)),
+                                    dim=0)[0]
+        return positions - group_starts
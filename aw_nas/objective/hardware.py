@@ -1,3 +1,5 @@
+from collections import OrderedDict
+
 from aw_nas.objective.base import BaseObjective
 from aw_nas.hardware.base import BaseHardwarePerformanceModel
 
@@ -12,6 +14,7 @@ class HardwareObjective(BaseObjective):
                  perf_names=("latency", ),
                  hardware_model_paths=None,
                  hardware_obj_type=None,
+                 perf_cache_size=1024,
                  schedule_cfg=None):
         super().__init__(search_space, schedule_cfg=schedule_cfg)
 
@@ -32,6 +35,11 @@ class HardwareObjective(BaseObjective):
             for path, perfmodel in zip(hardware_model_paths, self.hardware_perfmodels):
                 perfmodel.load(path)
 
+        # the perfs only depend on the rollout, cache them to avoid predicting the same
+        # rollout for every batch
+        self.perf_cache_size = perf_cache_size
+        self._perf_cache = OrderedDict()
+
     @classmethod
     def supported_data_types(cls):
         return ["image"]
@@ -39,9 +47,30 @@ class HardwareObjective(BaseObjective):
     def perf_names(self):
         return self._perf_names
 
+    @staticmethod
+    def _rollout_key(rollout):
+        genotype = getattr(rollout, "genotype", None)
+        return None if genotype is None else str(genotype)
+
     def get_perfs(self, inputs, outputs, targets, cand_net):
-        perfs = [perfmodel.predict(cand_net.rollout) for perfmodel in self.hardware_perfmodels]
-        return perfs
+        rollout = cand_net.rollout
+        key = self._rollout_key(rollout) if self.perf_cache_size > 0 else None
+        if key is not None:
+            key = (key, tuple(perfmodel.version for perfmodel in self.hardware_perfmodels))
+            perfs = self._perf_cache.get(key)
+            if perfs is not None:
+                self._perf_cache.move_to_end(key)
+                return list(perfs)
+
+        perfs = [perfmodel.predict(rollout) for perfmodel in self.hardware_perfmodels]
+        if key is not None:
+            self._perf_cache[key] = perfs
+            if len(self._perf_cache) > self.perf_cache_size:
+                self._perf_cache.popitem(last=False)
+        return list(perfs)
+
+    def clear_perf_cache(self):
+        self._perf_cache.clear()
 
     def get_reward(self, inputs, outputs, targets, cand_net):
         return 0.
@@ -41,7 +41,7 @@ class LanguageObjective(BaseObjective):
             targets: target tokens
         """
         logits, raw_outs, outs, _ = outputs
-        loss = nn.CrossEntropyLoss()(logits.view(-1, logits.size(-1)), targets.view(-1))
+        loss = nn.CrossEntropyLoss()(logits.view(-1, logits.size(-1)), targets.reshape(-1))
         if not add_evaluator_regularization:
             return loss
 
@@ -9,7 +9,8 @@ import numpy as np
 import torch
 from torch import nn
 import torch.nn.functional as F
-from aw_nas.utils.common_utils import get_sub_kernel, make_divisible, _get_channel_mask
+from aw_nas.utils.common_utils import get_sub_kernel, make_divisible, \
+    _get_channel_order, _channel_mask_from_order
 from aw_nas.utils.exception import expect
 
 
@@ -627,6 +628,33 @@ class FlexiblePointLinear(nn.Conv2d, FlexibleLayer):
         super(FlexiblePointLinear, self).__init__(in_channels, out_channels, kernel_size, stride, padding, dilation, groups=1, bias=bias)
         FlexibleLayer.__init__(self)
         self._bias = bias
+        self._channel_order_version = None
+        self._channel_order = None
+        self._channel_masks = {}
+
+    def get_channel_mask(self, num_channels):
+        """
+        Return the mask of the `num_channels` input channels with the largest L1 norm.
+
+        The channel order is cached, and only re-sorted when the weight is changed,
+        which is detected by the version counter of the weight. Note that in-place
+        modifications through `weight.data` do not bump the version counter, call
+        `clear_channel_order` after such modifications.
+        """
+        version = (self.weight.data_ptr(), self.weight._version)
+        if self._channel_order_version != version:
+            self._channel_order = _get_channel_order(self.weight.data).cpu()
+            self._channel_order_version = version
+            self._channel_masks = {}
+        if num_channels not in self._channel_masks:
+            self._channel_masks[num_channels] = _channel_mask_from_order(
+                self._channel_order, num_channels)
+        return self._channel_masks[num_channels]
+
+    def clear_channel_order(self):
+        self._channel_order_version = None
+        self._channel_order = None
+        self._channel_masks = {}
 
     def _select_params(self, in_mask=None, out_mask=None):
         if in_mask is None and out_mask is None:
@@ -850,7 +878,7 @@ class FlexibleSEModule(SEModule, FlexibleLayer):
             return
         channel = mask.sum().item()
         mid_channel = make_divisible(channel // self.reduction, 8)
-        exp_mask = _get_channel_mask(self.se.expand.weight.data, mid_channel)
+        exp_mask = self.se.expand.get_channel_mask(mid_channel)
         self.se.reduction.set_mask(mask, exp_mask)
         self.se.expand.set_mask(exp_mask, mask)
         
@@ -5,6 +5,8 @@ Definitions of mutation-based rollout and population.
 import os
 import copy
 import glob
+import json
+import mmap
 import shutil
 import collections
 
@@ -44,7 +46,7 @@ class ModelRecord(object):
     def genotype(self):
         return genotype_from_str(self._genotype, self.search_space)
 
-    def save(self, path):
+    def meta_info(self):
         meta_info = collections.OrderedDict()
         meta_info["genotypes"] = get_genotype_substr(str(self.genotype))
         meta_info["config"] = dict(self.config)
@@ -52,6 +54,10 @@ class ModelRecord(object):
         meta_info["finished"] = self.finished
         meta_info["confidence"] = self.confidence
         meta_info["perfs"] = self.perfs
+        return meta_info
+
+    def save(self, path):
+        meta_info = self.meta_info()
         self.info_path = path
         with open(path, "w") as o_stream:
             yaml.safe_dump(meta_info, stream=o_stream, default_flow_style=False)
@@ -64,6 +70,10 @@ class ModelRecord(object):
     def init_from_file(cls, path, search_space):
         with open(path, "r") as meta_f:
             meta_info = yaml.safe_load(meta_f)
+        return cls.init_from_meta_info(meta_info, path, search_space)
+
+    @classmethod
+    def init_from_meta_info(cls, meta_info, path, search_space):
         record = cls(
             str(genotype_from_str(meta_info["genotypes"], search_space)),
             meta_info["config"], search_space,
@@ -75,8 +85,15 @@ class ModelRecord(object):
 class Population(Component):
     """
     Model population.
+
+    A population can be saved as a directory of per-record meta-info files
+    (`<index>.yaml`, `save_format="yaml"`), or as a single append-only
+    JSON-lines file (`population.jsonl`, `save_format="jsonl"`), which is much
+    faster to save and load when there are many records.
     """
 
+    JSONL_FNAME = "population.jsonl"
+
     def __init__(self, search_space, model_records, cfg_template, next_index=None):
         super(Population, self).__init__(schedule_cfg=None)
         self.search_space = search_space
@@ -85,6 +102,7 @@ class Population(Component):
             (ind, genotype_from_str(
                 record.genotype, self.search_space))
             for ind, record in six.iteritems(self._model_records)])
+        self._init_genotype_index()
         self._size = len(model_records) # _size will be adjusted along with self._model_records
         self.cfg_template = cfg_template
         if next_index is None:
@@ -96,6 +114,7 @@ class Population(Component):
     def __getstate__(self):
         state = super(Population, self).__getstate__().copy()
         del state["genotype_records"]
+        del state["_genotype_index"]
         return state
 
     def __setstate__(self, state):
@@ -104,6 +123,18 @@ class Population(Component):
             (ind, genotype_from_str(
                 record.genotype, self.search_space))
             for ind, record in six.iteritems(self._model_records)])
+        self._init_genotype_index()
+
+    @staticmethod
+    def _genotype_key(genotype):
+        # genotypes might contain lists and are not hashable, use the string representation
+        return str(genotype)
+
+    def _init_genotype_index(self):
+        # canonical genotype -> set of record indexes
+        self._genotype_index = collections.defaultdict(set)
+        for ind, genotype in six.iteritems(self.genotype_records):
+            self._genotype_index[self._genotype_key(genotype)].add(ind)
 
     @property
     def model_records(self):
@@ -123,20 +154,34 @@ class Population(Component):
 
     def add_model(self, model_record, index=None):
         index = self._next_index if index is None else index
+        if index in self.genotype_records:
+            # overwrite an existing record
+            self._genotype_index[self._genotype_key(self.genotype_records[index])].discard(index)
         self.model_records[index] = model_record
         self.genotype_records[index] = genotype_from_str(model_record.genotype, self.search_space)
+        self._genotype_index[self._genotype_key(self.genotype_records[index])].add(index)
         self._next_index += 1
         self._size += 1
         return index
 
-    def save(self, path, start_index=None):
+    def save(self, path, start_index=None, save_format="yaml"):
         """
         Save this population to path.
+
+        Args:
+          path: the directory to save to
+          start_index: only records whose index >= `start_index` are saved
+          save_format: `yaml` - one meta-info file per record;
+                       `jsonl` - append the records to `<path>/population.jsonl`
         """
+        expect(save_format in {"yaml", "jsonl"},
+               "Unsupported population save format: {}".format(save_format))
         path = utils.makedir(path) # create dir if not exists
+        start_save_index = self.start_save_index if start_index is None else start_index
+        if save_format == "jsonl":
+            return self._save_jsonl(path, start_save_index)
         backuped = 0
         saved = 0
-        start_save_index = self.start_save_index if start_index is None else start_index
         for ind, record in six.iteritems(self.model_records):
             if ind < start_save_index:
                 continue
@@ -159,8 +204,35 @@ class Population(Component):
         self.start_save_index = self._next_index
         return saved
 
+    def _save_jsonl(self, path, start_save_index):
+        # append-only: when loading, later lines of the same index overwrite the former ones
+        save_path = os.path.join(path, self.JSONL_FNAME)
+        saved = 0
+        with open(save_path, "a") as o_stream:
+            for ind, record in six.iteritems(self.model_records):
+                if ind < start_save_index:
+                    continue
+                meta_info = record.meta_info()
+                meta_info["index"] = ind
+                o_stream.write(json.dumps(meta_info) + "\n")
+                record.info_path = save_path
+                saved += 1
+        self.logger.info("Saving start from index %d. %d/%d records appended to %s. By default "
+                         "next save will start from index %d.",
+                         start_save_index, saved, len(self.model_records),
+                         save_path, self._next_index)
+        self.start_save_index = self._next_index
+        return saved
+
+    def get_index_by_genotype(self, genotype):
+        """
+        Return the index of one record with `genotype`, None if there is no such record.
+        """
+        indexes = self._genotype_index.get(self._genotype_key(genotype))
+        return next(iter(indexes)) if indexes else None
+
     def contain_rollout(self, rollout):
-        return rollout.genotype in self.genotype_records.values()
+        return self.get_index_by_genotype(rollout.genotype) is not None
 
     def remove_age(self, args):
         """
@@ -191,7 +263,9 @@ class Population(Component):
 
         There should be multiple meta-info (yaml) files named as "`<number>.yaml` under each
         directory, each of them specificy the meta information for a model in the population,
-        with `<number>` represent its index.
+        with `<number>` represent its index. The records can also be stored in one
+        "population.jsonl" file under the directory, each line is the meta information
+        (with an additional "index" item) for a model, see `Population.save`.
         Note there should not be duplicate index, if there are duplicate index,
         rename or soft-link the files.
 
@@ -218,6 +292,11 @@ class Population(Component):
             search_space = get_search_space(cfg_template["search_space_type"],
                                             **cfg_template["search_space_cfg"])
         for _, dir_ in enumerate(dirs):
+            jsonl_records = cls._load_jsonl(os.path.join(dir_, cls.JSONL_FNAME), search_space)
+            for index, record in six.iteritems(jsonl_records):
+                expect(index not in model_records,
+                       "There are duplicate index: {}. rename or soft-link the files".format(index))
+                model_records[index] = record
             meta_files = glob.glob(os.path.join(dir_, "*.yaml"))
             for fname in meta_files:
                 if "template.yaml" in fname:
@@ -231,6 +310,27 @@ class Population(Component):
                                             len(dirs), len(model_records))
         return Population(search_space, model_records, cfg_template)
 
+    @staticmethod
+    def _load_jsonl(path, search_space):
+        records = collections.OrderedDict()
+        if not os.path.exists(path) or os.path.getsize(path) == 0:
+            return records
+        path = os.path.abspath(path)
+        with open(path, "rb") as r_f:
+            m_f = mmap.mmap(r_f.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                for line in iter(m_f.readline, b""):
+                    line = line.strip()
+                    if not line:
+                        continue
+                    meta_info = json.loads(line.decode("utf-8"))
+                    # later lines overwrite the former records of the same index
+                    records[int(meta_info.pop("index"))] = ModelRecord.init_from_meta_info(
+                        meta_info, path, search_space)
+            finally:
+                m_f.close()
+        return records
+
 class CellMutation(object):
     NODE = 0
     PRIMITIVE = 1
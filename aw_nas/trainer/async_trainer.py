@@ -96,9 +96,11 @@ class MultiprocessDispatcher(BaseDispatcher):
 
     STOP_WAIT_SECS = 10
 
-    def __init__(self, gpu_ids=(0,)):
+    def __init__(self, gpu_ids=(0,), share_dataset_memory=True):
         super(MultiprocessDispatcher, self).__init__()
         self.gpu_ids = gpu_ids
+        # move the dataset of the evaluator into shared memory before spawning the workers
+        self.share_dataset_memory = share_dataset_memory
         self._inited = False
         self.evaluator = None
         self.stop_event = None
@@ -151,6 +153,9 @@ class MultiprocessDispatcher(BaseDispatcher):
         self.ckpt_dir = os.path.abspath(ckpt_dir)
         self.logger.info("checkpoint dir: %s", self.ckpt_dir)
         self.evaluator = evaluator
+        dataset = getattr(self.evaluator, "dataset", None)
+        if self.share_dataset_memory and hasattr(dataset, "share_memory"):
+            dataset.share_memory()
         self.stop_event = multiprocessing.Event()
         self.req_queue = multiprocessing.Queue()
         self.ans_queue = multiprocessing.Queue()
@@ -13,7 +13,7 @@ def decode(loc, priors, variances):
     the encoding we did for offset regression at train time.
     Args:
         loc (tensor): location predictions for loc layers,
-            Shape: [num_priors,4]
+            Shape: [num_priors,4] or [batch_size,num_priors,4]
         priors (tensor): Prior boxes in center-offset form.
             Shape: [num_priors,4].
         variances: (list[float]) Variances of priorboxes
@@ -22,10 +22,10 @@ def decode(loc, priors, variances):
     """
 
     boxes = torch.cat(
-        (priors[:, :2] + loc[:, :2] * variances[0] * priors[:, 2:],
-         priors[:, 2:] * torch.exp(loc[:, 2:] * variances[1])), 1)
-    boxes[:, :2] -= boxes[:, 2:] / 2
-    boxes[:, 2:] += boxes[:, :2]
+        (priors[..., :2] + loc[..., :2] * variances[0] * priors[..., 2:],
+         priors[..., 2:] * torch.exp(loc[..., 2:] * variances[1])), -1)
+    boxes[..., :2] -= boxes[..., 2:] / 2
+    boxes[..., 2:] += boxes[..., :2]
     return boxes
 
 
@@ -34,23 +34,23 @@ def encode(matched, priors, variances):
     we have matched (based on jaccard overlap) with the prior boxes.
     Args:
         matched: (tensor) Coords of ground truth for each prior in point-form
-            Shape: [num_priors, 4].
+            Shape: [num_priors, 4] or [batch_size, num_priors, 4].
         priors: (tensor) Prior boxes in center-offset form
             Shape: [num_priors,4].
         variances: (list[float]) Variances of priorboxes
     Return:
-        encoded boxes (tensor), Shape: [num_priors, 4]
+        encoded boxes (tensor), Shape: [num_priors, 4] or [batch_size, num_priors, 4]
     """
 
     # dist b/t match center and prior's center
-    g_cxcy = (matched[:, :2] + matched[:, 2:]) / 2 - priors[:, :2]
+    g_cxcy = (matched[..., :2] + matched[..., 2:]) / 2 - priors[..., :2]
     # encode variance
-    g_cxcy /= (variances[0] * priors[:, 2:])
+    g_cxcy /= (variances[0] * priors[..., 2:])
     # match wh / prior wh
-    g_wh = (matched[:, 2:] - matched[:, :2]) / priors[:, 2:]
+    g_wh = (matched[..., 2:] - matched[..., :2]) / priors[..., 2:]
     g_wh = torch.log(g_wh) / variances[1]
     # return target for smooth_l1_loss
-    return torch.cat([g_cxcy, g_wh], 1)  # [num_priors,4]
+    return torch.cat([g_cxcy, g_wh], -1)  # [num_priors,4]
 
 
 def point_form(boxes):
@@ -99,10 +99,11 @@ def match(matched_threshold, unmatched_threshold, truths, priors, variances,
     best_prior_idx.squeeze_(1)
     best_prior_overlap.squeeze_(1)
     best_truth_overlap.index_fill_(0, best_prior_idx, 2)  # ensure best prior
-    # TODO refactor: index  best_prior_idx with long tensor
-    # ensure every gt matches with its prior of max overlap
-    for j in range(best_prior_idx.size(0)):
-        best_truth_idx[best_prior_idx[j]] = j
+    # ensure every gt matches with its prior of max overlap,
+    # when several gts share one best prior, the last one wins
+    is_last = _is_last_occurrence(best_prior_idx.unsqueeze(0)).squeeze(0)
+    best_truth_idx[best_prior_idx[is_last]] = torch.arange(
+        best_prior_idx.size(0), device=best_prior_idx.device)[is_last]
     matches = truths[best_truth_idx]  # Shape: [num_priors,4]
     conf = labels[best_truth_idx]  # Shape: [num_priors]
     conf[best_truth_overlap < matched_threshold] = -1  # label as ignore
@@ -112,6 +113,67 @@ def match(matched_threshold, unmatched_threshold, truths, priors, variances,
     conf_t[idx] = conf  # [num_priors] top class label for each prior
 
 
+def _is_last_occurrence(idxes, valid=None):
+    """
+    Args:
+        idxes: (tensor) Shape: [batch_size, num]
+        valid: (tensor) bool mask of the valid elements, Shape: [batch_size, num]
+    Return:
+        (tensor) whether each valid element is the last valid occurrence of its value in its row
+    """
+    same = idxes.unsqueeze(2) == idxes.unsqueeze(1)  # [batch_size, num, num]
+    if valid is not None:
+        same = same & valid.unsqueeze(1)
+    has_later = torch.triu(same.to(torch.uint8), diagonal=1).sum(2) > 0
+    is_last = ~has_later
+    return is_last if valid is None else is_last & valid
+
+
+def batch_match(matched_threshold, unmatched_threshold, truths, priors, variances,
+                labels, num_truths):
+    """Batched version of `match`, the ground truths of all the images are padded.
+    Args:
+        truths: (tensor) Padded ground truth boxes, Shape: [batch_size, max_num_obj, 4].
+        priors: (tensor) Prior boxes from priorbox layers, Shape: [n_priors,4].
+        variances: (list[float]) Variances of priorboxes
+        labels: (tensor) Padded class labels, Shape: [batch_size, max_num_obj].
+        num_truths: (tensor) The number of ground truths of each image, Shape: [batch_size].
+    Return:
+        conf_t: (tensor) Shape: [batch_size, num_priors]
+        loc_t: (tensor) Shape: [batch_size, num_priors, 4]
+    """
+    assert unmatched_threshold <= matched_threshold
+    batch_size, max_num_obj = labels.shape
+    num_priors = priors.size(0)
+    valid = torch.arange(max_num_obj, device=truths.device).unsqueeze(0) \
+            < num_truths.unsqueeze(1)  # [batch_size, max_num_obj]
+    overlaps = batch_jaccard(truths, point_form(priors))
+    # padded truths never match any prior
+    overlaps = overlaps.masked_fill(~valid.unsqueeze(2), -1.)
+    # [batch_size, max_num_obj] best prior for each ground truth
+    _, best_prior_idx = overlaps.max(2)
+    # [batch_size, num_priors] best ground truth for each prior
+    best_truth_overlap, best_truth_idx = overlaps.max(1)
+
+    # ensure every gt matches with its prior of max overlap,
+    # scatter over the flattened (image, prior) indexes
+    is_last = _is_last_occurrence(best_prior_idx, valid)
+    flat_prior_idx = (best_prior_idx + torch.arange(
+        batch_size, device=truths.device).unsqueeze(1) * num_priors)
+    best_truth_overlap.view(-1)[flat_prior_idx[valid]] = 2
+    best_truth_idx.view(-1)[flat_prior_idx[is_last]] = torch.arange(
+        max_num_obj, device=truths.device).expand(batch_size, max_num_obj)[is_last]
+
+    matches = torch.gather(truths, 1, best_truth_idx.unsqueeze(2).expand(-1, -1, 4))
+    conf = torch.gather(labels, 1, best_truth_idx)  # [batch_size, num_priors]
+    conf[best_truth_overlap < matched_threshold] = -1  # label as ignore
+    conf[best_truth_overlap < unmatched_threshold] = 0
+    loc = encode(matches, priors, variances)
+    # images without any ground truth
+    loc[num_truths == 0] = 0.
+    return conf, loc
+
+
 def calc_iou(a, b):
     """
     a(anchor) [boxes, (y1, x1, y2, x2)]
@@ -178,6 +240,25 @@ def jaccard(box_a, box_b):
     return inter / union  # [A,B]
 
 
+def batch_jaccard(box_a, box_b):
+    """Compute the jaccard overlap of batched boxes and the prior boxes.
+    Args:
+        box_a: (tensor) Ground truth bounding boxes, Shape: [batch_size,num_objects,4]
+        box_b: (tensor) Prior boxes from priorbox layers, Shape: [num_priors,4]
+    Return:
+        jaccard overlap: (tensor) Shape: [batch_size, num_objects, num_priors]
+    """
+    box_a = box_a.unsqueeze(2)  # [batch_size,A,1,4]
+    max_xy = torch.min(box_a[..., 2:], box_b[:, 2:])
+    min_xy = torch.max(box_a[..., :2], box_b[:, :2])
+    inter = torch.clamp((max_xy - min_xy), min=0)
+    inter = inter[..., 0] * inter[..., 1]  # [batch_size,A,B]
+    area_a = (box_a[..., 2] - box_a[..., 0]) * (box_a[..., 3] - box_a[..., 1])
+    area_b = (box_b[:, 2] - box_b[:, 0]) * (box_b[:, 3] - box_b[:, 1])
+    union = area_a + area_b - inter
+    return inter / union
+
+
 def hard_negative_mining(loss, labels, neg_pos_ratio):
     """
     It used to suppress the presence of a large number of negative prediction.
@@ -529,14 +529,23 @@ def get_sub_kernel(kernel, sub_kernel_size):
     return kernel[:, :, left:right, left:right].contiguous()
 
 
-def _get_channel_mask(filters: torch.Tensor, num_channels: int):
-    mask = torch.zeros(filters.shape[1], dtype=torch.bool)
-    channel_order = filters.norm(p=1, dim=(0, 2, 3)).argsort(descending=True)
-    mask[channel_order[:num_channels]] = True
+def _get_channel_order(filters: torch.Tensor):
+    """
+    Sort the input channels of `filters` by the L1 norm in descending order.
+    """
+    return filters.norm(p=1, dim=(0, 2, 3)).argsort(descending=True)
+
 
+def _channel_mask_from_order(channel_order: torch.Tensor, num_channels: int):
+    mask = torch.zeros(channel_order.shape[0], dtype=torch.bool)
+    mask[channel_order[:num_channels]] = True
     return mask
 
 
+def _get_channel_mask(filters: torch.Tensor, num_channels: int):
+    return _channel_mask_from_order(_get_channel_order(filters), num_channels)
+
+
 #---- Detection Task Utils ----
 def feature_level_to_stage_index(strides, offset=1):
     """
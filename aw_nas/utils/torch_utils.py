@@ -1,5 +1,6 @@
 import os
 import copy
+import inspect
 import math
 from contextlib import contextmanager
 
@@ -461,6 +462,72 @@ class SimpleDataset(torch.utils.data.Dataset):
     def __len__(self):
         return len(self.data)
 
+class TensorBatchQueue(object):
+    """
+    Serve batches from in-memory data/target tensors by slicing, without any worker process.
+    Can be iterated like a `DataLoader`.
+
+    Args:
+        indices: Only serve this subset of the samples.
+        transform: Applied to each batch of data (e.g., a `BatchAugmentation`).
+    """
+    def __init__(self, data, targets, batch_size, shuffle=False, drop_last=False,
+                 indices=None, transform=None):
+        self.data = data
+        self.targets = targets
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        self.drop_last = drop_last
+        self.indices = torch.as_tensor(indices, dtype=torch.long) \
+                       if indices is not None else None
+        self.transform = transform
+
+    def _num_samples(self):
+        return len(self.indices) if self.indices is not None else len(self.data)
+
+    def __len__(self):
+        if self.drop_last:
+            return self._num_samples() // self.batch_size
+        return (self._num_samples() + self.batch_size - 1) // self.batch_size
+
+    def __iter__(self):
+        if self.shuffle:
+            order = torch.randperm(self._num_samples())
+            if self.indices is not None:
+                order = self.indices[order]
+        else:
+            order = self.indices
+        for i in range(len(self)):
+            if order is None:
+                data = self.data[i * self.batch_size: (i + 1) * self.batch_size]
+                target = self.targets[i * self.batch_size: (i + 1) * self.batch_size]
+            else:
+                inds = order[i * self.batch_size: (i + 1) * self.batch_size]
+                data, target = self.data[inds], self.targets[inds]
+            if self.transform is not None:
+                data = self.transform(data)
+            yield data, target
+
+def cache_dataset_tensors(dataset, indices=None, batch_size=256, num_workers=0,
+                          share_memory=False):
+    """
+    Materialize the (transformed) samples of a dataset into contiguous tensors.
+    Only use this for datasets with deterministic transforms.
+    """
+    if indices is not None:
+        dataset = torch.utils.data.Subset(dataset, indices)
+    loader = torch.utils.data.DataLoader(dataset, batch_size=batch_size, shuffle=False,
+                                         num_workers=num_workers)
+    datas, targets = [], []
+    for data, target in loader:
+        datas.append(data)
+        targets.append(torch.as_tensor(target))
+    data, targets = torch.cat(datas), torch.cat(targets)
+    if share_memory:
+        data.share_memory_()
+        targets.share_memory_()
+    return data, targets
+
 def batchify_sentences(data, bsz, device="cuda"):
     data = torch.cat(data, -1)
     nbatch = data.size(0) // bsz
@@ -470,11 +537,116 @@ def batchify_sentences(data, bsz, device="cuda"):
         data = data.cuda()
     return data[:-1, :], data[1:, :]
 
+class BPTTBatchQueue(object):
+    """
+    Serve the `(input, target)` BPTT windows of a token corpus.
+
+    The corpus is kept as one contiguous 1-D token tensor. The same layout as
+    `batchify_sentences` (`batch_size` columns of consecutive tokens) is obtained
+    by strided views, so neither the batchified corpus nor the windows are copied.
+
+    Args:
+        tokens: A 1-D token tensor, or a list of sentence tensors.
+        random_bptt (bool): If true, sample variable sequence lengths around
+            `bptt_steps` in every epoch. The lengths are sampled once when the
+            epoch's iterator is created, and `len` returns the number of windows
+            of that epoch (or of the next epoch, if no iterator is created yet).
+    """
+    def __init__(self, tokens, batch_size, bptt_steps, random_bptt=False,
+                 drop_last=False, device=None):
+        if isinstance(tokens, (list, tuple)):
+            tokens = torch.cat(tokens) if len(tokens) > 1 else tokens[0]
+        tokens = tokens.contiguous()
+        if device is not None:
+            tokens = tokens.to(device)
+        self.tokens = tokens
+        self.batch_size = batch_size
+        self.bptt_steps = bptt_steps
+        self.random_bptt = random_bptt
+        self.drop_last = drop_last
+        # the length of each column
+        self.column_len = len(tokens) // batch_size
+        # the number of time steps that have targets
+        self.num_steps = max(self.column_len - 1, 0)
+        # the sequence lengths of the current (or next) epoch
+        self._seq_lens = None
+        self._seq_lens_used = False
+
+    def window(self, start, seq_len):
+        """
+        Returns:
+            The strided views of the (seq_len, batch_size) input/target tokens
+            starting from time step `start`.
+        """
+        offset = self.tokens.storage_offset() + start
+        stride = (1, self.column_len)
+        return (self.tokens.as_strided((seq_len, self.batch_size), stride, offset),
+                self.tokens.as_strided((seq_len, self.batch_size), stride, offset + 1))
+
+    @property
+    def data(self):
+        return self.window(0, self.num_steps)[0]
+
+    @property
+    def targets(self):
+        return self.window(0, self.num_steps)[1]
+
+    def sample_seq_lens(self):
+        if not self.random_bptt:
+            seq_lens = [self.bptt_steps] * (self.num_steps // self.bptt_steps)
+            if self.num_steps % self.bptt_steps and not self.drop_last:
+                seq_lens.append(self.num_steps % self.bptt_steps)
+            return seq_lens
+        # random sequece lengths
+        seq_lens = []
+        i = 0
+        while i < self.num_steps:
+            mean_ = self.bptt_steps if np.random.random() < 0.95 else self.bptt_steps / 2
+            seq_len = min(max(5, int(np.random.normal(mean_, 5))), self.bptt_steps + 20)
+            seq_lens.append(seq_len)
+            i += seq_len
+        if i > self.num_steps:
+            # the last window is truncated
+            if self.drop_last:
+                seq_lens.pop()
+            else:
+                seq_lens[-1] -= i - self.num_steps
+        return seq_lens
+
+    def __len__(self):
+        if self._seq_lens is None:
+            self._seq_lens = self.sample_seq_lens()
+            self._seq_lens_used = False
+        return len(self._seq_lens)
+
+    def __iter__(self):
+        # sample the sequence lengths eagerly, so that `len` is consistent with this epoch
+        if self._seq_lens is None or self._seq_lens_used:
+            self._seq_lens = self.sample_seq_lens()
+        self._seq_lens_used = True
+        return self._iter_windows(self._seq_lens)
+
+    def _iter_windows(self, seq_lens):
+        start = 0
+        for seq_len in seq_lens:
+            yield self.window(start, seq_len)
+            start += seq_len
+
 class InfIterator(six.Iterator):
+    """
+    Iterate over `iterable` endlessly, calling `callbacks` at each epoch boundary.
+
+    When the length of `iterable` is known, the iterator of the next epoch is created
+    right after the last batch of the current epoch is fetched, so that the DataLoader
+    workers start prefetching the next epoch while the last batch is being consumed.
+    The callbacks are still called before the first batch of the next epoch is returned.
+    """
     def __init__(self, iterable, callbacks=()):
         self.iterable = iterable
         self.iter_ = None
         self.callbacks = list(callbacks)
+        self._num_fetched = 0
+        self._epoch_ended = False
 
     def __getattr__(self, name):
         return getattr(self.iterable, name)
@@ -482,19 +654,38 @@ class InfIterator(six.Iterator):
     def __len__(self):
         return len(self.iterable)
 
+    def _call_callbacks(self):
+        if self.callbacks:
+            [callback() for callback in self.callbacks if callback is not None]
+
+    def _new_epoch(self):
+        self.iter_ = iter(self.iterable)
+        self._num_fetched = 0
+
     def __next__(self):
         if self.iter_ is None:
-            self.iter_ = iter(self.iterable)
+            self._new_epoch()
+        if self._epoch_ended:
+            self._epoch_ended = False
+            self._call_callbacks()
         try:
             data = next(self.iter_)
         except StopIteration:
-            if self.callbacks:
-                [callback() for callback in self.callbacks if callback is not None]
-            self.iter_ = iter(self.iterable)
+            self._call_callbacks()
+            self._new_epoch()
             data = next(self.iter_)
         # except RuntimeError as e:
         #     self.logger.error(e)
         #     raise
+        self._num_fetched += 1
+        try:
+            epoch_length = len(self.iterable)
+        except TypeError:
+            epoch_length = None
+        if self._num_fetched == epoch_length:
+            # prefetch the next epoch
+            self._new_epoch()
+            self._epoch_ended = True
         return data
 
     def add_callback(self, callback):
@@ -503,42 +694,75 @@ class InfIterator(six.Iterator):
 
     next = __next__
 
+_PERSISTENT_WORKERS_SUPPORTED = "persistent_workers" in \
+                                inspect.signature(torch.utils.data.DataLoader).parameters
+
 def get_inf_iterator(iterable, callback):
     return InfIterator(iterable, [callback])
 
+def save_split_indices(fname, dset_indices):
+    """
+    Save the indices of the dataset splits as an `.npz` archive
+    (written to `fname` as is, no suffix is appended).
+    """
+    with open(fname, "wb") as w_f:
+        np.savez(w_f, **{name: np.asarray(indices, dtype=np.int64)
+                         for name, indices in dset_indices.items()})
+
+def load_split_indices(fname):
+    """
+    Load the indices of the dataset splits saved by `save_split_indices`.
+    The legacy YAML format is also supported.
+    """
+    with open(fname, "rb") as r_f:
+        is_npz = r_f.read(4) == b"PK\x03\x04"
+    if is_npz:
+        with np.load(fname, allow_pickle=False) as npz:
+            return {name: npz[name] for name in npz.files}
+    with open(fname, "r") as r_f:
+        dset_indices = yaml.load(r_f, Loader=getattr(yaml, "CSafeLoader", yaml.SafeLoader))
+    return {name: np.asarray(indices, dtype=np.int64)
+            for name, indices in dset_indices.items()}
+
 def prepare_data_queues(dataset, queue_cfg_lst, data_type="image", drop_last=False,
-                        shuffle=False, shuffle_seed=None, num_workers=2, multiprocess=False, shuffle_indice_file=None):
+                        shuffle=False, shuffle_seed=None, num_workers=2, multiprocess=False, shuffle_indice_file=None,
+                        cache_eval_tensors=False):
     """
     Further partition the dataset splits, prepare different data queues.
 
+    If `cache_eval_tensors` is true (or "shared", to put the tensors into shared memory),
+    the queues on the deterministic splits (see `BaseDataset.deterministic_splits`) are
+    materialized into tensors once, and the batches are served by slicing them.
+
     Example::
     @TODO: doc
     """
     expect(data_type in {"image", "sequence"})
 
     dset_splits = dataset.splits()
+    deterministic_splits = set(dataset.deterministic_splits()) if cache_eval_tensors else set()
+    batch_augmentations = dataset.batch_augmentations()
+    tensor_caches = {}
     same_dset_mapping = dataset.same_data_split_mapping()
     dset_sizes = {n: len(d) for n, d in six.iteritems(dset_splits)}
-    dset_indices = {n: list(range(size)) for n, size in dset_sizes.items()}
+    dset_indices = {n: np.arange(size) for n, size in dset_sizes.items()}
     # save cur np random seed state and apply data seed only for shuffling data
     # then restore seed for the rest of the process
     if shuffle:
         assert shuffle_seed is not None
-        np_random_state = np.random.get_state()
-        np.random.seed(shuffle_seed)
-        [np.random.shuffle(indices) for indices in dset_indices.values()]
-        if shuffle_indice_file:
-            if os.path.exists(shuffle_indice_file):
-                with open(shuffle_indice_file, "r") as r_f:
-                    dset_indices = yaml.load(r_f)
-                _getLogger("aw_nas.torch_utils").info(
-                    "Load dataset split indices from %s", shuffle_indice_file)
-            else:
-                with open(shuffle_indice_file, "w") as w_f:
-                    yaml.dump(dset_indices, w_f)
+        if shuffle_indice_file and os.path.exists(shuffle_indice_file):
+            dset_indices = load_split_indices(shuffle_indice_file)
+            _getLogger("aw_nas.torch_utils").info(
+                "Load dataset split indices from %s", shuffle_indice_file)
+        else:
+            np_random_state = np.random.get_state()
+            np.random.seed(shuffle_seed)
+            [np.random.shuffle(indices) for indices in dset_indices.values()]
+            np.random.set_state(np_random_state)
+            if shuffle_indice_file:
+                save_split_indices(shuffle_indice_file, dset_indices)
                 _getLogger("aw_nas.torch_utils").info(
                     "Dump dataset split indices to %s", shuffle_indice_file)
-        np.random.set_state(np_random_state)
 
     used_portions = {n: 0. for n in dset_splits}
     queues = []
@@ -580,6 +804,29 @@ def prepare_data_queues(dataset, queue_cfg_lst, data_type="image", drop_last=Fal
                 "drop_last": drop_last,
                 "timeout": 0,
             }
+            if split in deterministic_splits and not multiprocess \
+               and "collate_fn" not in d_kwargs:
+                # the transformed data is fixed, materialize it once
+                cache_key = (split, ranges)
+                if cache_key not in tensor_caches:
+                    tensor_caches[cache_key] = cache_dataset_tensors(
+                        dset_splits[split], subset_indices, num_workers=num_workers,
+                        share_memory=cache_eval_tensors == "shared")
+                queue = get_inf_iterator(TensorBatchQueue(
+                    *tensor_caches[cache_key], batch_size=batch_size, shuffle=shuffle_queue,
+                    drop_last=other_kwargs.get("drop_last", drop_last)), callback)
+                queues.append(queue)
+                continue
+            if split in batch_augmentations and not multiprocess \
+               and "collate_fn" not in d_kwargs:
+                # keep the raw images resident, and augment batch by batch
+                raw_data, raw_targets, transform = batch_augmentations[split]
+                queue = get_inf_iterator(TensorBatchQueue(
+                    raw_data, raw_targets, batch_size=batch_size, shuffle=shuffle_queue,
+                    drop_last=other_kwargs.get("drop_last", drop_last),
+                    indices=subset_indices, transform=transform), callback)
+                queues.append(queue)
+                continue
             if not shuffle_queue:
                 # choose a subset of the dataset, and do not shuffle
                 dataset_split = torch.utils.data.Subset(dset_splits[split], subset_indices)
@@ -594,31 +841,66 @@ def prepare_data_queues(dataset, queue_cfg_lst, data_type="image", drop_last=Fal
                                        CustomDistributedSampler(split, subset_indices)
             kwargs.update(d_kwargs) # first update dataset-specific kwargs
             kwargs.update(other_kwargs) # then update queue-specific kwargs
+            if _PERSISTENT_WORKERS_SUPPORTED and kwargs["num_workers"] > 0:
+                # do not re-fork the workers at every epoch boundary
+                kwargs.setdefault("persistent_workers", True)
             queue = get_inf_iterator(torch.utils.data.DataLoader(dataset_split, **kwargs), callback)
         else: # data_type == "sequence"
             expect("bptt_steps" in cfg)
             bptt_steps = cfg["bptt_steps"]
-            dataset = SimpleDataset(
-                batchify_sentences(
-                    dset_splits[split][ranges[0]: ranges[1]],
-                    batch_size)
-            )
-            kwargs = {
-                "batch_size": bptt_steps,
-                "pin_memory": False,
-                "num_workers": 0,
-                "shuffle": False
-            }
-            # update the dataset/queue-specific kwargs
-            kwargs.update(d_kwargs)
-            kwargs.update(other_kwargs)
-            queue = get_inf_iterator(torch.utils.data.DataLoader(
-                dataset, **kwargs), callback)
+            # strided BPTT windows over the token tensor
+            queue = get_inf_iterator(BPTTBatchQueue(
+                dset_splits[split][ranges[0]: ranges[1]], batch_size, bptt_steps,
+                random_bptt=other_kwargs.get("random_bptt", False),
+                drop_last=other_kwargs.get("drop_last", False),
+                device="cuda" if torch.cuda.is_available() else None), callback)
 
         queues.append(queue)
 
     return queues
 
+class BatchAugmentation(object):
+    """
+    The batched version of `RandomCrop(padding=padding)`, `RandomHorizontalFlip`,
+    `ToTensor`, `Normalize(mean, std)` and `Cutout(cutout)`, applied on a
+    uint8 image batch of shape (N, C, H, W).
+    """
+    def __init__(self, mean, std, padding=0, flip=False, cutout=None):
+        self.mean = torch.tensor(mean, dtype=torch.float32).view(1, -1, 1, 1)
+        self.std = torch.tensor(std, dtype=torch.float32).view(1, -1, 1, 1)
+        self.padding = padding
+        self.flip = flip
+        self.cutout = cutout
+
+    def __call__(self, images):
+        num, _, h, w = images.shape
+        if self.padding or self.flip:
+            rows = torch.arange(h).unsqueeze(0).expand(num, h)
+            cols = torch.arange(w).unsqueeze(0).expand(num, w)
+            if self.padding:
+                images = F.pad(images, [self.padding] * 4)
+                rows = rows + torch.randint(0, 2 * self.padding + 1, (num, 1))
+                cols = cols + torch.randint(0, 2 * self.padding + 1, (num, 1))
+            if self.flip:
+                cols = torch.where(torch.rand(num, 1) < 0.5, cols.flip(1), cols)
+            # (N, H, W, C) -> (N, C, H, W)
+            images = images[torch.arange(num)[:, None, None], :,
+                            rows[:, :, None], cols[:, None, :]].permute(0, 3, 1, 2)
+        images = (images.float().div_(255.) - self.mean.to(images.device)) \
+                 / self.std.to(images.device)
+        if self.cutout:
+            ys = torch.randint(0, h, (num, 1))
+            xs = torch.randint(0, w, (num, 1))
+            half = self.cutout // 2
+            grid_y = torch.arange(h).unsqueeze(0)
+            grid_x = torch.arange(w).unsqueeze(0)
+            in_y = (grid_y >= ys - half) & (grid_y < ys + half)
+            in_x = (grid_x >= xs - half) & (grid_x < xs + half)
+            mask = ~(in_y[:, :, None] & in_x[:, None, :])
+            images = images * mask.unsqueeze(1).to(images)
+        return images
+
+
 class Cutout(object):
     """
     Cutout randomized rectangle of size (length, length)
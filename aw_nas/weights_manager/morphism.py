@@ -1,5 +1,8 @@
 # -*- coding: utf-8 -*-
 
+import os
+from collections import OrderedDict
+
 import torch
 
 from aw_nas.weights_manager.base import BaseWeightsManager
@@ -10,32 +13,77 @@ __all__ = ["MorphismWeightsManager"]
 class MorphismWeightsManager(BaseWeightsManager):
     NAME = "morphism"
 
-    def __init__(self, search_space, device, rollout_type):
+    def __init__(self, search_space, device, rollout_type,
+                 parent_cache_size=4, mmap_checkpoint=False):
         super(MorphismWeightsManager, self).__init__(search_space, device, rollout_type)
 
         self.search_space = search_space
         self.device = device
         self.rollout_type = rollout_type
+        # mutation controllers expand the same few parents over and over again,
+        # keep the most recently used parent state dicts (on cpu) in memory
+        self.parent_cache_size = parent_cache_size
+        self.mmap_checkpoint = mmap_checkpoint
+        # (checkpoint path, mtime) -> (parent state dict, {child param names: shared names})
+        self._parent_cache = OrderedDict()
 
-    def assemble_candidate(self, rollout):
-        """Assemble a candidate net using rollout.
-        """
-        _model_record = rollout.population.get_model(rollout.parent_index)
-        _parent_model = torch.load(_model_record.checkpoint_path)
+    def __getstate__(self):
+        state = super(MorphismWeightsManager, self).__getstate__()
+        # do not pickle the cached parent weights
+        state["_parent_cache"] = OrderedDict()
+        return state
+
+    def _load_parent(self, checkpoint_path):
+        key = (os.path.abspath(checkpoint_path), os.path.getmtime(checkpoint_path))
+        if key in self._parent_cache:
+            self._parent_cache.move_to_end(key)
+            return self._parent_cache[key]
+
+        load_kwargs = {"map_location": "cpu"}
+        if self.mmap_checkpoint:
+            # only supported by torch>=2.1 and zipfile-based checkpoints
+            load_kwargs["mmap"] = True
+        _parent_model = torch.load(checkpoint_path, **load_kwargs)
         if not isinstance(_parent_model, dict):
             parent_state_dict = _parent_model.state_dict()
         else:
             parent_state_dict = _parent_model
+        parent_state_dict = OrderedDict([(n, v.detach()) for n, v in parent_state_dict.items()])
+        entry = (parent_state_dict, {})
+        if self.parent_cache_size > 0:
+            self._parent_cache[key] = entry
+            while len(self._parent_cache) > self.parent_cache_size:
+                self._parent_cache.popitem(last=False)
+        return entry
+
+    def assemble_candidate(self, rollout):
+        """Assemble a candidate net using rollout.
+        """
+        _model_record = rollout.population.get_model(rollout.parent_index)
+        parent_state_dict, shared_names = self._load_parent(_model_record.checkpoint_path)
         # construct a new CNNGenotypeModel using new configuration
         _child_model = FinalModel.get_class_(_model_record.config["final_model_type"])(
             self.search_space, self.device,
             **_model_record.config["final_model_cfg"]
         )
-        for n, v in _child_model.named_parameters():
-            if n in parent_state_dict:
-                v.data.copy_(parent_state_dict[n])
+        child_params = OrderedDict(_child_model.named_parameters())
+        names_key = tuple(child_params.keys())
+        if names_key not in shared_names:
+            shared_names[names_key] = [n for n in names_key if n in parent_state_dict]
+        names = shared_names[names_key]
+        if names:
+            dsts = [child_params[n].data for n in names]
+            srcs = [parent_state_dict[n] for n in names]
+            if hasattr(torch, "_foreach_copy_"):
+                torch._foreach_copy_(dsts, srcs)
+            else:
+                for dst, src in zip(dsts, srcs):
+                    dst.copy_(src)
         return _child_model
 
+    def clear_parent_cache(self):
+        self._parent_cache.clear()
+
     def step(self, gradients, optimizer):
         """Update the weights manager state using gradients."""
         pass
@@ -11,7 +11,6 @@ from aw_nas import Component
 from aw_nas.ops import *
 from aw_nas.ops.baseline_ops import MobileNetV2Block, MobileNetV3Block
 from aw_nas.utils import make_divisible, feature_level_to_stage_index
-from aw_nas.utils.common_utils import _get_channel_mask
 
 
 class FlexibleBlock(Component, nn.Module):
@@ -91,9 +90,8 @@ class FlexibleMobileNetV2Block(MobileNetV2Block, FlexibleBlock):
     def set_mask(self, expansion, kernel_size):
         mask = None
         if expansion is not None and expansion != self.expansion:
-            filters = self.point_linear[0].weight.data
-            mask = _get_channel_mask(filters, make_divisible(self.C *
-                expansion, 8))
+            mask = self.point_linear[0].get_channel_mask(
+                make_divisible(self.C * expansion, 8))
         if self.inv_bottleneck:
             self.inv_bottleneck[0].set_mask(None, mask)
             self.inv_bottleneck[1].set_mask(mask)
@@ -219,9 +217,8 @@ class FlexibleMobileNetV3Block(MobileNetV3Block, FlexibleBlock):
     def set_mask(self, expansion, kernel_size):
         mask = None
         if expansion != self.expansion:
-            filters = self.point_linear[0].weight.data
-            mask = _get_channel_mask(filters, make_divisible(self.C *
-                expansion, 8))
+            mask = self.point_linear[0].get_channel_mask(
+                make_divisible(self.C * expansion, 8))
         if self.inv_bottleneck:
             self.inv_bottleneck[0].set_mask(None, mask)
             self.inv_bottleneck[1].set_mask(mask)
@@ -319,6 +316,21 @@ class BaseBackboneArch(Component, nn.Module):
         make a serial of blocks as a stage
         """
 
+    def finalize(self, blocks, expansions, kernel_sizes):
+        # the flexible cells would be replaced, do not copy them
+        finalized_model = copy.deepcopy(self, {id(self.cells): None})
+        cells = []
+        for i, cell in enumerate(self.cells):
+            cells.append([])
+            for j, block in enumerate(cell):
+                if j >= blocks[i]:
+                    break
+                block.set_mask(expansions[i][j], kernel_sizes[i][j])
+                cells[-1].append(block.finalize())
+            cells[-1] = nn.ModuleList(cells[-1])
+        finalized_model.cells = nn.ModuleList(cells)
+        return finalized_model
+
 
 class MobileNetV2Arch(BaseBackboneArch):
     NAME = "mbv2_backbone"
@@ -482,20 +494,6 @@ class MobileNetV2Arch(BaseBackboneArch):
         out = F.adaptive_avg_pool2d(out, 1)
         return self.classifier(out).flatten(1)
 
-    def finalize(self, blocks, expansions, kernel_sizes):
-        cells = []
-        finalized_model = copy.deepcopy(self)
-        for i, cell in enumerate(self.cells):
-            cells.append([])
-            for j, block in enumerate(cell):
-                if j >= blocks[i]:
-                    break
-                block.set_mask(expansions[i][j], kernel_sizes[i][j])
-                cells[-1].append(block.finalize())
-            cells[-1] = nn.ModuleList(cells[-1])
-        finalized_model.cells = nn.ModuleList(cells)
-        return finalized_model
-
     def extract_features(self, inputs, p_levels, rollout=None, drop_connect_rate=0.0):
         out = self.stem(inputs)
         level_indexes = feature_level_to_stage_index(self.strides)
@@ -694,20 +692,6 @@ class MobileNetV3Arch(BaseBackboneArch):
         out = torch.flatten(out, 1)
         return self.classifier(out)
 
-    def finalize(self, blocks, expansions, kernel_sizes):
-        cells = []
-        finalized_model = copy.deepcopy(self)
-        for i, cell in enumerate(self.cells):
-            cells.append([])
-            for j, block in enumerate(cell):
-                if j >= blocks[i]:
-                    break
-                block.set_mask(expansions[i][j], kernel_sizes[i][j])
-                cells[-1].append(block.finalize())
-            cells[-1] = nn.ModuleList(cells[-1])
-        finalized_model.cells = nn.ModuleList(cells)
-        return finalized_model
-
     def extract_features(self, inputs, p_levels, rollout=None, drop_connect_rate=0.0):
         out = self.stem(inputs)
         level_indexes = feature_level_to_stage_index(self.strides)
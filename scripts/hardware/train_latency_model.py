@@ -8,7 +8,7 @@ from torch import optim
 from sklearn import linear_model
 from sklearn.neural_network import MLPRegressor
 
-from aw_nas.hardware.utils import Prim
+from aw_nas.hardware.utils import Prim, load_table
 
 
 def reg_data_to_feature(dataset, table=None):
@@ -85,9 +85,7 @@ def train_and_test(model, data_to_feature_fn, **kwargs):
     with open("samples.pkl", "rb") as fr:
         samples = pickle.load(fr)
 
-    with open("test_model.pkl", "rb") as fr:
-        table = pickle.load(fr)["table"]
-        table = {Prim(**k): v for k, v in table}
+    table = load_table("test_model.pkl")
 
     train_feature, train_y = data_to_feature_fn(samples["train"], None)
     model.fit(train_feature, train_y, **kwargs)
@@ -1,4 +1,5 @@
 import os
+import shutil
 import numpy as np
 
 import pytest
@@ -125,3 +126,25 @@ def test_population_init(init_population_dir):
     rollout = rollout_from_genotype_str(str(population.get_model(0).genotype), search_space)
     assert str(rollout.genotype) == str(population.get_model(0).genotype)
     assert population.contain_rollout(rollout)
+
+def test_population_jsonl(init_population_dir, tmp_path):
+    from aw_nas.rollout.mutation import Population
+    from aw_nas.common import rollout_from_genotype_str
+
+    init_dir, search_space = init_population_dir
+    population = Population.init_from_dirs([init_dir], search_space)
+    jsonl_dir = os.path.join(str(tmp_path), "jsonl_population")
+    assert population.save(jsonl_dir, 0, save_format="jsonl") == population.size
+    # append-only, the duplicated records are overwritten when loading
+    population.save(jsonl_dir, 0, save_format="jsonl")
+    shutil.copyfile(os.path.join(init_dir, "template.yaml"),
+                    os.path.join(jsonl_dir, "template.yaml"))
+    jsonl_population = Population.init_from_dirs([jsonl_dir], search_space)
+    assert jsonl_population.size == population.size
+    for ind, record in population.model_records.items():
+        new_record = jsonl_population.get_model(ind)
+        assert str(new_record.genotype) == str(record.genotype)
+        assert new_record.perfs == record.perfs
+        rollout = rollout_from_genotype_str(str(record.genotype), search_space)
+        assert jsonl_population.contain_rollout(rollout)
+        assert jsonl_population.get_index_by_genotype(rollout.genotype) == ind
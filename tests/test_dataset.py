@@ -1,6 +1,11 @@
 import os
 import pytest
 
+import numpy as np
+import torch
+
+from aw_nas.dataset.base import BaseDataset
+
 # we use environments variable to mark slow instead of register new pytest marks here.
 AWNAS_TEST_SLOW = os.environ.get("AWNAS_TEST_SLOW", None)
 
@@ -17,6 +22,28 @@ def test_ptb_batchify():
     assert inputs.shape[0] == targets.shape[0]
     assert inputs.shape[1] == targets.shape[1] == 32
 
+def test_corpus_tokenize_cache(tmp_path):
+    import torch
+    from aw_nas.dataset.ptb import Corpus, SentenceCorpus
+
+    for split, text in [("train", "a b c\nb c d e\n"), ("valid", "e f\n"), ("test", "a f\n\n")]:
+        tmp_path.joinpath(split + ".txt").write_text(text)
+    corpus = SentenceCorpus(str(tmp_path))
+    assert tmp_path.joinpath(Corpus.CACHE_NAME).exists()
+    assert [sent.tolist() for sent in corpus.train] == [[0, 1, 2, 3], [1, 2, 4, 5, 3]]
+    assert [sent.tolist() for sent in corpus.test] == [[0, 6, 3], [3]]
+    assert corpus.vocabulary.counter[3] == 5 and corpus.vocabulary.total == 16
+
+    # loaded from the cache
+    cached = Corpus(str(tmp_path))
+    assert cached.vocabulary.idx2word == corpus.vocabulary.idx2word
+    assert cached.vocabulary.counter == corpus.vocabulary.counter
+    assert torch.equal(cached.train, torch.cat(corpus.train))
+
+    # the cache is invalidated when the text files change
+    tmp_path.joinpath("valid.txt").write_text("e f g\n")
+    assert len(Corpus(str(tmp_path)).vocabulary) == 8
+
 def test_infinite_get_callback():
     from aw_nas.utils.torch_utils import get_inf_iterator, SimpleDataset
     import torch
@@ -39,3 +66,164 @@ def test_imagenet_sample_class():
     from aw_nas.dataset import BaseDataset
     dataset = BaseDataset.get_class_("imagenet")(load_train_only=True, num_sample_classes=20, random_choose=True)
     assert len(dataset.choosen_classes) == 20
+
+def test_voc_annotation_index(tmp_path):
+    import numpy as np
+    pytest.importorskip("cv2")
+    from aw_nas.dataset.voc import VOCDataset
+
+    anno_dir = tmp_path / "VOC2007" / "Annotations"
+    anno_dir.mkdir(parents=True)
+    (tmp_path / "VOC2007" / "ImageSets" / "Main").mkdir(parents=True)
+    (tmp_path / "VOC2007" / "ImageSets" / "Main" / "trainval.txt").write_text("000\n001\n002\n")
+    obj = ("<object><name>{}</name><difficult>{}</difficult><bndbox><xmin>{}</xmin>"
+           "<ymin>2</ymin><xmax>20</xmax><ymax>30</ymax></bndbox></object>")
+    (anno_dir / "000.xml").write_text("<annotation>{}{}</annotation>".format(
+        obj.format("dog", 0, 5), obj.format("unknown", 0, 1)))
+    (anno_dir / "001.xml").write_text("<annotation></annotation>")
+    (anno_dir / "002.xml").write_text("<annotation>{}{}</annotation>".format(
+        obj.format("Cat", 1, 3), obj.format("bird", "", 7)))
+
+    dataset = VOCDataset(str(tmp_path), [("VOC2007", "trainval")])
+    img_id, (boxes, labels, is_difficult) = dataset.get_annotation(2)
+    assert img_id == ("VOC2007", "002")
+    assert np.allclose(boxes, [[2, 1, 19, 29], [6, 1, 19, 29]])
+    assert labels.tolist() == [8, 3] and is_difficult.tolist() == [1, 0]
+    assert dataset.get_annotation(1)[1][0].shape == (0, 4)
+    assert len(list((tmp_path / "awnas_cache").iterdir())) == 1
+
+    # loaded from the cache, and invalidated when the annotations change
+    assert VOCDataset(str(tmp_path), [("VOC2007", "trainval")]).get_annotation(
+        0)[1][1].tolist() == [12]
+    (anno_dir / "001.xml").write_text("<annotation>{}</annotation>".format(
+        obj.format("dog", 0, 5)))
+    assert VOCDataset(str(tmp_path), [("VOC2007", "trainval")]).get_annotation(
+        1)[1][1].tolist() == [12]
+
+def test_voc_annotation_index_read_only(tmp_path, monkeypatch):
+    pytest.importorskip("cv2")
+    from aw_nas.dataset.voc import VOCDataset
+
+    (tmp_path / "VOC2007" / "Annotations").mkdir(parents=True)
+    (tmp_path / "VOC2007" / "ImageSets" / "Main").mkdir(parents=True)
+    (tmp_path / "VOC2007" / "ImageSets" / "Main" / "trainval.txt").write_text("000\n")
+    (tmp_path / "VOC2007" / "Annotations" / "000.xml").write_text(
+        "<annotation><object><name>dog</name><difficult>0</difficult><bndbox><xmin>5</xmin>"
+        "<ymin>2</ymin><xmax>20</xmax><ymax>30</ymax></bndbox></object></annotation>")
+
+    def _read_only(*args, **kwargs):
+        raise PermissionError("read-only file system")
+    monkeypatch.setattr(os, "makedirs", _read_only)
+    # the parsed annotations are used without caching
+    dataset = VOCDataset(str(tmp_path), [("VOC2007", "trainval")])
+    assert dataset.get_annotation(0)[1][1].tolist() == [12]
+    assert not (tmp_path / "awnas_cache").exists()
+
+class _ImageSplit(object):
+    def __init__(self, num):
+        self.data = np.random.randint(0, 256, size=(num, 32, 32, 3), dtype=np.uint8)
+        self.targets = list(range(num))
+
+class _SharedFakeDataset(BaseDataset):
+    NAME = "a_fake_shared_dataset"
+
+    def __init__(self):
+        super(_SharedFakeDataset, self).__init__()
+        self.sentences = [torch.arange(5), torch.arange(3)]
+        self.datasets = {"train": _ImageSplit(1200), "train_testTransform": None,
+                         "test": _ImageSplit(10), "sentences": self.sentences}
+        self.datasets["train_testTransform"] = _ImageSplit(1)
+        self.datasets["train_testTransform"].data = self.datasets["train"].data.copy()
+
+    def splits(self):
+        return self.datasets
+
+    @classmethod
+    def data_type(cls):
+        return "image"
+
+
+def test_dataset_share_memory():
+    import pickle
+    from multiprocessing.reduction import ForkingPickler
+
+    dataset = _SharedFakeDataset()
+    train_data = dataset.datasets["train"].data.copy()
+    dataset.share_memory()
+    splits = dataset.splits()
+    assert np.array_equal(splits["train"].data, train_data)
+    # the same data is only shared once, small arrays are not shared
+    assert splits["train_testTransform"].data is splits["train"].data
+    assert sorted(dataset._shared_objects) == ["sentences", "train.data"]
+    assert dataset.sentences is splits["sentences"]
+    assert [sent.tolist() for sent in dataset.sentences] == [[0, 1, 2, 3, 4], [0, 1, 2]]
+
+    payload = ForkingPickler.dumps(dataset)
+    assert len(payload) < train_data.nbytes / 10
+    received = pickle.loads(payload)
+    received_splits = received.splits()
+    assert received_splits["train_testTransform"].data is received_splits["train"].data
+    assert received.sentences is received_splits["sentences"]
+    assert received_splits["test"].targets == list(range(10))
+    # attached to the same memory
+    splits["train"].data[0] = 0
+    dataset.sentences[1][0] = 10
+    assert (received_splits["train"].data[0] == 0).all()
+    assert received.sentences[1].tolist() == [10, 1, 2]
+
+    # plain pickling still copies the data
+    copied = pickle.loads(pickle.dumps(dataset))
+    assert not hasattr(copied, "_shared_objects")
+    assert np.array_equal(copied.splits()["train"].data, splits["train"].data)
+
+def test_imagenet_dataset_index_cache(tmp_path):
+    import pickle
+    from PIL import Image
+    from aw_nas.dataset.imagenet import ImageNetDataset
+
+    root = tmp_path / "train"
+    for cls_idx in range(4):
+        cls_dir = root / "n{:04d}".format(cls_idx)
+        cls_dir.mkdir(parents=True)
+        for i in range(cls_idx + 1):
+            Image.new("RGB", (4, 4)).save(str(cls_dir / "img_{}.JPEG".format(i)))
+
+    dataset = ImageNetDataset(root=str(root))
+    assert len(dataset) == 10 and dataset.targets == [0, 1, 1, 2, 2, 2, 3, 3, 3, 3]
+    assert len(list((tmp_path / "awnas_cache").iterdir())) == 2
+
+    # loaded from the memory-mapped index
+    dataset = ImageNetDataset(root=str(root))
+    assert isinstance(dataset._targets, np.memmap)
+    assert dataset.samples[0] == (str(root / "n0000" / "img_0.JPEG"), 0)
+    assert pickle.loads(pickle.dumps(dataset)).targets == dataset.targets
+    assert dataset.filter(num_classes=2, class_names=["n0003", "n0001"]) == ["n0003", "n0001"]
+    # the order of the samples is kept
+    assert dataset.targets == [1, 1, 0, 0, 0, 0]
+    assert dataset[4][1] == 0 and dataset[4][0].size == (4, 4)
+
+def test_preproc_crop_expand_distort():
+    import random
+    from aw_nas.dataset import data_augmentation
+
+    image = np.random.uniform(0, 255, size=(60, 80, 3)).astype(np.float32)
+    boxes = np.array([[10., 10., 30., 40.], [40., 20., 70., 55.]])
+    labels = np.array([1., 2.])
+    random.seed(0)
+    for _ in range(100):
+        image_t, boxes_t, labels_t = data_augmentation._crop(image, boxes, labels)
+        height, width, _ = image_t.shape
+        assert 0 < len(boxes_t) == len(labels_t)
+        assert (boxes_t >= 0).all()
+        assert (boxes_t[:, 2] <= width).all() and (boxes_t[:, 3] <= height).all()
+
+        expanded, boxes_e = data_augmentation._expand(image_t, boxes_t, 0, 1.)
+        assert expanded.shape[0] >= height and expanded.shape[1] >= width
+        left, top = (boxes_e - boxes_t)[0, :2].astype(int)
+        assert np.array_equal(expanded[top:top + height, left:left + width], image_t)
+
+    image_copy = image.copy()
+    distorted = data_augmentation._distort(image)
+    assert distorted.shape == image.shape and distorted.dtype == np.float32
+    # the input image is not modified inplace
+    assert np.array_equal(image, image_copy)
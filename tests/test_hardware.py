@@ -335,3 +335,179 @@ def test_gen_model(case):
 
     for prim, perf in hwobj_model._table.items():
         assert isinstance(prim, Prim)
+
+
+_OFA_MIXIN_CFG = {
+    "width_choice": [3, 4, 6],
+    "depth_choice": [2, 3, 4],
+    "kernel_choice": [3, 5, 7],
+    "image_size_choice": [224],
+    "num_cell_groups": [1, 4, 4, 4, 4, 4],
+    "expansions": [1, 6, 6, 6, 6, 6],
+}
+
+_OFA_PROF_PRIMS_CFG = {
+    "primitive_type": "mobilenet_v3_block",
+    "spatial_size": 224,
+    "strides": [1, 2, 2, 2, 1, 2],
+    "base_channels": [16, 16, 24, 32, 64, 96, 160, 960, 1280],
+    "mult_ratio": 1.0,
+    "use_ses": [False, False, True, False, True, True],
+    "acts": ["relu", "relu", "relu", "h_swish", "h_swish", "h_swish"],
+}
+
+
+def _random_prof_nets(ss, num_nets, num_profs=3):
+    import numpy as np
+
+    prof_nets = []
+    for _ in range(num_nets):
+        primitives = ss.rollout_to_primitives(ss.random_sample(), **_OFA_PROF_PRIMS_CFG)
+        perfs = np.random.uniform(1., 2., size=len(primitives))
+        prof_net = []
+        for _ in range(num_profs):
+            prims = [dict(prim._asdict(), performances={"latency": float(perf)})
+                     for prim, perf in zip(primitives, perfs)]
+            prof_net.append({"primitives": prims, "overall_latency": float(perfs.sum()) * 0.9})
+        prof_nets.append(prof_net)
+    return prof_nets
+
+
+@pytest.mark.parametrize("hwperfmodel_type", ["table", "regression", "mlp"])
+def test_predict_many(hwperfmodel_type):
+    from aw_nas.common import get_search_space
+
+    try:
+        from sklearn import linear_model
+    except ImportError:
+        pytest.xfail("Package 'scikit-learn' not found, this test case should fail")
+    ss = get_search_space("ofa_mixin", **_OFA_MIXIN_CFG)
+    hwperfmodel_cfg = {"perf_name": "latency", "prof_prims_cfg": _OFA_PROF_PRIMS_CFG}
+    if hwperfmodel_type == "table":
+        hwperfmodel_cfg["preprocessors"] = ["block_sum", "remove_anomaly", "flatten"]
+    model = ss.parse_profiling_primitives(hwperfmodel_type, hwperfmodel_cfg)
+    model.train(_random_prof_nets(ss, 4))
+
+    rollouts = [ss.random_sample() for _ in range(5)]
+    perfs = model.predict_many(rollouts)
+    assert len(perfs) == len(rollouts)
+    for rollout, perf in zip(rollouts, perfs):
+        assert abs(model.predict(rollout) - perf) < 1e-6
+    assert model.predict_many([]) == []
+
+
+def test_prim_interning():
+    import pickle
+    from aw_nas.ops import get_op, register_primitive
+    from aw_nas.hardware.utils import Prim
+
+    prim = Prim("mobilenet_v2_block", 112, 16, 24, 2, True,
+                kernel_size=3, expansion=6, activation="relu")
+    assert prim is Prim("mobilenet_v2_block", 112.0, 16, 24, 2, True,
+                        activation="relu", expansion=6, kernel_size=3)
+    assert prim is Prim(**prim._asdict())
+    assert prim is pickle.loads(pickle.dumps(prim))
+    assert hash(prim) == tuple.__hash__(prim)
+
+    # re-registering the primitive invalidates the cached signature
+    ori_factory = get_op("mobilenet_v2_block")
+    register_primitive(
+        "mobilenet_v2_block",
+        lambda C, C_out, stride, affine, kernel_size, expansion=4: None,
+        override=True)
+    try:
+        new_prim = Prim("mobilenet_v2_block", 112, 16, 24, 2, True, kernel_size=3)
+        assert dict(new_prim.kwargs) == {"kernel_size": 3, "expansion": 4}
+    finally:
+        register_primitive("mobilenet_v2_block", ori_factory, override=True)
+
+
+def test_compiled_table(tmp_path):
+    import pickle
+    import numpy as np
+    from aw_nas.common import get_search_space
+    from aw_nas.hardware.utils import Prim, PrimTable, load_table
+
+    ss = get_search_space("ofa_mixin", **_OFA_MIXIN_CFG)
+    hwperfmodel_cfg = {"perf_name": "latency", "prof_prims_cfg": _OFA_PROF_PRIMS_CFG,
+                       "preprocessors": ["flatten"]}
+    model = ss.parse_profiling_primitives("table", hwperfmodel_cfg)
+    model.train(_random_prof_nets(ss, 4))
+    table = dict(model._table)
+
+    compiled = PrimTable.from_dict(table)
+    assert len(compiled) == len(table)
+    prims = list(table.keys())
+    unknown = Prim("mobilenet_v3_block", 7, 3, 5, 1, True, kernel_size=9,
+                   expansion=6, activation="relu", use_se=False)
+    values, found = compiled.lookup(prims + [unknown])
+    assert found[:-1].all() and not found[-1]
+    assert np.allclose(values[:-1], [table[p] for p in prims])
+    assert compiled.to_dict() == table
+
+    rollouts = [ss.random_sample() for _ in range(3)]
+    perfs = model.predict_many(rollouts)
+    for path in [str(tmp_path / "table.npz"), str(tmp_path / "table.pkl")]:
+        model.save(path)
+        new_model = ss.parse_profiling_primitives("table", hwperfmodel_cfg)
+        new_model.load(path)
+        assert np.allclose(new_model.predict_many(rollouts), perfs)
+        assert new_model._table == table
+
+    # legacy pickled tables
+    with open(str(tmp_path / "legacy.pkl"), "wb") as wf:
+        pickle.dump({"table": [(k._asdict(), v) for k, v in table.items()]}, wf)
+    assert load_table(str(tmp_path / "legacy.pkl")).to_dict() == table
+
+
+def test_iterate_and_preprocess(tmp_path):
+    import yaml
+    from aw_nas.common import get_search_space
+    from aw_nas.hardware.base import Preprocessor
+    from aw_nas.hardware.utils import iterate
+
+    ss = get_search_space("ofa_mixin", **_OFA_MIXIN_CFG)
+    prof_nets = _random_prof_nets(ss, 3, num_profs=10)
+    # an anomalous profile
+    prof_nets[0][0]["primitives"][0]["performances"]["latency"] += 10.
+    for i, prof_net in enumerate(prof_nets):
+        net_dir = tmp_path / "net{}".format(i)
+        net_dir.mkdir()
+        for j, ith_prof in enumerate(prof_net):
+            with open(str(net_dir / "{}.yaml".format(j)), "w") as wf:
+                yaml.safe_dump(ith_prof, wf)
+
+    def _dumps(nets):
+        return sorted(sorted(yaml.safe_dump(p) for p in net) for net in nets)
+
+    loaded = list(iterate(str(tmp_path)))
+    assert _dumps(loaded) == _dumps(prof_nets)
+    assert _dumps(iterate(str(tmp_path), num_workers=2)) == _dumps(loaded)
+
+    preprocessor = Preprocessor(["block_sum", "remove_anomaly", "flatten"])
+    profs = list(preprocessor(loaded, is_training=True, performance="latency"))
+    assert len(profs) == sum(len(net) for net in prof_nets) - 1
+    for ith_prof in profs:
+        assert abs(ith_prof["block_sum_latency"] - sum(
+            p["performances"]["latency"] for p in ith_prof["primitives"])) < 1e-6
+
+
+def test_preprocessor_transform():
+    import copy
+    from aw_nas.common import get_search_space
+    from aw_nas.hardware.base import Preprocessor
+    from aw_nas.hardware.utils import RemoveAnomalyPreprocessor
+
+    ss = get_search_space("ofa_mixin", **_OFA_MIXIN_CFG)
+    prof_nets = _random_prof_nets(ss, 2, num_profs=10)
+    prof_nets[0][0]["primitives"][0]["performances"]["latency"] += 10.
+
+    preprocessor = Preprocessor(["block_sum", "remove_anomaly", "flatten"])
+    assert not any(isinstance(prep, RemoveAnomalyPreprocessor)
+                   for prep in preprocessor._inference_pipeline)
+    num_profs = sum(len(net) for net in prof_nets)
+    assert len(list(preprocessor(copy.deepcopy(prof_nets), is_training=True))) == num_profs - 1
+    profs = list(preprocessor.transform_many(copy.deepcopy(prof_nets)))
+    assert len(profs) == num_profs
+    assert profs == list(preprocessor(copy.deepcopy(prof_nets), is_training=False))
+    assert list(preprocessor.transform_one(copy.deepcopy(prof_nets[1]))) == profs[10:]
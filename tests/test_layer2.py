@@ -313,3 +313,65 @@ def test_check_connectivity(genotype_str):
         rollout = search_space.random_sample()
         print(rollout.macro.ck_connect())
 
+
+def test_batch_overall_adj():
+    from aw_nas.common import get_search_space
+    ss = get_search_space("macro-stagewise", num_cell_groups=2,
+                          cell_layout=[0, 0, 1, 0, 0, 0, 1, 0, 0, 0, 0],
+                          reduce_cell_groups=[1])
+    rollouts = [ss.random_sample() for _ in range(10)]
+    overall_adjs = ss.parse_overall_adjs(rollouts)
+    assert overall_adjs.shape == (10, ss.num_layers + 2, ss.num_layers + 2)
+    connected, all_connected = ss.ck_connect([r.genotype for r in rollouts], verbose=True)
+    assert connected.shape == all_connected.shape == (10, ss.stage_num)
+    for rollout, overall_adj, conn, all_conn in zip(
+            rollouts, overall_adjs, connected, all_connected):
+        assert (ss.parse_overall_adj(rollout.genotype) == overall_adj).all()
+        assert (_loop_overall_adj(ss, rollout.arch) == overall_adj).all()
+        r_conn, r_all_conn = rollout.ck_connect(verbose=True)
+        assert (r_conn == conn).all()
+        assert (r_all_conn == all_conn).all()
+        # the original per-stage DFS check
+        assert (r_conn == [_dfs(0, arch, np.zeros(arch.shape[0]))[-1]
+                           for arch in rollout.arch]).all()
+        assert (r_all_conn == [_dfs(0, arch, np.zeros(arch.shape[0])).all()
+                               for arch in rollout.arch]).all()
+
+
+def _loop_overall_adj(ss, stage_conns):
+    # the original per-edge construction of the overall adjacency matrix
+    last_node_idx = 0
+    overall_adj = np.zeros((ss.num_layers + 2, ss.num_layers + 2))
+    for i_stage, stage_conn in enumerate(stage_conns):
+        while last_node_idx < ss.stages_begin[i_stage] + 1:
+            overall_adj[last_node_idx + 1, last_node_idx] = 1
+            last_node_idx += 1
+        for to_, from_ in zip(*np.where(stage_conn)):
+            overall_adj[ss.stages_begin[i_stage] + 1 + to_,
+                        ss.stages_begin[i_stage] + 1 + from_] = 1
+        last_node_idx = ss.stages_end[i_stage] + 1
+    while last_node_idx < ss.num_layers:
+        overall_adj[last_node_idx + 1, last_node_idx] = 1
+        last_node_idx += 1
+    return overall_adj
+
+
+def _dfs(v, adj, visited):
+    visited[v] = 1
+    for new_v in np.argwhere(adj[:, v].reshape(-1)):
+        if not visited[new_v]:
+            _dfs(new_v, adj, visited)
+    return visited
+
+
+def test_reachable_from_source():
+    from aw_nas.btcs.layer2.search_space import reachable_from_source
+
+    for num_nodes in [1, 2, 5, 9, 17]:
+        # sparse random graphs (might have cycles), so that some nodes are unreachable
+        adjs = np.random.rand(20, num_nodes, num_nodes) < 1.5 / num_nodes
+        reachables = reachable_from_source(adjs)
+        assert reachables.shape == (20, num_nodes)
+        for adj, reachable in zip(adjs, reachables):
+            assert (reachable == _dfs(0, adj, np.zeros(num_nodes))).all()
+        assert (reachable_from_source(torch.tensor(adjs.astype(np.float32))) == reachables).all()
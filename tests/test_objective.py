@@ -130,6 +130,7 @@ def test_inject(super_net):
     "image_size=224, cell_0=1, cell_1=2, cell_2=2, cell_3=1, cell_4=1, cell_5=1, cell_0_block_0=(1, 3), cell_1_block_0=(1, 3), cell_1_block_1=(4, 5), cell_1_block_2=(6, 3), cell_1_block_3=(2, 3), cell_2_block_0=(3, 3), cell_2_block_1=(3, 5), cell_2_block_2=(6, 3), cell_2_block_3=(5, 3), cell_3_block_0=(3, 5), cell_3_block_1=(3, 5), cell_3_block_2=(6, 3), cell_3_block_3=(3, 3), cell_4_block_0=(3, 3), cell_4_block_1=(2, 3), cell_4_block_2=(2, 3), cell_4_block_3=(6, 3), cell_5_block_0=(6, 3), cell_5_block_1=(6, 5), cell_5_block_2=(4, 5), cell_5_block_3=(4, 5)"
 }])
 def test_hardware(case):
+    import copy
     from collections import namedtuple
 
     from aw_nas.objective.hardware import HardwareObjective
@@ -143,9 +144,151 @@ def test_hardware(case):
         except ImportError as e:
             pytest.xfail("Do not install scikit-learn, this should fail")
     obj = HardwareObjective(search_space=ss, hardware_perfmodel_type=case['hardware_perfmodel_type'], hardware_perfmodel_cfg=case["hardware_perfmodel_cfg"], perf_names=case['perf_names'])
-    obj.hardware_perfmodels[0].train(case["prof_nets"])
+    obj.hardware_perfmodels[0].train(copy.deepcopy(case["prof_nets"]))
     rollout = ss.rollout_from_genotype(case["genotypes"])
     C = namedtuple("cand_net", ["rollout"])
     cand_net = C(rollout)
     perfs = obj.get_perfs(None, None, None, cand_net)
     assert 0 < perfs[0] < sum(latency)
+
+    # perfs are memoized per rollout, and invalidated when the perf model is retrained
+    perfmodel = obj.hardware_perfmodels[0]
+    num_predicts = [0]
+    ori_predict = perfmodel.predict
+    def _predict(rollout):
+        num_predicts[0] += 1
+        return ori_predict(rollout)
+    perfmodel.predict = _predict
+    assert obj.get_perfs(None, None, None, C(ss.rollout_from_genotype(case["genotypes"]))) \
+        == perfs
+    assert num_predicts[0] == 0
+    perfmodel.train(case["prof_nets"])
+    assert obj.get_perfs(None, None, None, cand_net) == perfs
+    assert num_predicts[0] == 1
+
+
+def _reference_post_processing(probs, boxes, num_classes, pre_nms_top_k=None,
+                               max_detections_per_image=None):
+    # per-image, per-class NMS
+    from torchvision.ops import nms
+
+    dets = [[] for _ in range(num_classes)]
+    for cls_idx in range(num_classes):
+        scores = probs[:, cls_idx + 1]
+        mask = scores > 0.01
+        cls_scores, cls_boxes = scores[mask], boxes[mask]
+        order = torch.argsort(cls_scores, descending=True)[:pre_nms_top_k]
+        cls_scores, cls_boxes = cls_scores[order], cls_boxes[order]
+        keep = nms(cls_boxes, cls_scores, 0.5)
+        dets[cls_idx] = torch.cat((cls_boxes[keep], cls_scores[keep].unsqueeze(1)), 1)
+    if max_detections_per_image is not None:
+        all_scores = torch.cat([det[:, 4] for det in dets])
+        if all_scores.numel() > max_detections_per_image:
+            min_score = torch.topk(all_scores, max_detections_per_image)[0][-1]
+            dets = [det[det[:, 4] >= min_score] for det in dets]
+    return dets
+
+
+def test_ssd_post_processing():
+    from aw_nas.objective.detection_utils import SSDPostProcessing
+    from aw_nas.utils import box_utils
+
+    num_anchors, num_classes, batch_size = 500, 5, 3
+    anchors = torch.cat([torch.rand(num_anchors, 2),
+                         torch.rand(num_anchors, 2) * 0.3 + 0.05], 1)
+    post_processing = SSDPostProcessing(num_classes, anchors=lambda feature_maps, device: anchors)
+    confidences = torch.randn(batch_size, num_anchors, num_classes + 1) * 2
+    locations = torch.randn(batch_size, num_anchors, 4) * 0.5
+    probs = torch.softmax(confidences, dim=-1)
+
+    for pre_nms_top_k, max_dets in [(None, None), (20, None), (None, 30), (20, 30)]:
+        post_processing.pre_nms_top_k = pre_nms_top_k
+        post_processing.max_detections_per_image = max_dets
+        output = post_processing([torch.zeros(1, 1, 4, 4)], confidences, locations)
+        for i in range(batch_size):
+            boxes = box_utils.decode(locations[i], anchors, (0.1, 0.2))
+            expected = _reference_post_processing(probs[i], boxes, num_classes,
+                                                  pre_nms_top_k, max_dets)
+            if max_dets is not None:
+                assert sum(det.size(0) for det in output[i]) == max_dets
+            # the detections of the `cls_idx`-th list are labeled as `cls_idx`
+            for det, expected_det in zip(output[i], expected):
+                assert det.reshape(-1, 5).shape == expected_det.shape
+                assert torch.allclose(det.reshape(-1, 5), expected_det, atol=1e-6)
+
+
+def test_iou_matcher_batch():
+    from aw_nas.objective.detection_utils import IOUMatcher
+
+    num_anchors = 300
+    anchors = torch.cat([torch.rand(num_anchors, 2),
+                         torch.rand(num_anchors, 2) * 0.3 + 0.05], 1)
+    matcher = IOUMatcher(0.5, 0.4, variance=(0.1, 0.2))
+    boxes_list, labels_list = [], []
+    for num_obj in [3, 0, 7, 1, 4]:
+        xy = torch.rand(num_obj, 2) * 0.7
+        boxes = torch.cat([xy, xy + torch.rand(num_obj, 2) * 0.3 + 0.01], 1)
+        boxes_list.append(boxes)
+        labels_list.append(torch.randint(1, 10, (num_obj,)))
+    # a degenerate box and two gts that share the same best prior
+    boxes_list[2][1, 2] = boxes_list[2][1, 0]
+    boxes_list[3] = torch.cat([boxes_list[3], boxes_list[3] + 1e-3])
+    labels_list[3] = torch.tensor([3, 4])
+    # a negative sized box, which is kept when there are no zero sized boxes
+    boxes_list[4][2, [0, 2]] = boxes_list[4][2, [2, 0]]
+
+    conf_t, loc_t = matcher.match_batch(boxes_list, labels_list, anchors)
+    assert conf_t.shape == (5, num_anchors) and loc_t.shape == (5, num_anchors, 4)
+    for i, (boxes, labels) in enumerate(zip(boxes_list, labels_list)):
+        conf, loc = matcher(boxes, labels, anchors)
+        assert (conf_t[i] == conf).all()
+        positive = conf > 0
+        # the encoded offsets of the negative sized box are nan in both paths
+        assert torch.allclose(loc_t[i][positive], loc[positive], atol=1e-5, equal_nan=True)
+    assert (conf_t[1] == 0).all()
+
+
+def test_voc_eval():
+    import numpy as np
+    from aw_nas.objective.detection_utils import VOCMetrics
+
+    metrics = VOCMetrics()
+    metrics.target_to_gt_recs([
+        {"image_id": 0, "ori_boxes": torch.tensor([[0., 0., 10., 10.], [20., 20., 30., 30.]]),
+         "labels": [1, 1], "is_difficult": [False, True]},
+        {"image_id": 1, "ori_boxes": torch.tensor([[0., 0., 10., 10.]]),
+         "labels": [1], "is_difficult": [False]},
+    ])
+    det_recs = [{
+        0: np.array([[0., 0., 10., 10., 0.9],  # tp
+                     [0., 0., 10., 9., 0.8],  # duplicated, fp
+                     [20., 20., 30., 30., 0.7],  # difficult, ignored
+                     [50., 50., 60., 60., 0.6]]),  # fp
+        1: np.array([[0., 0., 10., 10., 0.5]]),  # tp
+    }] + [{} for _ in range(19)]
+    rec, prec, ap = metrics.voc_eval(det_recs, metrics.gt_recs, 0, use_07_metric=False)
+    assert np.allclose(rec, [0.5, 0.5, 0.5, 0.5, 1.])
+    assert np.allclose(prec, [1., 0.5, 0.5, 1. / 3, 0.5])
+    assert abs(ap - 0.75) < 1e-6
+    assert metrics.voc_eval(det_recs, metrics.gt_recs, 1)[2] == -1.
+
+
+def test_ssd_anchors_generator():
+    from aw_nas.objective.detection_utils import SSDAnchorsGenerator
+
+    generator = SSDAnchorsGenerator(cache_size=2)
+    feature_maps = [(19, 19), (10, 10), (5, 5), (3, 3), (2, 2), (1, 1)]
+    anchors = generator(feature_maps)
+    # 4 or 6 anchors per location
+    assert anchors.shape == (19 * 19 * 4 + (100 + 25 + 9) * 6 + 4 * 4 + 1 * 4, 4)
+    assert (anchors >= 0).all() and (anchors <= 1).all()
+    # the first location of the first feature map
+    step = 1. / 19
+    assert torch.allclose(anchors[0], torch.tensor([step / 2, step / 2, 0.15, 0.15]))
+    assert torch.allclose(anchors[2, 2:], torch.tensor([0.15 * 2 ** 0.5, 0.15 / 2 ** 0.5]))
+
+    assert generator([torch.Size(fm) for fm in feature_maps], "cpu") is \
+        generator(feature_maps, torch.device("cpu"))
+    generator([(3, 3)])
+    generator([(4, 4)])
+    assert len(generator.anchors_boxes) == 2
@@ -160,3 +160,180 @@ def test_derive_and_parse_derive():
     assert len(dct) == 4 # only 4 rollouts have performance information
     print(dct)
 
+
+def test_prepare_data_queues_cache_eval_tensors():
+    import torch
+
+    from aw_nas.dataset.base import BaseDataset
+    from aw_nas.utils.torch_utils import prepare_data_queues, TensorBatchQueue
+
+    class _FakeDataset(BaseDataset):
+        NAME = "a_fake_tensor_dataset"
+
+        def __init__(self):
+            super(_FakeDataset, self).__init__()
+            self.datasets = {
+                "train": torch.utils.data.TensorDataset(
+                    torch.randn(20, 3, 4, 4), torch.arange(20)),
+                "test": torch.utils.data.TensorDataset(
+                    torch.randn(10, 3, 4, 4), torch.arange(10))
+            }
+
+        def splits(self):
+            return self.datasets
+
+        def deterministic_splits(self):
+            return ["test"]
+
+        @classmethod
+        def data_type(cls):
+            return "image"
+
+    dataset = _FakeDataset()
+    queue_cfgs = [{"split": "train", "portion": 1., "batch_size": 4},
+                  {"split": "test", "portion": 0.5, "batch_size": 2,
+                   "kwargs": {"shuffle": False}},
+                  {"split": "test", "portion": [0.5, 1.], "batch_size": 3}]
+    train_queue, test_queue, shuffled_queue = prepare_data_queues(
+        dataset, queue_cfgs, num_workers=0, cache_eval_tensors=True)
+    assert not isinstance(train_queue.iterable, TensorBatchQueue)
+    assert isinstance(test_queue.iterable, TensorBatchQueue)
+    assert len(test_queue) == 3 and len(shuffled_queue) == 2
+    data, target = next(test_queue)
+    assert torch.equal(target, torch.tensor([0, 1]))
+    assert torch.equal(data, dataset.datasets["test"].tensors[0][:2])
+    targets = torch.cat([next(shuffled_queue)[1] for _ in range(2)])
+    assert sorted(targets.tolist()) == [5, 6, 7, 8, 9]
+
+def test_batch_augmentation():
+    import numpy as np
+    import torch
+    from torchvision import transforms
+    from PIL import Image
+
+    from aw_nas.utils.torch_utils import BatchAugmentation, TensorBatchQueue
+
+    mean, std = [0.4, 0.5, 0.6], [0.2, 0.25, 0.3]
+    images = torch.randint(0, 256, (16, 3, 8, 8), dtype=torch.uint8)
+
+    # deterministic: the same as `ToTensor` + `Normalize`
+    per_sample = transforms.Compose([transforms.ToTensor(), transforms.Normalize(mean, std)])
+    expected = torch.stack([per_sample(Image.fromarray(img.permute(1, 2, 0).numpy()))
+                            for img in images])
+    assert torch.allclose(BatchAugmentation(mean, std)(images), expected, atol=1e-5)
+
+    # every augmented image is one of the padded crops (maybe flipped)
+    aug = BatchAugmentation([0.] * 3, [1.] * 3, padding=2, flip=True)
+    out = (aug(images) * 255.).round().to(torch.uint8)
+    padded = torch.nn.functional.pad(images, [2] * 4)
+    for img, padded_img in zip(out, padded):
+        candidates = [padded_img[:, i:i + 8, j:j + 8] for i in range(5) for j in range(5)]
+        candidates += [cand.flip(-1) for cand in candidates]
+        assert any(torch.equal(img, cand) for cand in candidates)
+
+    # cutout zeroes out at most a (length, length) square
+    out = BatchAugmentation([0.5] * 3, [1.] * 3, cutout=4)(
+        torch.full((64, 3, 8, 8), 255, dtype=torch.uint8))
+    num_zeros = (out[:, 0] == 0).sum(dim=(1, 2))
+    assert (num_zeros <= 16).all() and (num_zeros > 0).all()
+    assert (out[:, 0] == 0).float().mean() > 0.1
+
+    queue = TensorBatchQueue(images, torch.arange(16), batch_size=5, shuffle=True,
+                             indices=np.arange(4, 14), transform=BatchAugmentation(mean, std))
+    batches = list(queue)
+    assert len(queue) == 2 and batches[0][0].dtype == torch.float32
+    assert sorted(torch.cat([target for _, target in batches]).tolist()) == list(range(4, 14))
+
+def test_inf_iterator_prefetch():
+    import torch
+
+    from aw_nas.utils.torch_utils import get_inf_iterator
+
+    epochs = []
+    dataset = torch.utils.data.TensorDataset(torch.arange(10))
+    loader = torch.utils.data.DataLoader(dataset, batch_size=4, num_workers=1,
+                                         persistent_workers=True)
+    queue = get_inf_iterator(loader, lambda: epochs.append(len(epochs)))
+    batches = [next(queue)[0].tolist() for _ in range(3)]
+    assert sum(batches, []) == list(range(10))
+    # the next epoch is already prefetched, the callback is not called until it is used
+    worker_iter = loader._iterator
+    assert epochs == []
+    assert next(queue)[0].tolist() == [0, 1, 2, 3]
+    assert epochs == [0]
+    [next(queue) for _ in range(3)]
+    assert epochs == [0, 1]
+    assert loader._iterator is worker_iter
+
+    # iterables without length fall back to `StopIteration`
+    class _Reiterable(object):
+        def __iter__(self):
+            return iter(range(3))
+
+    queue = get_inf_iterator(_Reiterable(), lambda: epochs.append(len(epochs)))
+    assert [next(queue) for _ in range(7)] == [0, 1, 2, 0, 1, 2, 0]
+    assert epochs == [0, 1, 2, 3]
+
+def test_bptt_batch_queue():
+    import numpy as np
+    import torch
+
+    from aw_nas.utils.torch_utils import BPTTBatchQueue, batchify_sentences
+
+    sentences = [torch.randint(0, 100, (np.random.randint(1, 20),)) for _ in range(50)]
+    inputs, targets = batchify_sentences(sentences, 4, device="cpu")
+    queue = BPTTBatchQueue(sentences, 4, bptt_steps=7)
+    assert torch.equal(queue.data, inputs) and torch.equal(queue.targets, targets)
+    assert queue.data.data_ptr() == queue.tokens.data_ptr() # a view
+    windows = list(queue)
+    assert len(windows) == len(queue) == int(np.ceil(len(inputs) / 7.))
+    assert torch.equal(torch.cat([inp for inp, _ in windows]), inputs)
+    assert torch.equal(torch.cat([targ for _, targ in windows]), targets)
+    emb = torch.nn.Embedding(100, 3)
+    assert torch.equal(emb(windows[1][0]), emb(inputs[7:14]))
+
+    queue = BPTTBatchQueue(torch.cat(sentences), 4, bptt_steps=7, random_bptt=True)
+    seq_lens = queue.sample_seq_lens()
+    assert sum(seq_lens) == len(inputs) and all(seq_len > 0 for seq_len in seq_lens[:-1])
+    assert sum(len(inp) for inp, _ in queue) == len(inputs)
+
+def test_bptt_batch_queue_random_epoch():
+    import torch
+
+    from aw_nas.utils.torch_utils import BPTTBatchQueue, InfIterator
+
+    queue = BPTTBatchQueue(torch.arange(4000), 4, bptt_steps=35, random_bptt=True)
+    epochs = []
+    inf_queue = InfIterator(queue, [lambda: epochs.append(0)])
+    for i_epoch in range(3):
+        seq_lens = [len(next(inf_queue)[0])]
+        seq_lens += [len(next(inf_queue)[0]) for _ in range(len(inf_queue) - 1)]
+        # the callbacks are only called at the epoch boundary
+        assert len(epochs) == i_epoch
+        assert sum(seq_lens) == queue.num_steps
+
+    queue.drop_last = True
+    seq_lens = [len(inp) for inp, _ in queue]
+    assert len(seq_lens) == len(queue)
+    assert sum(seq_lens) <= queue.num_steps and min(seq_lens) >= 5
+
+def test_split_indices_file(tmp_path):
+    import numpy as np
+    import yaml
+
+    from aw_nas.utils.torch_utils import load_split_indices, save_split_indices
+
+    dset_indices = {"train": np.random.permutation(100), "test": np.arange(10)}
+    fname = str(tmp_path / "indices.yaml")
+    save_split_indices(fname, dset_indices)
+    loaded = load_split_indices(fname)
+    assert sorted(loaded) == ["test", "train"]
+    assert all(np.array_equal(loaded[n], dset_indices[n]) for n in dset_indices)
+
+    # legacy YAML files
+    legacy_fname = str(tmp_path / "legacy.yaml")
+    with open(legacy_fname, "w") as w_f:
+        yaml.dump({n: indices.tolist() for n, indices in dset_indices.items()}, w_f)
+    loaded = load_split_indices(legacy_fname)
+    assert loaded["train"].dtype == np.int64
+    assert all(np.array_equal(loaded[n], dset_indices[n]) for n in dset_indices)
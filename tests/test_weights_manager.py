@@ -1,4 +1,5 @@
 import os
+import copy
 
 import six
 import yaml
@@ -657,3 +658,76 @@ def test_ofa_forward_rollout(ofa_super_net):
     logits = cand_net.forward(data[0])
     assert logits.shape[-1] == 10
 
+@pytest.mark.parametrize("backbone_type", ["mbv2_backbone", "mbv3_backbone"])
+def test_ofa_finalize(backbone_type):
+    from aw_nas.common import get_search_space
+    from aw_nas.weights_manager.ofa_backbone import BaseBackboneArch
+
+    search_space = get_search_space(cls="ofa", width_choice=[4, 5, 6], depth_choice=[2, 3, 4])
+    backbone = BaseBackboneArch.get_class_(backbone_type)("cpu")
+    rollout = search_space.random_sample()
+    finalized = backbone.finalize(rollout.depth, rollout.width, rollout.kernel)
+    assert [len(cell) for cell in finalized.cells] == \
+        [min(depth, len(cell)) for depth, cell in zip(rollout.depth, backbone.cells)]
+    # the finalized model is standalone
+    supernet_tensors = set(id(t) for t in backbone.parameters())
+    assert not any(id(t) in supernet_tensors for t in finalized.parameters())
+    backbone.eval()
+    finalized.eval()
+    data = torch.rand(2, 3, 32, 32)
+    assert torch.allclose(finalized(data), backbone.forward_rollout(data, rollout), atol=1e-5)
+
+def test_flexible_channel_order_cache():
+    from aw_nas.ops import FlexiblePointLinear
+    from aw_nas.utils.common_utils import _get_channel_mask
+
+    layer = FlexiblePointLinear(16, 8)
+    mask = layer.get_channel_mask(4)
+    assert (mask == _get_channel_mask(layer.weight.data, 4)).all()
+    assert layer.get_channel_mask(4) is mask
+    assert (layer.get_channel_mask(8) == _get_channel_mask(layer.weight.data, 8)).all()
+    # the cached order is invalidated after the weight is updated
+    with torch.no_grad():
+        layer.weight.mul_(torch.rand_like(layer.weight))
+    assert (layer.get_channel_mask(4) == _get_channel_mask(layer.weight.data, 4)).all()
+
+
+@pytest.mark.parametrize("population", [
+    {
+        "search_space_cfg": {"num_layers": 5, "num_steps": 2,
+                             "shared_primitives": ["none", "sep_conv_3x3", "sep_conv_5x5"]}
+    }
+], indirect=["population"])
+def test_morphism_parent_cache(population, tmp_path):
+    from aw_nas.rollout.mutation import MutationRollout, ModelRecord
+    from aw_nas.main import _init_component
+    from aw_nas.weights_manager import MorphismWeightsManager
+
+    cfg = yaml.safe_load(SAMPLE_MODEL_CFG)
+    device = "cpu"
+    search_space = population.search_space
+    w_manager = MorphismWeightsManager(search_space, device, "mutation", parent_cache_size=1)
+    parent_indexes = []
+    for i_parent in range(2):
+        rollout = search_space.random_sample()
+        cfg["final_model_cfg"]["genotypes"] = str(rollout.genotype)
+        cnn_model = _init_component(cfg, "final_model", search_space=search_space,
+                                    device=device)
+        ckpt_path = os.path.join(tmp_path, "parent_{}".format(i_parent))
+        torch.save(cnn_model.state_dict(), ckpt_path)
+        parent_indexes.append(population.add_model(ModelRecord(
+            rollout.genotype, copy.deepcopy(cfg), search_space,
+            checkpoint_path=ckpt_path, finished=True)))
+
+    for _ in range(2):
+        for parent_index in parent_indexes:
+            parent_state_dict = torch.load(population.get_model(parent_index).checkpoint_path)
+            rollout = MutationRollout.random_sample(population, parent_index, num_mutations=1)
+            cand_net = w_manager.assemble_candidate(rollout)
+            assert len(w_manager._parent_cache) == 1
+            for n, v in cand_net.named_parameters():
+                if n in parent_state_dict:
+                    assert (parent_state_dict[n] == v.data).all()
+
+    w_manager.clear_parent_cache()
+    assert not w_manager._parent_cache